@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+"""
+logs/ 以下の全セッションの横断分析（NumPy の列指向配列）
+
+会話ログ（chat_*.jsonl）・メトリクス（metrics_*.jsonl）・チェックポイント（checkpoint_*.json）・
+再評価の結果（evaluations/<プロンプトハッシュ>/）を読み込み、セッション・発言・モデル呼び出しごとの
+列（NumPy 配列）にまとめて、ペルソナ・シナリオ・モデルなどのグループ別に分布を集計する。
+
+- ターン数・会話時間・最初の発言までの時間・1ターンあたりのレイテンシ（p50/p95/p99）
+- 終了理由の内訳（完了していないセッションはチェックポイントの状態 running / failed）
+- 評価項目ごとのスコアの平均（再評価の結果があれば最新のもの、なければ会話ログ内の評価）
+- モデル呼び出しのレイテンシ・エラー数（呼び出したモデルとロール別）
+
+読み込んだ列は <logs>/.analytics/ に .npy で保存し、次回からはメモリマップ（mmap_mode="r"）で開く。
+ファイルの更新時刻とサイズが変わったセッションだけを読み直すため、10万セッションでも2回目以降は数秒で集計できる。
+会話時間のタイムスタンプは1件ずつ解析せず、まとめて datetime64 に変換する。
+
+使い方:
+    python analytics.py [logs] [--group-by persona,scenario,model] [--rebuild] [--json 出力先.json]
+"""
+
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+
+from transcript import TranscriptEntry, TranscriptStats
+from transcript_log import iter_transcript
+from checkpoint import load_checkpoint
+from results_store import parse_scores, EVALUATIONS_DIRNAME
+from config import PERCENTILES
+
+CACHE_DIRNAME = ".analytics"
+CACHE_VERSION = 1
+UNKNOWN = "unknown"
+
+# セッションの文字列の列（語彙のインデックスで保存する）
+CATEGORY_COLUMNS = ("scenario", "persona", "provider", "customer_model", "staff_model", "termination_reason")
+# --group-by の名前と列
+GROUP_COLUMNS = {
+    "persona": "persona",
+    "scenario": "scenario",
+    "model": "staff_model",
+    "customer_model": "customer_model",
+    "provider": "provider",
+    "termination": "termination_reason",
+}
+NUMERIC_COLUMNS = {
+    "turns": np.int32,
+    "duration_seconds": np.float64,
+    "time_to_first_turn_seconds": np.float64,
+    "prompt_tokens": np.int64,
+    "completion_tokens": np.int64,
+}
+# 可変長の列（セッションごとの発言・モデル呼び出し）は値の配列とオフセット（長さ N+1）で持つ
+RAGGED_COLUMNS = {
+    "turn": {"latency": np.float32},
+    "call": {"role": np.int32, "model": np.int32, "latency": np.float32, "error": np.bool_},
+}
+# 呼び出しのロール・モデルの語彙（manifest の vocab のキー）
+CALL_VOCABS = {"role": "call_role", "model": "call_model"}
+
+
+def _to_datetime64(values: list) -> np.ndarray:
+    """ISO 形式の文字列（None は NaT）をまとめて datetime64[us] に変換する"""
+    try:
+        return np.array(["NaT" if v is None else v for v in values], dtype="datetime64[us]")
+    except ValueError:
+        # タイムゾーン付きなど numpy が解析できない形式が混ざっている場合のみ1件ずつ変換する
+        def convert(value):
+            try:
+                return np.datetime64(datetime.fromisoformat(value).replace(tzinfo=None), "us")
+            except (TypeError, ValueError):
+                return np.datetime64("NaT")
+        return np.array([convert(v) for v in values], dtype="datetime64[us]")
+
+
+def _offsets(lengths) -> np.ndarray:
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+def _ragged_index(offsets: np.ndarray, index: np.ndarray) -> tuple:
+    """可変長の列から index のセッション分を取り出すための (値のインデックス, 新しいオフセット)"""
+    lengths = offsets[index + 1] - offsets[index]
+    new_offsets = _offsets(lengths)
+    gather = np.repeat(offsets[index] - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return gather, new_offsets
+
+
+class _Vocab:
+    """文字列 → インデックス（既存の語彙の後ろに追加するため、保存済みのインデックスはそのまま使える）"""
+
+    def __init__(self, words=()):
+        self.words = list(words)
+        self.index = {word: i for i, word in enumerate(self.words)}
+
+    def code(self, word) -> int:
+        word = UNKNOWN if word is None else str(word)
+        code = self.index.get(word)
+        if code is None:
+            code = self.index[word] = len(self.words)
+            self.words.append(word)
+        return code
+
+
+def _scan(logs_dir: str) -> tuple:
+    """logs_dir 以下を1回だけ走査する（10万セッションでは Path の生成と比較だけで数十秒かかるため文字列で扱う）
+
+    戻り値: (会話ログ {相対パス（拡張子なし）: os.DirEntry}, 関連ファイルの更新時刻 {相対パス: mtime},
+    評価結果の保存先 [(ログディレクトリからの相対パス, evaluations ディレクトリ)])
+    相対パスの区切りは "/"（OS によらずキャッシュのキーとして使う）。
+    """
+    transcripts, mtimes, evaluation_dirs = {}, {}, []
+    stack = [("", logs_dir)]
+    while stack:
+        rel_dir, directory = stack.pop()
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if entry.is_dir():
+                    # 再評価の結果（evaluations/ 以下の *.json）と分析のキャッシュは会話ログではないため辿らない
+                    if name == EVALUATIONS_DIRNAME:
+                        evaluation_dirs.append((rel_dir, entry.path))
+                    elif name != CACHE_DIRNAME:
+                        stack.append((f"{rel_dir}{name}/", entry.path))
+                elif name.startswith("chat_"):
+                    # 同名の .jsonl と .json がある場合は .jsonl を優先する（transcript_log.find_transcripts と同じ）
+                    stem, _, suffix = name.rpartition(".")
+                    key = rel_dir + stem
+                    if suffix == "jsonl" or (suffix == "json" and key not in transcripts):
+                        transcripts[key] = entry
+                elif name.startswith(("metrics_", "checkpoint_")):
+                    mtimes[rel_dir + name] = entry.stat().st_mtime_ns
+    return transcripts, mtimes, evaluation_dirs
+
+
+class _EvaluationIndex:
+    """offline_eval の評価結果ファイルの索引（会話ログごとに最新のファイルを返す）"""
+
+    def __init__(self, evaluation_dirs: list):
+        self.files = {}
+        # ログディレクトリに近い保存先を優先する
+        self.roots = sorted({root for root, _ in evaluation_dirs}, key=len)
+        for root, evaluations_dir in evaluation_dirs:
+            for entry in os.scandir(evaluations_dir):
+                if not entry.is_dir():
+                    continue
+                for result in os.scandir(entry.path):
+                    if not result.name.endswith(".json") or not result.is_file():
+                        continue
+                    key = (root, result.name)
+                    mtime = result.stat().st_mtime_ns
+                    if key not in self.files or self.files[key][0] < mtime:
+                        self.files[key] = (mtime, result.path)
+
+    def find(self, key: str):
+        """key（会話ログの相対パス、拡張子なし）の (更新時刻, パス) または None"""
+        for root in self.roots:
+            if key.startswith(root):
+                # offline_eval._result_path と同じ名前（保存先からの相対パスの区切りを "__" にしたもの）
+                found = self.files.get((root, key[len(root):].replace("/", "__") + ".json"))
+                if found:
+                    return found
+        return None
+
+
+def _parse_session(transcript: str, checkpoint_file, metrics_file, evaluation_file) -> dict:
+    """1セッション分の会話ログ・チェックポイント・メトリクス・評価結果を読み込む（ないファイルは None）"""
+    stats = TranscriptStats()
+    scenario = None
+    evaluation = None
+    latencies = []
+    for raw in iter_transcript(transcript):
+        entry = TranscriptEntry.from_dict(raw)
+        stats.add(entry)
+        if entry.speaker == "System":
+            if scenario is None:
+                scenario = entry.content.removeprefix("シナリオ: ")
+        elif entry.speaker == "Evaluator":
+            evaluation = entry.content
+        elif entry.latency_seconds is not None:
+            latencies.append(entry.latency_seconds)
+
+    checkpoint = (load_checkpoint(checkpoint_file) if checkpoint_file else None) or {}
+    info = checkpoint.get("session_info") or {}
+    result = checkpoint.get("result") or {}
+    persona_file = info.get("customer_persona_file")
+    row = {
+        "scenario": scenario or checkpoint.get("scenario"),
+        "persona": Path(persona_file).stem if persona_file else None,
+        "provider": info.get("api_provider"),
+        "customer_model": info.get("customer_model"),
+        "staff_model": info.get("staff_model"),
+        "termination_reason": result.get("termination_reason") or checkpoint.get("status"),
+        "turns": stats.messages,
+        "first_timestamp": stats.first_timestamp,
+        "last_timestamp": stats.last_timestamp,
+        "time_to_first_turn_seconds": result.get("time_to_first_turn_seconds"),
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "turn": {"latency": latencies},
+        "call": {"role": [], "model": [], "latency": [], "error": []},
+    }
+
+    if metrics_file:
+        calls = row["call"]
+        for record in iter_transcript(metrics_file):
+            role, model = record.get("role"), record.get("model")
+            calls["role"].append(role)
+            calls["model"].append(model)
+            calls["latency"].append(record.get("latency_seconds"))
+            calls["error"].append(record.get("error") is not None)
+            row["prompt_tokens"] += record.get("prompt_tokens") or 0
+            row["completion_tokens"] += record.get("completion_tokens") or 0
+            # チェックポイントにモデルの記録がない（古い）セッションは呼び出しのモデルで補う
+            if role in ("customer", "staff") and model and not row[f"{role}_model"]:
+                row[f"{role}_model"] = model
+
+    if evaluation_file is not None:
+        try:
+            with open(evaluation_file, 'r', encoding='utf-8') as f:
+                evaluation = json.load(f).get("evaluation") or evaluation
+        except (OSError, json.JSONDecodeError):
+            pass
+    row["scores"] = {name: score for name, (score, _) in parse_scores(evaluation).items()}
+    return row
+
+
+class SessionTable:
+    """セッション・発言・モデル呼び出しの列（NumPy 配列）
+
+    columns: セッションごとの列（長さ N）。文字列の列は vocab のインデックス
+    turn / call: 可変長の列と offsets（長さ N+1）
+    scores: 評価項目ごとのスコア（N x 評価項目数、評価がなければ NaN）
+    """
+
+    def __init__(self, transcripts: list, signatures: list, vocab: dict, criteria: list,
+                 columns: dict, scores: np.ndarray, ragged: dict):
+        self.transcripts = transcripts
+        self.signatures = signatures
+        self.vocab = vocab
+        self.criteria = criteria
+        self.columns = columns
+        self.scores = scores
+        self.ragged = ragged
+
+    def __len__(self):
+        return len(self.transcripts)
+
+    # --- 保存と読み込み ---
+
+    def save(self, cache_dir: Path):
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        arrays = {**self.columns, "scores": self.scores}
+        for kind, fields in self.ragged.items():
+            arrays[f"{kind}_offsets"] = fields["offsets"]
+            arrays.update({f"{kind}_{name}": fields[name] for name in RAGGED_COLUMNS[kind]})
+        for name, array in arrays.items():
+            tmp_path = cache_dir / f"{name}.tmp.npy"
+            np.save(tmp_path, np.ascontiguousarray(array))
+            tmp_path.replace(cache_dir / f"{name}.npy")
+        manifest = {
+            "version": CACHE_VERSION,
+            "built_at": datetime.now().isoformat(),
+            "transcripts": self.transcripts,
+            "signatures": self.signatures,
+            "vocab": self.vocab,
+            "criteria": self.criteria,
+        }
+        # manifest は配列の後に書き換える（途中で中断しても古い manifest と新しい配列の組み合わせにならないよう件数を検証する）
+        tmp_path = cache_dir / "manifest.json.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        tmp_path.replace(cache_dir / "manifest.json")
+
+    @classmethod
+    def load(cls, cache_dir: Path):
+        """保存済みの列をメモリマップで開く（ない・壊れている場合は None）"""
+        try:
+            with open(cache_dir / "manifest.json", 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("version") != CACHE_VERSION:
+                return None
+
+            def array(name):
+                return np.load(cache_dir / f"{name}.npy", mmap_mode="r")
+
+            columns = {name: array(name) for name in (*CATEGORY_COLUMNS, *NUMERIC_COLUMNS)}
+            ragged = {}
+            for kind, fields in RAGGED_COLUMNS.items():
+                ragged[kind] = {"offsets": array(f"{kind}_offsets")}
+                ragged[kind].update({name: array(f"{kind}_{name}") for name in fields})
+            table = cls(manifest["transcripts"], manifest["signatures"], manifest["vocab"], manifest["criteria"],
+                        columns, array("scores"), ragged)
+        except (OSError, ValueError, KeyError):
+            return None
+        n = len(table)
+        if any(len(c) != n for c in columns.values()) or any(len(r["offsets"]) != n + 1 for r in ragged.values()):
+            return None
+        return table
+
+    # --- 集計 ---
+
+    def summarize(self, group_by: str) -> list:
+        """group_by のグループごとの分布（グループはセッション数の多い順）"""
+        column = GROUP_COLUMNS[group_by]
+        groups = np.asarray(self.columns[column])
+        n_groups = len(self.vocab[column])
+        counts = np.bincount(groups, minlength=n_groups)
+
+        turn_offsets = np.asarray(self.ragged["turn"]["offsets"])
+        turn_groups = np.repeat(groups, np.diff(turn_offsets))
+        turn_latency = np.asarray(self.ragged["turn"]["latency"], dtype=np.float64)
+
+        distributions = {
+            "turns": _grouped_stats(groups, np.asarray(self.columns["turns"], dtype=np.float64), n_groups),
+            "duration_seconds": _grouped_stats(groups, np.asarray(self.columns["duration_seconds"]), n_groups),
+            "time_to_first_turn_seconds": _grouped_stats(
+                groups, np.asarray(self.columns["time_to_first_turn_seconds"]), n_groups),
+            "turn_latency_seconds": _grouped_stats(turn_groups, turn_latency, n_groups),
+        }
+
+        reasons = np.asarray(self.columns["termination_reason"])
+        reason_labels = self.vocab["termination_reason"]
+        termination = np.bincount(groups * len(reason_labels) + reasons,
+                                  minlength=n_groups * len(reason_labels)).reshape(n_groups, len(reason_labels))
+
+        scores = np.asarray(self.scores, dtype=np.float64)
+        score_means = {}
+        for c, criterion in enumerate(self.criteria):
+            scored = ~np.isnan(scores[:, c])
+            n = np.bincount(groups[scored], minlength=n_groups)
+            total = np.bincount(groups[scored], weights=scores[scored, c], minlength=n_groups)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                score_means[criterion] = (total / n, n)
+
+        labels = self.vocab[column]
+        rows = []
+        for g in np.argsort(-counts, kind="stable"):
+            if not counts[g]:
+                continue
+            row = {group_by: labels[g], "sessions": int(counts[g])}
+            for name, stats in distributions.items():
+                row[name] = {key: _round(values[g]) for key, values in stats.items()}
+            row["termination_reasons"] = {reason_labels[r]: int(termination[g, r]) for r in np.flatnonzero(termination[g])}
+            row["scores"] = {criterion: _round(means[g]) for criterion, (means, n) in score_means.items() if n[g]}
+            rows.append(row)
+        return rows
+
+    def summarize_calls(self) -> list:
+        """モデル呼び出しのモデル・ロール別のレイテンシとエラー数"""
+        calls = self.ragged["call"]
+        roles = np.asarray(calls["role"])
+        models = np.asarray(calls["model"])
+        role_labels = self.vocab["call_role"]
+        model_labels = self.vocab["call_model"]
+        keys = models * max(1, len(role_labels)) + roles
+        n_keys = len(model_labels) * max(1, len(role_labels))
+        counts = np.bincount(keys, minlength=n_keys)
+        errors = np.bincount(keys, weights=np.asarray(calls["error"], dtype=np.float64), minlength=n_keys)
+        # レイテンシの分布は成功した呼び出しのみ（metrics.MetricsRecorder.summary と同じ）
+        latency = np.where(np.asarray(calls["error"]), np.nan, np.asarray(calls["latency"], dtype=np.float64))
+        stats = _grouped_stats(keys, latency, n_keys)
+        rows = []
+        for key in np.argsort(-counts, kind="stable"):
+            if not counts[key]:
+                continue
+            model, role = divmod(int(key), max(1, len(role_labels)))
+            rows.append({
+                "model": model_labels[model],
+                "role": role_labels[role],
+                "calls": int(counts[key]),
+                "errors": int(errors[key]),
+                "latency_seconds": {name: _round(values[key]) for name, values in stats.items()},
+            })
+        return rows
+
+
+def _round(value, digits: int = 3):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def _grouped_stats(groups: np.ndarray, values: np.ndarray, n_groups: int) -> dict:
+    """グループごとの平均とパーセンタイル（最近傍順位法、NaN は除く）を配列で返す"""
+    valid = ~np.isnan(values)
+    groups, values = groups[valid], values[valid]
+    counts = np.bincount(groups, minlength=n_groups)
+    has = counts > 0
+    mean = np.full(n_groups, np.nan)
+    mean[has] = np.bincount(groups, weights=values, minlength=n_groups)[has] / counts[has]
+    stats = {"mean": mean}
+
+    # グループ内で値を昇順に並べ、各グループの先頭からの順位で取り出す
+    values = values[np.lexsort((values, groups))]
+    starts = np.zeros(n_groups, dtype=np.int64)
+    np.cumsum(counts[:-1], out=starts[1:])
+    for pct in PERCENTILES:
+        rank = np.maximum(1, np.ceil(pct / 100 * counts)).astype(np.int64)
+        result = np.full(n_groups, np.nan)
+        result[has] = values[(starts + rank - 1)[has]]
+        stats[f"p{pct}"] = result
+    return stats
+
+
+def _assemble(cached, keep: np.ndarray, rows: list) -> SessionTable:
+    """保存済みの列から keep のセッションを取り出し、新しく読み込んだ rows を後ろに追加する"""
+    vocab = {name: _Vocab(cached.vocab[name] if cached else ())
+             for name in (*CATEGORY_COLUMNS, *CALL_VOCABS.values())}
+    criteria = _Vocab(cached.criteria if cached else ())
+
+    columns = {name: np.array([vocab[name].code(r[name]) for r in rows], dtype=np.int32) for name in CATEGORY_COLUMNS}
+    duration = _to_datetime64([r["last_timestamp"] for r in rows]) - _to_datetime64([r["first_timestamp"] for r in rows])
+    columns["duration_seconds"] = duration / np.timedelta64(1, "s")
+    for name, dtype in NUMERIC_COLUMNS.items():
+        if name != "duration_seconds":
+            columns[name] = np.array([np.nan if r[name] is None else r[name] for r in rows], dtype=dtype)
+
+    score_codes = [{criteria.code(name): score for name, score in r["scores"].items()} for r in rows]
+    scores = np.full((len(rows), len(criteria.words)), np.nan, dtype=np.float32)
+    for i, row_scores in enumerate(score_codes):
+        for c, score in row_scores.items():
+            scores[i, c] = score
+
+    ragged = {}
+    for kind, fields in RAGGED_COLUMNS.items():
+        ragged[kind] = {"offsets": _offsets([len(r[kind]["latency"]) for r in rows])}
+        for name, dtype in fields.items():
+            values = [v for r in rows for v in r[kind][name]]
+            if name in CALL_VOCABS:
+                values = [vocab[CALL_VOCABS[name]].code(v) for v in values]
+            elif dtype == np.float32:
+                values = [np.nan if v is None else v for v in values]
+            ragged[kind][name] = np.array(values, dtype=dtype)
+
+    if cached is not None and len(keep):
+        for name in columns:
+            columns[name] = np.concatenate([np.asarray(cached.columns[name])[keep], columns[name]])
+        old_scores = np.full((len(keep), len(criteria.words)), np.nan, dtype=np.float32)
+        old_scores[:, :len(cached.criteria)] = np.asarray(cached.scores)[keep]
+        scores = np.concatenate([old_scores, scores])
+        for kind, fields in RAGGED_COLUMNS.items():
+            gather, kept_offsets = _ragged_index(np.asarray(cached.ragged[kind]["offsets"]), keep)
+            new_offsets = ragged[kind]["offsets"]
+            ragged[kind]["offsets"] = np.concatenate([kept_offsets, kept_offsets[-1] + new_offsets[1:]])
+            for name in fields:
+                ragged[kind][name] = np.concatenate([np.asarray(cached.ragged[kind][name])[gather], ragged[kind][name]])
+
+    return SessionTable([], [], {name: v.words for name, v in vocab.items()}, criteria.words, columns, scores, ragged)
+
+
+def load_table(logs_dir="logs", rebuild: bool = False) -> SessionTable:
+    """logs_dir 以下の全セッションの列を返す（変更のないセッションは保存済みの列を使う）"""
+    logs_dir = Path(logs_dir)
+    if not logs_dir.is_dir():
+        raise FileNotFoundError(f"ログディレクトリが見つかりません: {logs_dir}")
+
+    entries, mtimes, evaluation_dirs = _scan(str(logs_dir))
+    evaluations = _EvaluationIndex(evaluation_dirs)
+    keys, signatures, files = [], [], []
+    for key in sorted(entries):
+        entry = entries[key]
+        stat = entry.stat()
+        rel_dir, _, stem = key.rpartition("/")
+        tag = stem.removeprefix("chat_")
+        metrics_name = f"{rel_dir}/metrics_{tag}.jsonl" if rel_dir else f"metrics_{tag}.jsonl"
+        checkpoint_name = f"{rel_dir}/checkpoint_{tag}.json" if rel_dir else f"checkpoint_{tag}.json"
+        evaluation = evaluations.find(key)
+        keys.append(key + entry.name[len(stem):])
+        signatures.append([
+            stat.st_mtime_ns, stat.st_size,
+            mtimes.get(metrics_name, 0),
+            mtimes.get(checkpoint_name, 0),
+            evaluation[0] if evaluation else 0,
+        ])
+        files.append((
+            entry.path,
+            checkpoint_name if checkpoint_name in mtimes else None,
+            metrics_name if metrics_name in mtimes else None,
+            evaluation[1] if evaluation else None,
+        ))
+
+    cache_dir = logs_dir / CACHE_DIRNAME
+    cached = None if rebuild else SessionTable.load(cache_dir)
+    if cached is not None and cached.transcripts == keys and cached.signatures == signatures:
+        return cached
+
+    keep, parse = [], []
+    previous = {key: i for i, key in enumerate(cached.transcripts)} if cached is not None else {}
+    for i, key in enumerate(keys):
+        j = previous.get(key)
+        if j is not None and cached.signatures[j] == signatures[i]:
+            keep.append((i, j))
+        else:
+            parse.append(i)
+
+    rows = []
+    for i in parse:
+        transcript, checkpoint_name, metrics_name, evaluation_file = files[i]
+        rows.append(_parse_session(
+            transcript,
+            logs_dir / checkpoint_name if checkpoint_name else None,
+            logs_dir / metrics_name if metrics_name else None,
+            evaluation_file,
+        ))
+    table = _assemble(cached, np.array([j for _, j in keep], dtype=np.int64), rows)
+    order = [i for i, _ in keep] + parse
+    table.transcripts = [keys[i] for i in order]
+    table.signatures = [signatures[i] for i in order]
+    table.save(cache_dir)
+    return table
+
+
+def _format_stats(stats: dict, keys=("p50", "p95")) -> str:
+    return "/".join("-" if stats.get(key) is None else f"{stats[key]:g}" for key in keys)
+
+
+def print_summary(group_by: str, rows: list):
+    print(f"\n📊 {group_by} 別")
+    print("-" * 110)
+    print(f"{group_by[:24]:<24} {'sess':>6} {'turns p50/95':>13} {'dur(s) p50/95':>15} "
+          f"{'lat(s) p50/95/99':>18}  scores / termination")
+    for row in rows:
+        scores = " ".join(f"{name}:{value:g}" for name, value in row["scores"].items())
+        termination = " ".join(f"{reason}:{count}" for reason, count in row["termination_reasons"].items())
+        print(f"{str(row[group_by])[:24]:<24} {row['sessions']:>6} {_format_stats(row['turns']):>13} "
+              f"{_format_stats(row['duration_seconds']):>15} "
+              f"{_format_stats(row['turn_latency_seconds'], ('p50', 'p95', 'p99')):>18}  {scores} | {termination}")
+
+
+def print_calls(rows: list):
+    print("\n🤖 モデル呼び出し（モデル・ロール別）")
+    print("-" * 90)
+    print(f"{'model':<36} {'role':<10} {'calls':>8} {'errors':>7} {'lat(s) p50/95/99':>20}")
+    for row in rows:
+        print(f"{row['model'][:36]:<36} {row['role']:<10} {row['calls']:>8} {row['errors']:>7} "
+              f"{_format_stats(row['latency_seconds'], ('p50', 'p95', 'p99')):>20}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="logs/ 以下の全セッションの横断分析")
+    parser.add_argument("logs_dir", nargs="?", default="logs", help="ログディレクトリ (デフォルト: logs)")
+    parser.add_argument("--group-by", default="persona,scenario,model",
+                        help=f"集計するグループ（カンマ区切り: {', '.join(GROUP_COLUMNS)}）")
+    parser.add_argument("--rebuild", action="store_true", help="保存済みの列を使わずにすべて読み直す")
+    parser.add_argument("--json", metavar="OUTPUT", help="集計結果を JSON で保存する")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    group_by = [name.strip() for name in args.group_by.split(",") if name.strip()]
+    unknown = [name for name in group_by if name not in GROUP_COLUMNS]
+    if unknown:
+        raise SystemExit(f"不明なグループ: {', '.join(unknown)}（{', '.join(GROUP_COLUMNS)} から選んでください）")
+
+    started = time.monotonic()
+    table = load_table(args.logs_dir, rebuild=args.rebuild)
+    loaded = time.monotonic() - started
+    report = {
+        "logs_dir": str(args.logs_dir),
+        "sessions": len(table),
+        "turns": int(np.asarray(table.columns["turns"]).sum()),
+        "groups": {name: table.summarize(name) for name in group_by},
+        "calls": table.summarize_calls(),
+    }
+    elapsed = time.monotonic() - started
+    report.update(load_seconds=round(loaded, 3), elapsed_seconds=round(elapsed, 3))
+
+    print(f"🔍 セッション: {report['sessions']}件 / 発言: {report['turns']}件 "
+          f"(読み込み {report['load_seconds']}秒, 集計を含め {report['elapsed_seconds']}秒)")
+    for name in group_by:
+        print_summary(name, report["groups"][name])
+    print_calls(report["calls"])
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 集計結果: {args.json}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
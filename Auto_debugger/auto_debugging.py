@@ -7,9 +7,13 @@
 - staff_persona.md: 店員/スタッフペルソナの定義（必須）
 - evaluator_prompt.md: 評価エージェント用プロンプト（必須）
 - .env: ANTHROPIC_API_KEY=your_api_key_here または GOOGLE_API_KEY=your_api_key_here
+
+起動を軽くするため、autogen（agent スタック）とプロバイダの SDK はモジュールの import 時には読み込まず、
+モデルクライアントは実際に使うロールの分だけ最初に使う時点で作成する（設定の検証のみなら --check）。
 """
 
 import os
+import sys
 import json
 from pathlib import Path
 from datetime import datetime
@@ -17,19 +21,39 @@ import logging
 from dotenv import load_dotenv
 import asyncio
 import traceback
-
-# AutoGen関連のインポート
-from autogen_core.models import UserMessage, ModelInfo # ModelInfo をインポート
-from autogen_agentchat.agents import AssistantAgent
-from autogen_agentchat.teams import RoundRobinGroupChat
-from autogen_agentchat.conditions import TextMentionTermination
+import time
+import argparse
+from functools import cached_property
+
+# AutoGen関連（agent スタック）とモデルクライアントのラッパーは使う時点で import する
+from transcript_log import TranscriptWriter
+from transcript import EVENT_SPEAKER, ConversationLog, TranscriptEntry, normalize_message
+from log_config import session_log_router, configure_logging, add_log_handler, rotating_file_handler
+from config import RunSettings, read_prompt_file, check_config, STAFF_PERSONA_FILE, EVALUATOR_PROMPT_FILE, CUSTOMER_PERSONA_FILE
+from results_store import ResultsStore, session_row
+from checkpoint import checkpoint_path, save_checkpoint, load_checkpoint, STATUS_RUNNING, STATUS_FAILED, STATUS_COMPLETE
 
 # 環境変数の読み込み
 load_dotenv()
 
+
 class ConversationTestingSystem:
-    def __init__(self):
-        self.setup_logging()
+    def __init__(self, session_id: str = None, log_dir: str = "logs", verbose: bool = True, client_pool=None,
+                 file_tag: str = None, api_provider: str = None, customer_persona_file: str = None,
+                 session_files: bool = True):
+        self.session_id = session_id
+        # False なら会話ログ・システムログ・メトリクスのファイルを作らない（保存済みの会話ログを評価するだけの場合）
+        self.session_files = session_files
+        # ログファイル名のタグ（チェックポイントから再開する場合は元のセッションと同じタグを使う）
+        self.requested_file_tag = file_tag
+        # スイープ実行ではセッションごとにプロバイダと顧客ペルソナを切り替える（未指定なら API_PROVIDER / customer_persona.md）
+        self.requested_api_provider = api_provider
+        self.customer_persona_file = Path(customer_persona_file or CUSTOMER_PERSONA_FILE)
+        self.verbose = verbose
+        # モデルクライアントはプールで共有し、セッション終了時にはクローズしない（プロセス終了時に close_all）
+        # 未指定なら最初のクライアントを作成する時点で client_pool.shared_pool を使う
+        self._client_pool = client_pool
+        self.setup_logging(log_dir)
         self.setup_config() # APIキーのチェックをここで行う
         self.load_all_prompts()
         self.loop = asyncio.get_event_loop() # 既に存在する場合はそれを取得
@@ -37,81 +61,200 @@ class ConversationTestingSystem:
             self.loop = asyncio.new_event_loop()
             asyncio.set_event_loop(self.loop)
 
-    def setup_logging(self):
+    def setup_logging(self, log_dir: str = "logs"):
         """ログ設定の初期化"""
-        log_dir = Path("logs")
-        log_dir.mkdir(exist_ok=True)
-
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.log_filename = log_dir / f"conversation_{timestamp}.log"
-
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', # レベル名追加
-            handlers=[
-                logging.FileHandler(self.log_filename, encoding='utf-8'),
-                logging.StreamHandler()
-            ]
-        )
+        log_dir = Path(log_dir)
+        log_dir.mkdir(parents=True, exist_ok=True)
+
+        # セッションIDが指定された場合はファイル名に使用（バッチ実行時の衝突回避）
+        file_tag = self.requested_file_tag or self.session_id or datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.log_dir = log_dir
+        self.file_tag = file_tag
+        self.log_filename = log_dir / f"conversation_{file_tag}.log"
+
+        # ログの書き込みはバックグラウンドスレッドで行う（log_config）
+        if self.session_id:
+            # バッチ実行: セッション用ファイルのみ登録（レコードは current_session_id で振り分けられる）
+            configure_logging()
+            if self.session_files:
+                session_log_router.register(self.session_id, self.log_filename)
+        else:
+            configure_logging(console=self.verbose)
+            if self.session_files:
+                add_log_handler(rotating_file_handler(self.log_filename))
         self.logger = logging.getLogger("ConversationTest")
 
-        self.conversation_log_file = log_dir / f"chat_{timestamp}.json"
-        self.conversation_log = []
+        # 会話ログは1メッセージ1行の追記型 JSONL（従来の JSON 形式は transcript_log.export_json で再構成可能）
+        self.conversation_log_file = log_dir / f"chat_{file_tag}.jsonl"
+        self.conversation_log = ConversationLog()
+        self.transcript_writer = TranscriptWriter.from_env(self.conversation_log_file) if self.session_files else None
+        self.checkpoint_file = checkpoint_path(log_dir, file_tag)
+
+    def _echo(self, *args):
+        """コンソール表示（verbose=False のバッチ実行時は抑制）"""
+        if self.verbose:
+            print(*args)
 
     def setup_config(self):
-        """API設定の初期化（Anthropic/Gemini対応）"""
-        self.api_provider = os.getenv('API_PROVIDER', 'anthropic').lower()
-        self.customer_model_client = None
-        self.staff_model_client = None
-
-        if self.api_provider == 'gemini':
-            self._setup_gemini()
-        elif self.api_provider == 'anthropic':
-            self._setup_anthropic()
-        else:
-            raise ValueError(f"Unsupported API_PROVIDER: {self.api_provider}. Choose 'anthropic' or 'gemini'.")
+        """API設定の初期化（Anthropic/Gemini対応）
+
+        環境変数の解決と API キーの確認のみ行い、モデルクライアントは各ロールで最初に使う時点で作成する
+        （customer_model_client などの cached_property）。
+        """
+        settings = RunSettings(self.requested_api_provider)
+        self.settings = settings
+        self.api_provider = settings.api_provider
+        self.cache_mode = settings.cache_mode
+        self.loop_detection = settings.loop_detection
+        self.checkpoint_every = settings.checkpoint_every
+        self.model_client_stream = settings.model_client_stream
+        self.evaluation_mode = settings.evaluation_mode
+        self.context_policy = settings.context_policy
+        self.prompt_cache_enabled = settings.prompt_cache_enabled
+        self.customer_model_name = settings.model_names["customer"]
+        self.staff_model_name = settings.model_names["staff"]
+        self.evaluator_model_name = settings.model_names["evaluator"]
+        # 使うプロバイダの API キーは、クライアントの作成を遅らせても起動時に確認する
+        missing = settings.missing_api_keys()
+        if missing:
+            raise ValueError(f"{missing[0]}環境変数が設定されていません。")
+        self.routing_clients = {}
+        self._role_clients = {}
 
         self.logger.info(f"API Provider: {self.api_provider}")
+        for role, routes in settings.routes.items():
+            if routes:
+                self.logger.info(f"Routing for {role}: {', '.join(f'{p}:{m}' for p, m in routes)}")
+        self.logger.info(f"Customer model: {self.customer_model_name}, Staff model: {self.staff_model_name}, "
+                         f"Evaluator model: {self.evaluator_model_name}")
+        if self.prompt_cache_enabled:
+            self.logger.info(f"Provider prompt cache enabled ({self.api_provider}, history={settings.prompt_cache_history})")
+
+    def _get_api_key(self, env_name: str) -> str:
+        """APIキーの取得（replay モードではオフライン実行のため未設定を許容）"""
+        api_key = os.getenv(env_name)
+        if not api_key:
+            if self.cache_mode == 'replay':
+                return "replay-mode"
+            raise ValueError(f"{env_name}環境変数が設定されていません。")
+        return api_key
+
+    @property
+    def client_pool(self):
+        if self._client_pool is None:
+            from client_pool import shared_pool
+            self._client_pool = shared_pool
+        return self._client_pool
+
+    @cached_property
+    def model_cache(self):
+        """応答キャッシュ（MODEL_CACHE_MODE が passthrough 以外の場合のみ使う）"""
+        from model_clients import ModelResponseCache
+        model_cache = ModelResponseCache.from_env()
+        self.logger.info(f"Model response cache enabled: mode={self.cache_mode}, dir={model_cache.cache_dir}")
+        return model_cache
+
+    @cached_property
+    def metrics(self):
+        """モデル呼び出しの計測（ロールごとに呼び出しを記録）"""
+        from metrics import MetricsRecorder, global_metrics
+        return MetricsRecorder(
+            session_id=self.file_tag,
+            path=self.metrics_file if self.session_files else None,
+            parent=global_metrics,
+        )
 
-    def _setup_anthropic(self):
-        """Anthropic API設定"""
+    @property
+    def metrics_file(self) -> Path:
+        return self.log_dir / f"metrics_{self.file_tag}.jsonl"
+
+    def _instrumented(self, role: str, client, model_name: str):
+        from metrics import InstrumentedChatCompletionClient
+        return InstrumentedChatCompletionClient(client, role, self.metrics, model=model_name)
+
+    @cached_property
+    def customer_model_client(self):
+        return self._instrumented("customer", self._role_client("customer"), self.customer_model_name)
+
+    @cached_property
+    def summarizer_model_client(self):
+        # 履歴の要約（CONTEXT_POLICY=summary）には軽量な顧客用モデルを使う
+        return self._instrumented("summarizer", self._role_client("customer"), self.customer_model_name)
+
+    @cached_property
+    def staff_model_client(self):
+        return self._instrumented("staff", self._role_client("staff"), self.staff_model_name)
+
+    @cached_property
+    def evaluator_model_client(self):
+        # 評価エージェントはスタッフと同じクライアントを使うが（ROUTE_EVALUATOR が設定されていなければ）、計測上は別ロールとして扱う
+        return self._instrumented("evaluator", self._role_client("evaluator"), self.evaluator_model_name)
+
+    def _role_client(self, role: str):
+        """ロールの（計測前の）クライアント: 共有クライアント、またはルーティング → 応答キャッシュの順に包む"""
+        client = self._role_clients.get(role)
+        if client is not None:
+            return client
+        routes = self.settings.routes[role]
+        if role == "evaluator" and not routes:
+            # 評価エージェントはスタッフと同じクライアント（ルーティング・応答キャッシュを含む）を使う
+            client = self._role_client("staff")
+        else:
+            # 応答キャッシュの名前空間は実際に呼び出すルート（ROUTE_<ROLE> の全ルート、なければ API_PROVIDER とモデル名）
+            route_names = [f"{provider}:{model}" for provider, model in routes] or [
+                f"{self.api_provider}:{self.settings.model_names[role]}"]
+            if routes:
+                from routing import RoutingChatCompletionClient, HedgeDeadline
+                client = RoutingChatCompletionClient(
+                    [(name, self._pooled_client(provider, model)) for name, (provider, model) in zip(route_names, routes)],
+                    role,
+                    deadline=HedgeDeadline.from_env(role),
+                )
+                self.routing_clients[role] = client
+            else:
+                client = self._pooled_client(self.api_provider, self.settings.model_names[role])
+            if self.cache_mode != 'passthrough':
+                from model_clients import CachingChatCompletionClient
+                client = CachingChatCompletionClient(
+                    client,
+                    self.model_cache,
+                    namespace=",".join(route_names),
+                    mode=self.cache_mode,
+                )
+        self._role_clients[role] = client
+        return client
+
+    def _anthropic_client(self, model_name: str):
+        """プールで共有する Anthropic クライアント"""
         try:
             from autogen_ext.models.anthropic import AnthropicChatCompletionClient
         except ImportError:
             self.logger.error("AnthropicChatCompletionClient のインポートに失敗しました。'autogen-ext[anthropic]' がインストールされているか確認してください。")
             raise ImportError("必要なパッケージがインストールされていません。pip install 'autogen-ext[anthropic]' を実行してください")
 
-        claude_key = os.getenv('ANTHROPIC_API_KEY')
-        if not claude_key:
-            raise ValueError("ANTHROPIC_API_KEY環境変数が設定されていません。")
+        claude_key = self._get_api_key('ANTHROPIC_API_KEY')
+        # 疑似 LLM サーバー（fake_llm_server.py）などに向ける場合のベース URL（未指定なら SDK のデフォルト）
+        anthropic_base_url = os.getenv('ANTHROPIC_BASE_URL') or None
+        self.logger.info(f"Anthropic model: {model_name}, Client Base URL: {anthropic_base_url or 'default'}")
 
-        self.customer_model_client = AnthropicChatCompletionClient(
-            model=os.getenv('ANTHROPIC_CUSTOMER_MODEL', "claude-3-haiku-20240307"),
+        # 再試行はプール側で行うため、SDK 側の再試行は無効化する
+        return self.client_pool.get("anthropic", model_name, lambda: AnthropicChatCompletionClient(
+            model=model_name,
             api_key=claude_key,
-        )
-        self.logger.info(f"Customer (Anthropic) model: {self.customer_model_client.model}")
-
-        self.staff_model_client = AnthropicChatCompletionClient(
-            model=os.getenv('ANTHROPIC_STAFF_MODEL', "claude-3-5-sonnet-20240620"),
-            api_key=claude_key,
-        )
-        self.logger.info(f"Staff/Evaluator (Anthropic) model: {self.staff_model_client.model}")
+            base_url=anthropic_base_url,
+            max_retries=0,
+        ))
 
-    def _setup_gemini(self):
-        """Google Gemini API設定（OpenAI互換API使用）"""
+    def _gemini_client(self, model_name: str):
+        """プールで共有する Gemini クライアント（OpenAI互換API使用）"""
         try:
+            from autogen_core.models import ModelInfo
             from autogen_ext.models.openai import OpenAIChatCompletionClient
-            # ModelInfo は autogen_core.models から既にインポート済み
         except ImportError:
             self.logger.error("OpenAIChatCompletionClient のインポートに失敗しました。'autogen-ext[openai]' がインストールされているか確認してください。")
             raise ImportError("必要なパッケージがインストールされていません。pip install 'autogen-ext[openai]' を実行してください")
 
-        google_key = os.getenv('GOOGLE_API_KEY')
-        if not google_key:
-            raise ValueError("GOOGLE_API_KEY環境変数が設定されていません。")
-
-        customer_model_name = os.getenv('GEMINI_CUSTOMER_MODEL', "gemini-1.5-flash-latest")
-        staff_model_name = os.getenv('GEMINI_STAFF_MODEL', "gemini-1.5-flash-latest")
+        google_key = self._get_api_key('GOOGLE_API_KEY')
 
         model_info_common = ModelInfo(
             family="gemini",
@@ -121,34 +264,39 @@ class ConversationTestingSystem:
         )
 
         gemini_api_base_url = os.getenv('GEMINI_API_BASE_URL', "https://generativelanguage.googleapis.com/v1beta")
+        self.logger.info(f"Gemini model: {model_name}, Client Base URL: {gemini_api_base_url}")
 
-        self.customer_model_client = OpenAIChatCompletionClient(
-            model=customer_model_name,
-            api_key=google_key,
-            base_url=gemini_api_base_url,
-            model_info=model_info_common,
-            api_type="google",
-        )
-        self.logger.info(f"Customer (Gemini) model: {customer_model_name}, Client Base URL: {gemini_api_base_url}")
-
-        self.staff_model_client = OpenAIChatCompletionClient(
-            model=staff_model_name,
+        return self.client_pool.get("gemini", model_name, lambda: OpenAIChatCompletionClient(
+            model=model_name,
             api_key=google_key,
             base_url=gemini_api_base_url,
             model_info=model_info_common,
             api_type="google",
-        )
-        self.logger.info(f"Staff/Evaluator (Gemini) model: {staff_model_name}, Client Base URL: {gemini_api_base_url}")
+            max_retries=0,
+        ))
+
+    def _pooled_client(self, provider: str, model_name: str):
+        """プロバイダとモデル名から共有クライアントを取得（プロンプトキャッシュは PROMPT_CACHE=1 の場合のみ）"""
+        if provider == 'anthropic':
+            client = self._anthropic_client(model_name)
+        elif provider == 'gemini':
+            client = self._gemini_client(model_name)
+        else:
+            raise ValueError(f"Unsupported provider: {provider}. Choose 'anthropic' or 'gemini'.")
+        if self.prompt_cache_enabled:
+            from prompt_cache import enable_prompt_cache
+            # 共有クライアントに一度だけフックする（有効化済みなら何もしない）
+            enable_prompt_cache(client, provider, cache_history=self.settings.prompt_cache_history)
+        return client
 
     def load_file_content(self, file_path: Path, description: str) -> str:
-        """ファイル内容を読み込む汎用メソッド"""
+        """ファイル内容を読み込む汎用メソッド（同じファイルは更新されるまでプロセス内で再利用する）"""
         if not file_path.exists():
             self.logger.error(f"{description}ファイルが見つかりません: {file_path}")
             raise FileNotFoundError(f"{description}ファイルが見つかりません: {file_path}")
 
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
+            content, _ = read_prompt_file(file_path)
             if not content:
                 self.logger.warning(f"{description}ファイルが空です: {file_path}")
             self.logger.info(f"{description}を読み込みました: {file_path}")
@@ -160,38 +308,55 @@ class ConversationTestingSystem:
     def load_all_prompts(self):
         """全てのプロンプトファイルを読み込み"""
         self.customer_persona = self.load_file_content(
-            Path("customer_persona.md"), "顧客ペルソナ"
+            self.customer_persona_file, "顧客ペルソナ"
         )
         self.staff_persona = self.load_file_content(
-            Path("staff_persona.md"), "スタッフペルソナ"
+            Path(STAFF_PERSONA_FILE), "スタッフペルソナ"
         )
         self.evaluator_prompt = self.load_file_content(
-            Path("evaluator_prompt.md"), "評価プロンプト"
+            Path(EVALUATOR_PROMPT_FILE), "評価プロンプト"
         )
         if not (self.customer_persona and self.staff_persona and self.evaluator_prompt):
             raise ValueError("必須プロンプトファイル (customer_persona.md, staff_persona.md, evaluator_prompt.md) のいずれかが空または読み込めませんでした。")
+        # 結果データベースでプロンプトの改訂ごとに比較するための内容ハッシュ（読み込み時に計算済みのもの）
+        self.prompt_hashes = {
+            "customer": read_prompt_file(self.customer_persona_file)[1],
+            "staff": read_prompt_file(STAFF_PERSONA_FILE)[1],
+            "evaluator": read_prompt_file(EVALUATOR_PROMPT_FILE)[1],
+        }
 
-    def log_conversation(self, speaker: str, content: str):
+    def log_conversation(self, speaker: str, content: str, latency_seconds: float = None, route: str = None):
         """会話内容をログに記録"""
-        timestamp = datetime.now().isoformat()
-        log_entry = {
-            "timestamp": timestamp,
-            "speaker": speaker,
-            "content": content
-        }
-        self.conversation_log.append(log_entry)
+        log_entry = self.conversation_log.append(
+            TranscriptEntry(datetime.now().isoformat(), speaker, content, latency_seconds, route)
+        )
 
         try:
-            with open(self.conversation_log_file, 'w', encoding='utf-8') as f:
-                json.dump(self.conversation_log, f, ensure_ascii=False, indent=2)
+            if self.transcript_writer is not None:
+                self.transcript_writer.write(log_entry.to_dict())
         except Exception as e:
             self.logger.error(f"会話ログ保存エラー: {e}", exc_info=True)
 
         self.logger.info(f"Chat Logged - [{speaker}]: {content[:100]}{'...' if len(content) > 100 else ''}")
 
+    def _take_route(self, speaker: str):
+        """発言者のロールで直近に応答したルート（ルーティングしていなければ None）"""
+        role = speaker.lower()
+        client = self.routing_clients.get(role)
+        if client is None and role == "evaluator" and not self.settings.routes["evaluator"]:
+            client = self.routing_clients.get("staff")
+        if client is None:
+            return None
+        route, client.last_route = client.last_route, None
+        return route
+
     async def create_agents(self, scenario_description: str = "", max_turns: int = 10):
         """エージェントの作成（非同期）"""
+        from autogen_agentchat.agents import AssistantAgent
+        from context_policy import PolicyChatCompletionContext
+        from prompt_cache import SCENARIO_SECTION_MARKER
 
+        # シナリオ（セッションごとに変わる部分）は末尾に置き、それより前をプロンプトキャッシュで共有できるようにする
         conversation_guidelines = f"""
         ### 会話のガイドライン
         - 1回の発言は簡潔に（2-4文程度）
@@ -206,21 +371,27 @@ class ConversationTestingSystem:
         - 「DONE」の後には、いかなる追加のテキストも出力しないでください。
         - 質問や応答が残っている場合、または相手の応答を待つべき場合は「DONE」を出力しないでください。
 
-        ### 現在のシナリオ
-        {scenario_description}
-
         ### 重要な注意事項
         - あなたは指定されたペルソナになりきってください。
         - 直前の相手の発言で会話が終了条件を満たしている場合でも、あなた自身の応答として「DONE」と出力してください（例：相手が「ありがとうございました。DONE」と言ったら、あなたも「こちらこそありがとうございました。DONE」のように）。ただし、不自然な場合は無理に「DONE」を繰り返す必要はありません。
         - 「お疲れ様でした」のようなメタ的な発言は避けてください。
+
+        {SCENARIO_SECTION_MARKER}
+        {scenario_description}
         """
 
+        # 送信する履歴の長さを CONTEXT_POLICY に従って制限する
+        self.customer_context = PolicyChatCompletionContext.from_env(summarizer=self.summarizer_model_client)
+        self.staff_context = PolicyChatCompletionContext.from_env(summarizer=self.summarizer_model_client)
+
         customer_system_message = f"{self.customer_persona}\n{conversation_guidelines}"
         self.customer_agent = AssistantAgent(
             name="Customer",
             description="顧客/クライアント役。テスト対象のLLM。",
             system_message=customer_system_message,
             model_client=self.customer_model_client,
+            model_context=self.customer_context,
+            model_client_stream=self.model_client_stream,
         )
 
         staff_system_message = f"{self.staff_persona}\n{conversation_guidelines}"
@@ -229,232 +400,497 @@ class ConversationTestingSystem:
             description="スタッフ/サービス提供者役。",
             system_message=staff_system_message,
             model_client=self.staff_model_client,
+            model_context=self.staff_context,
+            model_client_stream=self.model_client_stream,
         )
 
-        self.evaluator_agent = AssistantAgent(
+        self.evaluator_agent = self.create_evaluator_agent()
+        self.logger.info("All agents created successfully.")
+
+    def create_evaluator_agent(self):
+        """評価エージェントの作成（並列評価では評価ごとに個別のインスタンスを使う）"""
+        from autogen_agentchat.agents import AssistantAgent
+        return AssistantAgent(
             name="Evaluator",
             description="会話品質とペルソナ一貫性を評価する専門家。",
             system_message=self.evaluator_prompt,
-            model_client=self.staff_model_client,
+            model_client=self.evaluator_model_client,
         )
-        self.logger.info("All agents created successfully.")
 
-    async def run_conversation_test(self, scenario_description: str = "一般的な会話", initial_message_content: str = "こんにちは", max_turns: int = 10):
-        """会話テストの実行（非同期）- シンプル版"""
+    @staticmethod
+    def build_evaluation_input(messages: list) -> str:
+        """評価エージェントへの入力（会話ログ全体）を組み立てる"""
+        conversation_summary_for_eval = "\n".join([
+            f"[{msg_item['source']}]: {msg_item['content']}"
+            for msg_item in messages
+        ])
+
+        return f"""
+            以下の会話ログ全体を評価してください。
+
+            ### 評価対象の会話
+            {conversation_summary_for_eval}
+            """
+
+    async def evaluate_conversation(self, messages: list, evaluator_agent=None) -> str:
+        """会話ログを評価エージェントで評価し、評価テキストを返す"""
+        evaluator_agent = evaluator_agent or self.create_evaluator_agent()
+        evaluation_response_message_obj = await evaluator_agent.run(
+            task=self.build_evaluation_input(messages)
+        )
+
+        if evaluation_response_message_obj:
+            if hasattr(evaluation_response_message_obj, 'messages'):
+                evaluation_content = evaluation_response_message_obj.messages[-1].content
+            else:
+                evaluation_content = str(evaluation_response_message_obj)
+                self.logger.warning(f"Unexpected evaluation response format: {type(evaluation_response_message_obj)}")
+        else:
+            self.logger.error("Evaluation agent did not return a response.")
+            evaluation_content = "評価エラー: 評価エージェントから応答がありませんでした。"
+        return evaluation_content
+
+    def _save_checkpoint(self, status: str, **fields):
+        """チェックポイントの保存（区間の境界・失敗時・完了時）"""
+        self._checkpoint.update(fields, status=status)
+        try:
+            save_checkpoint(self.checkpoint_file, self._checkpoint)
+            self.logger.info(f"Checkpoint saved ({status}, {self._checkpoint.get('agent_turns', 0)} turns): {self.checkpoint_file}")
+        except Exception as e:
+            self.logger.error(f"チェックポイント保存エラー: {e}", exc_info=True)
+
+    async def run_conversation_test(self, scenario_description: str = "一般的な会話", initial_message_content: str = "こんにちは", max_turns: int = 10,
+                                    resume: bool = False):
+        """会話テストの実行（非同期）- シンプル版
+
+        resume=True の場合、チェックポイントがあればその時点から会話を再開する（完了済みなら保存済みの結果を返す）。
+        """
+        from autogen_agentchat.teams import RoundRobinGroupChat
+        from autogen_agentchat.conditions import TextMentionTermination
+        from autogen_agentchat.base import TaskResult
+        from autogen_agentchat.messages import ModelClientStreamingChunkEvent
+        from termination import (
+            ConversationLoopTermination, classify_stop_reason,
+            REASON_LOOP, REASON_STALL, REASON_FAREWELL, REASON_MAX_TURNS,
+        )
 
-        print("\n" + "=" * 80)
-        print("🎭 会話テストシステム 開始")
-        print("=" * 80)
-        print(f"シナリオ: {scenario_description}")
-        print(f"最大ターン数: {max_turns}")
-        print(f"ログファイル (詳細): {self.log_filename}")
-        print(f"会話ログ (JSON): {self.conversation_log_file}")
-        print("-" * 80)
+        checkpoint = load_checkpoint(self.checkpoint_file) if resume else None
+        if checkpoint and checkpoint.get("status") == STATUS_COMPLETE:
+            self.logger.info(f"Session already complete, returning stored result: {self.checkpoint_file}")
+            self._echo(f"✅ 完了済みのセッションです: {self.checkpoint_file}")
+            return checkpoint.get("result")
+
+        self._echo("\n" + "=" * 80)
+        self._echo("🎭 会話テストシステム 開始")
+        self._echo("=" * 80)
+        self._echo(f"シナリオ: {scenario_description}")
+        self._echo(f"最大ターン数: {max_turns}")
+        self._echo(f"ログファイル (詳細): {self.log_filename}")
+        self._echo(f"会話ログ (JSONL): {self.conversation_log_file}")
+        self._echo("-" * 80)
+
+        # 同じインスタンスで再実行する場合は、クローズ済みのログを追記モードで開き直す
+        self.transcript_writer.reopen()
+        self.metrics.reopen()
 
         self.logger.info(f"Test session started: Scenario - '{scenario_description}', Initial Message - '{initial_message_content}', Max Turns - {max_turns}")
-        self.log_conversation("System", f"シナリオ: {scenario_description}")
 
-        all_final_messages = []
+        if checkpoint:
+            # 最後に保存した区間の境界まで巻き戻し、それ以降の（失われた）発言はログからも取り除く
+            turn_latencies = checkpoint["turn_latencies"]
+            time_to_first_turn = checkpoint["time_to_first_turn_seconds"]
+            team_state = checkpoint["team_state"]
+            self.conversation_log = ConversationLog(checkpoint["log_entries"])
+            self.transcript_writer.rewrite(checkpoint["log_entries"])
+            self.logger.info(f"Resuming from checkpoint ({checkpoint['status']}, {checkpoint['agent_turns']} turns): {self.checkpoint_file}")
+            self._echo(f"⏯  チェックポイントから再開します（{checkpoint['agent_turns']}ターン完了済み）")
+        else:
+            turn_latencies = []
+            time_to_first_turn = None
+            team_state = None
+            self.log_conversation("System", f"シナリオ: {scenario_description}")
+
+        self._checkpoint = {
+            "session_id": self.session_id,
+            "file_tag": self.file_tag,
+            "log_dir": str(self.log_dir),
+            "scenario": scenario_description,
+            "initial_message": initial_message_content,
+            "max_turns": max_turns,
+            # 横断分析（analytics.py）でペルソナ・モデル別に集計するためのセッションの設定
+            "session_info": {
+                "api_provider": self.api_provider,
+                "customer_model": self.customer_model_name,
+                "staff_model": self.staff_model_name,
+                "customer_persona_file": str(self.customer_persona_file),
+                "customer_persona_hash": self.prompt_hashes["customer"],
+            },
+            "agent_turns": self.conversation_log.stats.agent_turns,
+            "messages": self.conversation_log.messages(),
+            "turn_latencies": list(turn_latencies),
+            "time_to_first_turn_seconds": time_to_first_turn,
+            "log_entries": self.conversation_log.to_dicts(),
+            "team_state": team_state,
+        }
+        if not checkpoint:
+            self._save_checkpoint(STATUS_RUNNING)
 
         try:
             await self.create_agents(scenario_description, max_turns)
 
-            print("\n🎬 会話開始...")
-            print("=" * 40)
+            self._echo("\n🎬 会話開始...")
+            self._echo("=" * 40)
 
             agents_for_chat = [self.customer_agent, self.staff_agent]
 
-            group_chat = RoundRobinGroupChat(
-                participants=agents_for_chat,
-                max_turns=max_turns,
-                termination_condition=TextMentionTermination('DONE')
-            )
+            # DONE による終了に加え、堂々巡り・停滞をモデル呼び出しなしで検知して早期終了する
+            termination_condition = TextMentionTermination('DONE')
+            loop_condition = None
+            if self.loop_detection:
+                loop_condition = ConversationLoopTermination.from_env()
+                loop_condition.prime(self.conversation_log.turns())
+                termination_condition = termination_condition | loop_condition
+
+            self._echo("\n📜 会話履歴:")
+            self._echo("=" * 40)
+
+            # 発言を受け取るたびに正規化・記録・表示する（全ターン終了を待たない）
+            # CHECKPOINT_EVERY ターンごとの区間に分けて実行し、区間の境界でチームの状態を保存する
+            chat_result = None
+            stream_started = time.monotonic()
+            agent_turns = self._checkpoint["agent_turns"]
+            task = None if team_state else scenario_description
+
+            while True:
+                segment_turns = max_turns - agent_turns
+                if self.checkpoint_every > 0:
+                    segment_turns = min(segment_turns, self.checkpoint_every)
+                group_chat = RoundRobinGroupChat(
+                    participants=agents_for_chat,
+                    max_turns=segment_turns,
+                    termination_condition=termination_condition
+                )
+                if team_state:
+                    await group_chat.load_state(team_state)
+
+                chat_result = None
+                last_message_time = time.monotonic()
+                async for msg_obj in group_chat.run_stream(task=task):
+                    if isinstance(msg_obj, TaskResult):
+                        chat_result = msg_obj
+                        continue
+                    if isinstance(msg_obj, ModelClientStreamingChunkEvent):
+                        continue
+
+                    now = time.monotonic()
+                    speaker, content = normalize_message(msg_obj)
+
+                    latency = None
+                    if speaker in ("Customer", "Staff"):
+                        agent_turns += 1
+                        latency = round(now - last_message_time, 3)
+                        turn_latencies.append(latency)
+                        if time_to_first_turn is None:
+                            time_to_first_turn = round(now - stream_started, 3)
+                            self.logger.info(f"Time to first turn: {time_to_first_turn:.3f}s")
+                    if speaker != EVENT_SPEAKER:
+                        # イベント（思考・ツール呼び出し）の時間は次の発言のレイテンシに含める
+                        last_message_time = now
+
+                    self.log_conversation(speaker, content, latency_seconds=latency, route=self._take_route(speaker))
+                    self._echo(f"\n[{speaker}]: {content}")
+                    self._echo("-" * 40)
+                task = None
+
+                # 区間のターン数に達しただけで、全体の最大ターン数には達していなければ保存して続ける
+                if (chat_result is None or agent_turns >= max_turns
+                        or classify_stop_reason(chat_result.stop_reason) != REASON_MAX_TURNS):
+                    break
+                team_state = await group_chat.save_state()
+                self._save_checkpoint(
+                    STATUS_RUNNING,
+                    agent_turns=agent_turns,
+                    messages=self.conversation_log.messages(),
+                    turn_latencies=list(turn_latencies),
+                    time_to_first_turn_seconds=time_to_first_turn,
+                    log_entries=self.conversation_log.to_dicts(),
+                    team_state=team_state,
+                )
+                if loop_condition is not None:
+                    # 区間の終了で reset() された判定用の履歴を復元する
+                    loop_condition.prime(self.conversation_log.turns())
+
+            if chat_result is not None:
+                self.logger.info(f"Group chat stopped: {chat_result.stop_reason}")
+            else:
+                self.logger.warning("Group chat stream ended without a TaskResult.")
 
-            chat_result = await group_chat.run(
-                task=scenario_description
-            )
+            last_message = self.conversation_log.stats.last_message
+            conversation_ended_naturally = last_message is not None and "DONE" in last_message.content.strip().upper()
 
-            print("\n📜 会話履歴:")
-            print("=" * 40)
+            total_turns = self.conversation_log.stats.messages
+            all_final_messages = self.conversation_log.messages()
+            termination_reason = classify_stop_reason(chat_result.stop_reason if chat_result else None)
 
-            if chat_result and hasattr(chat_result, 'messages') and chat_result.messages:
-                conversation_history = chat_result.messages
-            else:
-                self.logger.warning("No conversation history found in chat_result or group_chat.messages.")
-
-            for i, msg_obj in enumerate(conversation_history):
-                speaker = "Unknown"
-                content = ""
-
-                if isinstance(msg_obj, dict) and "content" in msg_obj and isinstance(msg_obj["content"], str):
-                    content = msg_obj["content"]
-                    # 'name' または 'source' があればそれを speaker とする
-                    if "name" in msg_obj and msg_obj["name"]:
-                        speaker = msg_obj["name"]
-                    elif "source" in msg_obj and msg_obj["source"]: # 追加
-                        speaker = msg_obj["source"]
-                    elif "role" in msg_obj and msg_obj["role"]:
-                         speaker = msg_obj["role"].capitalize()
-                elif hasattr(msg_obj, 'content') and isinstance(msg_obj.content, str):
-                    content = msg_obj.content
-                    if hasattr(msg_obj, 'name') and msg_obj.name:
-                        speaker = msg_obj.name
-                    elif hasattr(msg_obj, 'source') and msg_obj.source: # 追加
-                        speaker = msg_obj.source
-                    elif hasattr(msg_obj, 'role') and msg_obj.role:
-                        speaker = msg_obj.role.capitalize()
-                else:
-                    content = str(msg_obj)
-                    self.logger.warning(f"Message object at index {i} has no 'content' or is not a string: {msg_obj}")
-
-                # sender 属性からのフォールバック (必要であれば)
-                if speaker == "Unknown" and hasattr(msg_obj, 'sender') and msg_obj.sender and hasattr(msg_obj.sender, 'name'):
-                     speaker = msg_obj.sender.name
-
-                if speaker == "User_CLI_Input":
-                    speaker = "Customer"
-
-                all_final_messages.append({"source": speaker, "content": content})
-                self.log_conversation(speaker, content)
-                print(f"\n[{speaker}]: {content}")
-                print("-" * 40)
-
-            conversation_ended_naturally = False
-            if all_final_messages and "DONE" in all_final_messages[-1]['content'].strip().upper():
-                conversation_ended_naturally = True
-
-            total_turns = len(all_final_messages)
-
-            print("\n🎬 会話終了")
+            self._echo("\n🎬 会話終了")
             if conversation_ended_naturally:
                 self.logger.info("Conversation ended naturally (DONE detected).")
-                print("（エージェントの指示により自然な終了を検知しました）")
+                self._echo("（エージェントの指示により自然な終了を検知しました）")
+            elif termination_reason in (REASON_LOOP, REASON_STALL, REASON_FAREWELL):
+                self.logger.info(f"Conversation ended early ({termination_reason}): {chat_result.stop_reason}")
+                reason_labels = {
+                    REASON_LOOP: "同じ内容の繰り返し",
+                    REASON_STALL: "会話の停滞",
+                    REASON_FAREWELL: "双方の別れの挨拶",
+                }
+                self._echo(f"（{reason_labels[termination_reason]}を検知したため終了しました）")
             else:
                 self.logger.info(f"Conversation ended due to max_turns ({max_turns}) or other reasons.")
-                print(f"（最大ターン数 {max_turns} に到達したか、他の理由で終了しました）")
-            print("=" * 40)
-
-            print("\n📊 評価開始...")
-            self.logger.info("Starting evaluation phase.")
-
-            conversation_summary_for_eval = "\n".join([
-                f"[{msg_item['source']}]: {msg_item['content']}"
-                for msg_item in all_final_messages
-            ])
-
-            evaluation_input_text = f"""
-            以下の会話ログ全体を評価してください。
-
-            ### 評価対象の会話
-            {conversation_summary_for_eval}
-            """
-
-            evaluation_response_message_obj = await self.evaluator_agent.run(
-                task=evaluation_input_text
-            )
-
-            if evaluation_response_message_obj:
-                if hasattr(evaluation_response_message_obj, 'messages'):
-                    evaluation_content = evaluation_response_message_obj.messages[-1].content
-                else:
-                    evaluation_content = str(evaluation_response_message_obj)
-                    self.logger.warning(f"Unexpected evaluation response format: {type(evaluation_response_message_obj)}")
+                self._echo(f"（最大ターン数 {max_turns} に到達したか、他の理由で終了しました）")
+            if turn_latencies:
+                mean_latency = sum(turn_latencies) / len(turn_latencies)
+                self.logger.info(f"Turn latency: first={time_to_first_turn:.3f}s, mean={mean_latency:.3f}s, max={max(turn_latencies):.3f}s")
+                self._echo(f"⏱  最初の発言まで: {time_to_first_turn:.2f}秒 / 1ターン平均: {mean_latency:.2f}秒 / 最大: {max(turn_latencies):.2f}秒")
+            self._echo("=" * 40)
+
+            context_report = {
+                "customer": self.customer_context.report(),
+                "staff": self.staff_context.report(),
+            }
+            tokens_saved = sum(r["tokens_saved"] for r in context_report.values())
+            self.logger.info(f"Context policy '{self.context_policy}': {json.dumps(context_report, ensure_ascii=False)}")
+            if self.context_policy != "full":
+                self._echo(f"✂️  履歴の省略 ({self.context_policy}): 約{tokens_saved}トークン削減")
+            if self.prompt_cache_enabled:
+                metrics_summary = self.metrics.summary()
+                cache_read = sum(r["cache_read_tokens"] for r in metrics_summary.values())
+                cache_write = sum(r["cache_write_tokens"] for r in metrics_summary.values())
+                self.logger.info(f"Prompt cache: read={cache_read} tokens, write={cache_write} tokens")
+                self._echo(f"🗄  プロンプトキャッシュ: 読み込み {cache_read}トークン / 書き込み {cache_write}トークン")
+
+            if self.evaluation_mode == "deferred":
+                evaluation_content = None
+                self.logger.info("Evaluation deferred (EVALUATION_MODE=deferred).")
+                self._echo("\n📊 評価は後でまとめて実行します (--evaluate-only)")
             else:
-                self.logger.error("Evaluation agent did not return a response.")
-                evaluation_content = "評価エラー: 評価エージェントから応答がありませんでした。"
+                self._echo("\n📊 評価開始...")
+                self.logger.info("Starting evaluation phase.")
+
+                evaluation_content = await self.evaluate_conversation(all_final_messages, self.evaluator_agent)
 
-            self.log_conversation("Evaluator", evaluation_content)
+                self.log_conversation("Evaluator", evaluation_content, route=self._take_route("Evaluator"))
 
-            print("\n" + "=" * 80)
-            print("📝 評価結果")
-            print("=" * 80)
-            print(evaluation_content)
-            print("=" * 80)
+                self._echo("\n" + "=" * 80)
+                self._echo("📝 評価結果")
+                self._echo("=" * 80)
+                self._echo(evaluation_content)
+                self._echo("=" * 80)
 
+            self.logger.info(f"Model call metrics: {json.dumps(self.metrics.summary(), ensure_ascii=False)}")
             self.logger.info("テストセッション完了")
-            
-            # クライアントをクローズ
-            await self.customer_model_client.close()
-            await self.staff_model_client.close()
 
-            return {
+            result = {
+                "session_id": self.session_id,
+                "scenario": scenario_description,
                 "chat_messages": all_final_messages,
                 "evaluation": evaluation_content,
+                "evaluation_deferred": evaluation_content is None,
                 "log_file_json": str(self.conversation_log_file),
                 "log_file_system": str(self.log_filename),
                 "conversation_ended_naturally": conversation_ended_naturally,
-                "total_turns": total_turns
+                "termination_reason": termination_reason,
+                "total_turns": total_turns,
+                "stop_reason": chat_result.stop_reason if chat_result else None,
+                "time_to_first_turn_seconds": time_to_first_turn,
+                "turn_latencies_seconds": turn_latencies,
+                "metrics": self.metrics.summary(),
+                "context": context_report,
+                "log_file_metrics": str(self.metrics_file),
+                "checkpoint_file": str(self.checkpoint_file),
             }
+            self.record_results(result)
+            self._save_checkpoint(STATUS_COMPLETE, result=result, team_state=None)
+            return result
 
         except Exception as e:
             error_msg = f"テスト中にエラーが発生しました: {e}"
             self.logger.error(error_msg, exc_info=True)
-            print(f"\n❌ {error_msg}")
-            traceback.print_exc()
+            self._echo(f"\n❌ {error_msg}")
+            # 最後に保存した区間の境界から再開できるよう、失敗として記録する
+            self._save_checkpoint(STATUS_FAILED, error=str(e))
+            self._echo(f"⏯  チェックポイントから再開できます: {self.checkpoint_file}")
+            if self.verbose:
+                traceback.print_exc()
             return None
         finally:
-            self.logger.info("Attempting to close LLM clients.")
-            try:
-                if self.customer_model_client and hasattr(self.customer_model_client, 'close'):
-                    await self.customer_model_client.close()
-                    self.logger.info("Customer model client closed.")
-            except Exception as ce:
-                self.logger.error(f"Error closing customer model client: {ce}", exc_info=True)
             try:
-                if self.staff_model_client and hasattr(self.staff_model_client, 'close'):
-                    await self.staff_model_client.close()
-                    self.logger.info("Staff model client closed.")
-            except Exception as se:
-                self.logger.error(f"Error closing staff model client: {se}", exc_info=True)
-
-    def get_conversation_stats(self) -> dict:
-        """会話統計の取得"""
-        if not self.conversation_log:
-            return {}
-
-        customer_msgs = len([msg for msg in self.conversation_log if msg["speaker"].lower() == "customer"])
-        staff_msgs = len([msg for msg in self.conversation_log if msg["speaker"].lower() == "staff"])
-
-        stats = {
-            "total_logged_entries": len(self.conversation_log),
-            "customer_messages": customer_msgs,
-            "staff_messages": staff_msgs,
-            "actual_conversation_turns": customer_msgs + staff_msgs,
-            "duration_seconds": None,
-            "duration_formatted": "N/A"
-        }
+                self.transcript_writer.close()
+                self.metrics.close()
+            except Exception as we:
+                self.logger.error(f"Error closing transcript/metrics writer: {we}", exc_info=True)
 
-        conversation_entries = [
-            msg for msg in self.conversation_log
-            if msg["speaker"].lower() in ["customer", "staff", "user_cli_input", "user", "system"] # "System"も開始点として考慮
-        ]
+    def record_results(self, result: dict):
+        """セッションの結果を結果データベースに記録（RESULTS_DB=none の場合は何もしない）"""
+        try:
+            store = ResultsStore.from_env()
+            if store is None:
+                return
+            with store:
+                metrics_summary = result["metrics"]
+                store.record_session(
+                    session_row(
+                        self.conversation_log_file,
+                        self.conversation_log,
+                        session_tag=self.file_tag,
+                        scenario=result["scenario"],
+                        api_provider=self.api_provider,
+                        customer_model=self.customer_model_name,
+                        staff_model=self.staff_model_name,
+                        customer_persona_hash=self.prompt_hashes["customer"],
+                        staff_persona_hash=self.prompt_hashes["staff"],
+                        context_policy=self.context_policy,
+                        total_turns=result["total_turns"],
+                        termination_reason=result["termination_reason"],
+                        ended_naturally=int(result["conversation_ended_naturally"]),
+                        time_to_first_turn_seconds=result["time_to_first_turn_seconds"],
+                        prompt_tokens=sum(r["prompt_tokens"] for r in metrics_summary.values()),
+                        completion_tokens=sum(r["completion_tokens"] for r in metrics_summary.values()),
+                    ),
+                    turns=self.conversation_log,
+                    evaluation=None if result["evaluation"] is None else {
+                        "content": result["evaluation"],
+                        "evaluator_prompt_hash": self.prompt_hashes["evaluator"],
+                        "evaluator_model": self.evaluator_model_name,
+                    },
+                )
+            result["results_db"] = str(store.path)
+            self.logger.info(f"Results recorded to {store.path}")
+        except Exception as e:
+            # 記録に失敗してもテスト結果自体は返す
+            self.logger.error(f"結果データベースへの記録エラー: {e}", exc_info=True)
 
-        if len(conversation_entries) >= 1: # 最初のメッセージだけでも時間は計算できる（ほぼ0だが）
-            try:
-                # 最初の意味のあるログエントリ（Systemのシナリオ設定や最初のユーザー発言）
-                first_entry_time_str = conversation_entries[0]["timestamp"]
-                # 最後の意味のあるログエントリ (評価結果の一つ前、つまり会話の最後)
-                # "Evaluator" を除く最後のメッセージ
-                last_conv_entries = [m for m in conversation_entries if m["speaker"].lower() != "evaluator"]
-                if not last_conv_entries: # 会話が全く無かった場合
-                    last_entry_time_str = first_entry_time_str
-                else:
-                    last_entry_time_str = last_conv_entries[-1]["timestamp"]
-
-                start_time = datetime.fromisoformat(first_entry_time_str)
-                end_time = datetime.fromisoformat(last_entry_time_str)
-                duration_delta = end_time - start_time
-                stats["duration_seconds"] = duration_delta.total_seconds()
-                stats["duration_formatted"] = str(duration_delta)
-            except (ValueError, IndexError) as e:
-                self.logger.warning(f"Could not parse timestamps for duration calculation: {e}")
-
-        return stats
-
-async def main():
+    def get_conversation_stats(self) -> dict:
+        """会話統計の取得（ログへの記録ごとに更新した値を返す）"""
+        return self.conversation_log.stats.as_dict()
+
+def parse_args(argv=None):
+    """コマンドライン引数の解析"""
+    parser = argparse.ArgumentParser(description="Staff-Customer 会話テストシステム")
+    parser.add_argument("--batch", metavar="SCENARIO_FILE",
+                        help="シナリオファイル (JSONL/YAML) を指定して非対話のバッチ実行を行う")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="バッチ実行・再評価時の同時実行数 (デフォルト: 4)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="バッチ・スイープ実行のワーカープロセス数。2以上でジョブキューを介して複数プロセスで実行する (デフォルト: 1)")
+    parser.add_argument("--worker", metavar="QUEUE_DB",
+                        help="既存のジョブキュー (queue.db) に参加してジョブを実行する (共有ファイルシステム上の別マシンから)")
+    parser.add_argument("--max-turns", type=int, default=100,
+                        help="1セッションの最大ターン数 (デフォルト: 100)")
+    parser.add_argument("--output-dir", default=None,
+                        help="バッチ・スイープ実行の出力ディレクトリ (デフォルト: logs/batch_<timestamp> または logs/sweep_<定義ファイル名>)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="指定したポートで Prometheus 形式のメトリクス (/metrics) を公開する")
+    parser.add_argument("--sweep", metavar="SWEEP_FILE",
+                        help="スイープ定義 (YAML/JSON) の顧客ペルソナ × シナリオ × プロバイダの全組み合わせを実行する")
+    parser.add_argument("--resume", metavar="CHECKPOINT_FILE",
+                        help="チェックポイント (checkpoint_*.json) から中断した会話を再開する")
+    parser.add_argument("--evaluate-only", action="store_true",
+                        help="会話を生成せず、保存済みの会話ログを評価プロンプトで再評価する")
+    parser.add_argument("--eval-backend", default="agent", choices=["agent", "batch", "packed"],
+                        help="再評価の方式: agent (1会話ずつ) / batch (Anthropic Message Batches API) / "
+                             "packed (複数の会話を1リクエストにまとめる) (デフォルト: agent)")
+    parser.add_argument("--pack-size", type=int, default=5,
+                        help="--eval-backend packed で1リクエストにまとめる会話数 (デフォルト: 5)")
+    parser.add_argument("--logs-dir", default="logs",
+                        help="再評価する会話ログのディレクトリ (デフォルト: logs)")
+    parser.add_argument("--force", action="store_true",
+                        help="同じ評価プロンプトで評価済みの会話も再評価する")
+    parser.add_argument("--check", action="store_true",
+                        help="環境変数 (APIキー・モデル・ルーティング) とプロンプトファイルを検証して終了する (autogen は読み込まない)")
+    return parser.parse_args(argv)
+
+async def main(args=None):
     """メイン実行関数（非同期）"""
+    args = args or parse_args()
     test_system = None
     try:
+        if args.check:
+            if not check_config():
+                raise SystemExit(1)
+            return
+
+        if args.metrics_port:
+            from metrics import serve_prometheus
+            serve_prometheus(args.metrics_port)
+            print(f"📈 メトリクス公開中: http://127.0.0.1:{args.metrics_port}/metrics")
+
+        if args.evaluate_only:
+            from offline_eval import run_offline_evaluation
+            await run_offline_evaluation(
+                logs_dir=args.logs_dir,
+                concurrency=args.concurrency,
+                force=args.force,
+                backend=args.eval_backend,
+                pack_size=args.pack_size,
+            )
+            return
+
+        if args.worker:
+            from worker import run_worker
+            await run_worker(args.worker, concurrency=args.concurrency)
+            return
+
+        if args.sweep:
+            from sweep import run_sweep
+            await run_sweep(
+                args.sweep,
+                concurrency=args.concurrency,
+                max_turns=args.max_turns,
+                output_dir=args.output_dir,
+                workers=args.workers,
+            )
+            return
+
+        if args.batch:
+            from batch_runner import load_scenarios, run_batch
+            scenarios = load_scenarios(args.batch)
+            if args.workers > 1:
+                from worker import run_workers
+                await run_workers(
+                    scenarios,
+                    workers=args.workers,
+                    concurrency=args.concurrency,
+                    max_turns=args.max_turns,
+                    output_dir=args.output_dir,
+                )
+                return
+            await run_batch(
+                scenarios,
+                concurrency=args.concurrency,
+                max_turns=args.max_turns,
+                output_dir=args.output_dir,
+            )
+            return
+
+        if args.resume:
+            from checkpoint import load_checkpoint
+            checkpoint = load_checkpoint(args.resume)
+            if checkpoint is None:
+                raise FileNotFoundError(f"チェックポイントを読み込めません: {args.resume}")
+            test_system = ConversationTestingSystem(log_dir=checkpoint["log_dir"], file_tag=checkpoint["file_tag"])
+            result = await test_system.run_conversation_test(
+                scenario_description=checkpoint["scenario"],
+                initial_message_content=checkpoint["initial_message"],
+                max_turns=checkpoint["max_turns"],
+                resume=True,
+            )
+            if result:
+                print(f"\n💾 会話ログファイル (JSONL): {result.get('log_file_json', 'N/A')}")
+                print("\n🎉 テスト完了！")
+            else:
+                print("\n❌ テストセッションは結果を返さずに終了しました。詳細はログを確認してください。")
+            return
+
         print("🔧 システム初期化中...")
         test_system = ConversationTestingSystem()
         print("✅ 初期化完了 (ログ・API設定)")
@@ -471,7 +907,7 @@ async def main():
         if not initial_msg_content:
             initial_msg_content = "こんにちは。"
 
-        max_turns=100
+        max_turns = args.max_turns
 
         print(f"\n🎭 テスト設定:")
         print(f"  シナリオ: {scenario}")
@@ -496,7 +932,8 @@ async def main():
                     print(f"  会話時間 (概算): {stats['duration_formatted']}")
 
             print(f"\n💾 システムログファイル: {result.get('log_file_system', 'N/A')}")
-            print(f"💾 会話JSONログファイル: {result.get('log_file_json', 'N/A')}")
+            print(f"💾 会話ログファイル (JSONL): {result.get('log_file_json', 'N/A')}")
+            print(f"💾 メトリクスファイル: {result.get('log_file_metrics', 'N/A')}")
             print("\n🎉 テスト完了！")
         else:
             print("\n❌ テストセッションは結果を返さずに終了しました。詳細はログを確認してください。")
@@ -526,6 +963,10 @@ async def main():
         print("詳細はログファイルを確認してください。")
         traceback.print_exc()
     finally:
+        # クライアントを1つも作成していなければ client_pool は import されていない
+        client_pool = sys.modules.get("client_pool")
+        if client_pool is not None:
+            await client_pool.shared_pool.close_all()
         print("\nシステムを終了します。")
 
 if __name__ == "__main__":
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+評価のまとめ実行（プロバイダのバッチ API / 複数会話の1リクエスト化）
+
+夜間に数千件の会話ログを評価する場合は、1会話ずつ評価エージェントを呼ぶ（offline_eval の agent）よりも
+スループットとコストを優先したいため、次の2つの方式を用意する。offline_eval.run_offline_evaluation の
+backend で選び、評価結果は従来どおり1会話1ファイル（と結果データベース）に書き戻す。
+
+- batch: Anthropic の Message Batches API に評価リクエストをまとめて送信し、処理済みになるまでポーリングする
+  （custom_id は会話ログの相対パスのハッシュ）。送信したバッチの ID は <評価結果の保存先>/batches.json に記録し、
+  ポーリング中に中断した場合も再実行時には送信し直さずに同じバッチの結果を待つ
+- packed: 複数の会話（pack_size 件）を1つの評価リクエストにまとめ、"=== 評価 <番号> ===" の節ごとに分割する
+  （プロバイダを問わない。節が欠けた会話は1件ずつ評価し直す）
+
+疑似 LLM サーバー（fake_llm_server.py）は Message Batches API とまとめた評価リクエストの両方に応答するため、
+ANTHROPIC_BASE_URL を向ければオフラインで一連の流れを試せる。
+
+環境変数:
+- BATCH_MAX_REQUESTS（デフォルト: 10000）: 1バッチに含めるリクエスト数の上限（超えた分は別のバッチで送る）
+- BATCH_POLL_INTERVAL（秒, デフォルト: 30）: バッチの処理状況を確認する間隔
+- EVALUATOR_MAX_TOKENS（デフォルト: 4096）: バッチで送る評価リクエストの最大出力トークン数
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+from datetime import datetime
+
+from autogen_core.models import SystemMessage, UserMessage
+
+BATCH_STATE_FILENAME = "batches.json"
+# まとめた評価リクエストの見出し（fake_llm_server.PACKED_CONVERSATION_PATTERN と対応させる）
+PACKED_CONVERSATION_HEADER = "=== 会話 {} ==="
+PACKED_EVALUATION_PATTERN = re.compile(r"^=== 評価 (\S+) ===[ \t]*$", re.MULTILINE)
+
+logger = logging.getLogger("ConversationTest.BatchEval")
+
+
+class AnthropicBatchEvaluator:
+    """Message Batches API による評価（送信・ポーリング・結果の取得）"""
+
+    def __init__(self, test_system, state_path, max_requests: int = 10000, poll_interval: float = 30.0):
+        provider = test_system.settings.provider_of("evaluator")
+        if provider != "anthropic":
+            raise ValueError(f"バッチ API による評価は anthropic のみ対応しています（評価のプロバイダ: {provider}）。"
+                             "--eval-backend packed を使ってください。")
+        try:
+            from anthropic import AsyncAnthropic
+        except ImportError:
+            raise ImportError("必要なパッケージがインストールされていません。pip install anthropic を実行してください")
+
+        self.test_system = test_system
+        self.state_path = state_path
+        self.max_requests = max_requests
+        self.poll_interval = poll_interval
+        self.client = AsyncAnthropic(
+            api_key=test_system._get_api_key('ANTHROPIC_API_KEY'),
+            base_url=os.getenv('ANTHROPIC_BASE_URL') or None,
+        )
+
+    @classmethod
+    def from_env(cls, test_system, state_path):
+        return cls(
+            test_system,
+            state_path,
+            max_requests=int(os.getenv('BATCH_MAX_REQUESTS', '10000')),
+            poll_interval=float(os.getenv('BATCH_POLL_INTERVAL', '30')),
+        )
+
+    def _load_state(self) -> dict:
+        """送信済みで結果を未取得のバッチ {バッチID: {"custom_ids": [...], "submitted_at": ...}}"""
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self, state: dict):
+        tmp_path = self.state_path.with_suffix(".json.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.state_path)
+
+    def _params(self, evaluation_input: str) -> dict:
+        system = self.test_system.evaluator_prompt
+        if self.test_system.prompt_cache_enabled:
+            # 評価プロンプトはバッチ内の全リクエストで共通のため、プロンプトキャッシュの対象にする
+            system = [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+        return {
+            "model": self.test_system.evaluator_model_name,
+            "max_tokens": int(os.getenv('EVALUATOR_MAX_TOKENS', '4096')),
+            "system": system,
+            "messages": [{"role": "user", "content": evaluation_input}],
+        }
+
+    async def evaluate(self, items: dict, on_result):
+        """items（{custom_id: 評価エージェントへの入力}）を評価し、1件ごとに on_result を呼ぶ
+
+        on_result(custom_id, evaluation, error, batch_id): evaluation は評価テキスト（失敗時は None と error）
+        """
+        state = self._load_state()
+        waiting = {}
+        for batch_id, entry in state.items():
+            custom_ids = [custom_id for custom_id in entry["custom_ids"] if custom_id in items]
+            if custom_ids:
+                waiting[batch_id] = custom_ids
+        if waiting:
+            print(f"⏯  送信済みのバッチの結果を待ちます: {len(waiting)}件")
+
+        submitted = {custom_id for custom_ids in waiting.values() for custom_id in custom_ids}
+        to_submit = [custom_id for custom_id in items if custom_id not in submitted]
+        for start in range(0, len(to_submit), self.max_requests):
+            chunk = to_submit[start:start + self.max_requests]
+            batch = await self.client.messages.batches.create(requests=[
+                {"custom_id": custom_id, "params": self._params(items[custom_id])} for custom_id in chunk
+            ])
+            state[batch.id] = {"custom_ids": chunk, "submitted_at": datetime.now().isoformat()}
+            self._save_state(state)
+            waiting[batch.id] = chunk
+            logger.info(f"Submitted batch {batch.id} with {len(chunk)} requests")
+            print(f"📦 バッチ送信: {batch.id} ({len(chunk)}件)")
+
+        async def collect(batch_id: str, custom_ids: list):
+            await self._collect(batch_id, custom_ids, on_result)
+            # 結果を書き戻したバッチは記録から外す（同じプロンプトで再実行しても送信し直さない）
+            state.pop(batch_id, None)
+            self._save_state(state)
+
+        await asyncio.gather(*[collect(batch_id, custom_ids) for batch_id, custom_ids in waiting.items()])
+
+    async def _collect(self, batch_id: str, custom_ids: list, on_result):
+        from anthropic import NotFoundError
+
+        started = time.monotonic()
+        try:
+            while True:
+                batch = await self.client.messages.batches.retrieve(batch_id)
+                if batch.processing_status == "ended":
+                    break
+                logger.info(f"Batch {batch_id}: {batch.processing_status} {batch.request_counts}")
+                await asyncio.sleep(self.poll_interval)
+        except NotFoundError as e:
+            # 期限切れなどで参照できないバッチは失敗とし、次回の実行で送信し直す
+            logger.warning(f"Batch {batch_id} not found: {e}")
+            for custom_id in custom_ids:
+                on_result(custom_id, None, f"バッチが見つかりません: {batch_id}", batch_id)
+            return
+
+        counts = batch.request_counts
+        print(f"📬 バッチ完了: {batch_id} (成功: {counts.succeeded}件, 失敗: {counts.errored}件, "
+              f"期限切れ: {counts.expired}件, 取り消し: {counts.canceled}件)")
+        latency = round(time.monotonic() - started, 4)
+        pending = set(custom_ids)
+        async for response in await self.client.messages.batches.results(batch_id):
+            if response.custom_id not in pending:
+                continue
+            pending.discard(response.custom_id)
+            result = response.result
+            if result.type == "succeeded":
+                message = result.message
+                text = "".join(block.text for block in message.content if block.type == "text")
+                self._record_metrics(message, latency, batch_id)
+                on_result(response.custom_id, text, None, batch_id)
+            else:
+                error = getattr(getattr(result, "error", None), "error", None)
+                detail = f"{error.type}: {error.message}" if error is not None else result.type
+                self._record_metrics(None, latency, batch_id, error=detail)
+                on_result(response.custom_id, None, detail, batch_id)
+        for custom_id in pending:
+            on_result(custom_id, None, f"バッチの結果に含まれていません: {batch_id}", batch_id)
+
+    def _record_metrics(self, message, latency: float, batch_id: str, error: str = None):
+        """評価1件分の呼び出しレコード（レイテンシはバッチの結果を待ち始めてからの時間）"""
+        usage = getattr(message, "usage", None)
+        self.test_system.metrics.record({
+            "timestamp": datetime.now().isoformat(),
+            "session_id": self.test_system.metrics.session_id,
+            "role": "evaluator",
+            "model": self.test_system.evaluator_model_name,
+            "latency_seconds": latency,
+            "prompt_tokens": getattr(usage, "input_tokens", None),
+            "completion_tokens": getattr(usage, "output_tokens", None),
+            "cache_read_tokens": getattr(usage, "cache_read_input_tokens", None),
+            "cache_write_tokens": getattr(usage, "cache_creation_input_tokens", None),
+            "retries": 0,
+            "cached": False,
+            "error": error,
+            "batch_id": batch_id,
+        })
+
+    async def close(self):
+        await self.client.close()
+
+
+class PackedEvaluator:
+    """複数の会話を1つの評価リクエストにまとめて評価する"""
+
+    def __init__(self, test_system, pack_size: int = 5):
+        if pack_size < 1:
+            raise ValueError("pack_size は1以上を指定してください。")
+        self.test_system = test_system
+        self.pack_size = pack_size
+
+    @staticmethod
+    def build_input(conversations: list) -> str:
+        """評価エージェントへの入力（conversations は会話ごとのメッセージのリスト）"""
+        sections = []
+        for number, messages in enumerate(conversations, start=1):
+            lines = "\n".join(f"[{msg['source']}]: {msg['content']}" for msg in messages)
+            sections.append(f"{PACKED_CONVERSATION_HEADER.format(number)}\n{lines}")
+        return (
+            f"以下の{len(conversations)}件の会話ログを、それぞれ独立に評価してください。\n"
+            "各会話の評価は「=== 評価 <番号> ===」の見出しの行に続けて、1件だけを評価する場合と同じ形式で書いてください。\n\n"
+            + "\n\n".join(sections)
+        )
+
+    @staticmethod
+    def split_output(text: str) -> dict:
+        """評価テキストを "=== 評価 <番号> ===" の節ごとに分割する（{番号: 評価テキスト}）"""
+        matches = list(PACKED_EVALUATION_PATTERN.finditer(text or ""))
+        sections = {}
+        for i, match in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            content = text[match.end():end].strip()
+            if content:
+                sections[match.group(1)] = content
+        return sections
+
+    async def evaluate(self, conversations: list) -> list:
+        """会話ごとの評価テキストを返す（節が見つからない会話は None）"""
+        result = await self.test_system.evaluator_model_client.create([
+            SystemMessage(content=self.test_system.evaluator_prompt),
+            UserMessage(content=self.build_input(conversations), source="user"),
+        ])
+        content = result.content if isinstance(result.content, str) else str(result.content)
+        sections = self.split_output(content)
+        return [sections.get(str(number)) for number in range(1, len(conversations) + 1)]
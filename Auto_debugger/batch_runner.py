@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+複数シナリオの一括実行（バッチモード）
+
+シナリオファイル（JSONL / YAML）を読み込み、同一の asyncio ループ上で
+複数の会話テストを同時実行する。各セッションのログは個別のディレクトリに保存し、
+全体の結果は summary.json にまとめる。
+
+同じ出力ディレクトリを指定して再実行すると、完了済みのセッションはスキップし、
+途中で失敗したセッションはチェックポイントから再開する。
+
+シナリオファイルの形式:
+- JSONL: 1行1シナリオ {"id": "...", "scenario": "...", "initial_message": "...", "max_turns": 40}
+  （セッションごとに "api_provider" と "customer_persona_file" も指定できる）
+- YAML: 上記と同じキーを持つリスト、または {"scenarios": [...]}
+  （"scenario" 以外は省略可。文字列だけの要素はシナリオ本文として扱う）
+"""
+
+import json
+import asyncio
+import logging
+import time
+from pathlib import Path
+from datetime import datetime
+
+from auto_debugging import ConversationTestingSystem
+from log_config import (
+    current_session_id, session_log_router, add_log_handler, remove_log_handler, rotating_file_handler, outside_session,
+)
+from metrics import global_metrics
+from checkpoint import checkpoint_path, load_checkpoint, STATUS_COMPLETE
+
+DEFAULT_INITIAL_MESSAGE = "こんにちは。"
+
+
+def _normalize_scenario(entry, index: int) -> dict:
+    """シナリオ定義を共通の辞書形式に揃える"""
+    if isinstance(entry, str):
+        entry = {"scenario": entry}
+    if not isinstance(entry, dict) or not entry.get("scenario"):
+        raise ValueError(f"シナリオ定義が不正です（{index}件目）: {entry!r}")
+
+    return {
+        "id": str(entry.get("id") or f"s{index:04d}"),
+        "scenario": entry["scenario"],
+        "initial_message": entry.get("initial_message") or DEFAULT_INITIAL_MESSAGE,
+        "max_turns": entry.get("max_turns"),
+        "api_provider": entry.get("api_provider"),
+        "customer_persona_file": entry.get("customer_persona_file"),
+    }
+
+
+def load_scenarios(path) -> list:
+    """シナリオファイル（JSONL / YAML）の読み込み"""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"シナリオファイルが見つかりません: {path}")
+
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("YAML形式のシナリオには PyYAML が必要です。pip install pyyaml を実行してください")
+        with open(path, 'r', encoding='utf-8') as f:
+            data = yaml.safe_load(f) or []
+        if isinstance(data, dict):
+            data = data.get("scenarios", [])
+    else:
+        data = []
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    data.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"シナリオファイルの{line_no}行目を解析できません: {e}")
+
+    scenarios = [_normalize_scenario(entry, i) for i, entry in enumerate(data)]
+
+    seen = set()
+    for scenario in scenarios:
+        if scenario["id"] in seen:
+            raise ValueError(f"シナリオIDが重複しています: {scenario['id']}")
+        seen.add(scenario["id"])
+    return scenarios
+
+
+def _result_summary(result: dict) -> dict:
+    """run_conversation_test の結果からサマリーに載せる項目を取り出す"""
+    return {
+        "total_turns": result["total_turns"],
+        "conversation_ended_naturally": result["conversation_ended_naturally"],
+        "termination_reason": result["termination_reason"],
+        "time_to_first_turn_seconds": result["time_to_first_turn_seconds"],
+        "mean_turn_latency_seconds": (
+            round(sum(result["turn_latencies_seconds"]) / len(result["turn_latencies_seconds"]), 3)
+            if result["turn_latencies_seconds"] else None
+        ),
+        "evaluation": result["evaluation"],
+        "log_file_json": result["log_file_json"],
+        "log_file_system": result["log_file_system"],
+        "log_file_metrics": result["log_file_metrics"],
+        "metrics": result["metrics"],
+        "context": result["context"],
+    }
+
+
+async def _run_session(scenario: dict, output_dir: Path, default_max_turns: int, semaphore: asyncio.Semaphore) -> dict:
+    """1セッションの実行（同時実行数はセマフォで制限）"""
+    session_id = scenario["id"]
+    max_turns = scenario["max_turns"] or default_max_turns
+    summary = {
+        "id": session_id,
+        "scenario": scenario["scenario"],
+        "max_turns": max_turns,
+        "status": "failed",
+    }
+
+    session_dir = output_dir / session_id
+    checkpoint = load_checkpoint(checkpoint_path(session_dir, session_id))
+    if checkpoint and checkpoint.get("status") == STATUS_COMPLETE:
+        # 前回の実行で完了済み: 保存済みの結果をそのまま使う
+        summary.update(_result_summary(checkpoint["result"]), status="skipped")
+        print(f"⏭  [{session_id}] 完了済みのためスキップ")
+        return summary
+
+    async with semaphore:
+        # このタスク内で発生したログ（autogen内部を含む）をセッションのログファイルへ振り分ける
+        current_session_id.set(session_id)
+        started = time.monotonic()
+        try:
+            test_system = ConversationTestingSystem(
+                session_id=session_id,
+                log_dir=session_dir,
+                verbose=False,
+                api_provider=scenario.get("api_provider"),
+                customer_persona_file=scenario.get("customer_persona_file"),
+            )
+            result = await test_system.run_conversation_test(
+                scenario_description=scenario["scenario"],
+                initial_message_content=scenario["initial_message"],
+                max_turns=max_turns,
+                resume=True,
+            )
+            summary["resumed_from_turn"] = checkpoint["agent_turns"] if checkpoint else None
+            if result:
+                summary.update(_result_summary(result), status="ok", stats=test_system.get_conversation_stats())
+            else:
+                summary["error"] = "run_conversation_test returned no result"
+        except Exception as e:
+            logging.getLogger("BatchRunner").error(f"Session {session_id} failed: {e}", exc_info=True)
+            summary["error"] = str(e)
+        finally:
+            summary["elapsed_seconds"] = round(time.monotonic() - started, 3)
+            session_log_router.unregister(session_id)
+
+    status_mark = "✅" if summary["status"] == "ok" else "❌"
+    print(f"{status_mark} [{session_id}] {summary['status']} ({summary['elapsed_seconds']}s)")
+    return summary
+
+
+def default_output_dir() -> Path:
+    return Path("logs") / f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+
+def add_batch_log_handler(path) -> logging.Handler:
+    """セッションに属さないログレコードを path に書き込むハンドラを追加"""
+    handler = rotating_file_handler(path)
+    handler.addFilter(outside_session)
+    return add_log_handler(handler)
+
+
+def write_batch_summary(output_dir: Path, sessions: list, concurrency: int, started_at: str,
+                        elapsed_seconds: float, metrics=global_metrics, **extra) -> dict:
+    """summary.json と metrics.prom を書き出し、結果を表示する"""
+    succeeded = [s for s in sessions if s["status"] in ("ok", "skipped")]
+    summary = {
+        "started_at": started_at,
+        "output_dir": str(output_dir),
+        "concurrency": concurrency,
+        **extra,
+        "total_sessions": len(sessions),
+        "succeeded": len(succeeded),
+        "failed": len(sessions) - len(succeeded),
+        "skipped": sum(1 for s in sessions if s["status"] == "skipped"),
+        "ended_naturally": sum(1 for s in succeeded if s.get("conversation_ended_naturally")),
+        "elapsed_seconds": round(elapsed_seconds, 3),
+        "metrics": metrics.summary(),
+        "sessions": sessions,
+    }
+
+    summary_file = output_dir / "summary.json"
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    with open(output_dir / "metrics.prom", 'w', encoding='utf-8') as f:
+        f.write(metrics.to_prometheus())
+
+    print("\n📊 バッチ実行結果")
+    print("-" * 40)
+    print(f"  成功: {summary['succeeded']} / {summary['total_sessions']} (完了済みでスキップ: {summary['skipped']})")
+    print(f"  自然終了 (DONE): {summary['ended_naturally']}")
+    print(f"  所要時間: {summary['elapsed_seconds']}秒")
+    for role, role_summary in summary["metrics"].items():
+        print(f"  [{role}] 呼び出し: {role_summary['calls']}回, "
+              f"p50/p95/p99: {role_summary['latency_p50_seconds']}/{role_summary['latency_p95_seconds']}/{role_summary['latency_p99_seconds']}秒")
+    print(f"💾 サマリー: {summary_file}")
+    return summary
+
+
+async def run_batch(scenarios: list, concurrency: int = 4, max_turns: int = 100, output_dir=None) -> dict:
+    """シナリオ一覧を同時実行数 concurrency で実行し、結果サマリーを返す"""
+    if concurrency < 1:
+        raise ValueError("concurrency は1以上を指定してください。")
+
+    output_dir = Path(output_dir or default_output_dir())
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # バッチ全体のログ（セッションに属さないレコード）
+    batch_handler = add_batch_log_handler(output_dir / "batch.log")
+
+    print(f"🚀 バッチ実行開始: {len(scenarios)}件 (同時実行数: {concurrency})")
+    print(f"💾 出力先: {output_dir}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started_at = datetime.now().isoformat()
+    started = time.monotonic()
+    try:
+        sessions = await asyncio.gather(*[
+            _run_session(scenario, output_dir, max_turns, semaphore)
+            for scenario in scenarios
+        ])
+    finally:
+        remove_log_handler(batch_handler)
+
+    return write_batch_summary(output_dir, sessions, concurrency, started_at, time.monotonic() - started)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+会話テストの負荷試験（疑似 LLM サーバーに対するバッチ実行）
+
+fake_llm_server.py を別プロセスで起動してクライアントのベース URL を向け、
+同時実行数を段階的に上げながら（デフォルト: 1, 10, 100, 1000）バッチ実行を行い、
+オーケストレーション層（エージェント生成・メッセージの正規化・ログ出力・評価など）のコストを計測する。
+
+各段階は新しいプロセスで実行し、次の値を報告する:
+- sessions/sec, turns/sec: 完了したセッション数・ターン数のスループット
+- overhead ms/turn: セッションの所要時間からモデル呼び出し（疑似サーバーの応答待ち）を除いた、1ターンあたりの時間
+- peak RSS: 段階の実行中のプロセスの最大常駐メモリ
+
+使い方:
+    python benchmark.py --levels 1,10,100,1000 --max-turns 6 --latency lognormal:0.2,0.5
+    python benchmark.py --provider gemini --stream --error-rate 0.01
+
+結果は <出力先>/benchmark.json に保存する（デフォルト: logs/benchmark_YYYYMMDD_HHMMSS/）。
+結果データベースへの記録（RESULTS_DB）と堂々巡りの検知は無効にして実行する（全セッションが最大ターン数まで進む）。
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import multiprocessing
+import urllib.request
+from pathlib import Path
+from datetime import datetime
+from contextlib import redirect_stdout
+
+from fake_llm_server import raise_open_file_limit, peak_rss_mb
+
+SERVER_SCRIPT = Path(__file__).with_name("fake_llm_server.py")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _server_stats(base_url: str, reset: bool = False) -> dict:
+    request = urllib.request.Request(f"{base_url}/stats/reset", data=b"") if reset else f"{base_url}/stats"
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.load(response)
+
+
+def start_server(args) -> tuple:
+    """疑似 LLM サーバーを別プロセスで起動し、(プロセス, ベース URL) を返す"""
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, str(SERVER_SCRIPT), "--port", str(port),
+        "--latency", args.latency, "--token-interval", args.token_interval,
+        "--output-tokens", args.output_tokens, "--error-rate", str(args.error_rate),
+        "--error-status", args.error_status,
+    ], stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            _server_stats(base_url)
+            return process, base_url
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("疑似 LLM サーバーを起動できませんでした。")
+            time.sleep(0.1)
+
+
+def benchmark_env(provider: str, base_url: str, stream: bool) -> dict:
+    """段階を実行するプロセスの環境変数（実際の API キーは疑似サーバーに送らない）"""
+    return {
+        "API_PROVIDER": provider,
+        "ANTHROPIC_BASE_URL": base_url,
+        "GEMINI_API_BASE_URL": f"{base_url}/v1beta",
+        "ANTHROPIC_API_KEY": "fake-key",
+        "GOOGLE_API_KEY": "fake-key",
+        "MODEL_CACHE_MODE": "passthrough",
+        "MODEL_CLIENT_STREAM": "1" if stream else "0",
+        "RESULTS_DB": "none",
+        "LOOP_DETECTION": "0",
+        "RETRY_BASE_DELAY": os.getenv("RETRY_BASE_DELAY", "0.05"),
+    }
+
+
+async def _run_level_async(concurrency: int, sessions: int, max_turns: int, output_dir: Path) -> dict:
+    from batch_runner import run_batch, _normalize_scenario
+    from client_pool import shared_pool
+
+    scenarios = [
+        _normalize_scenario({"id": f"bench{i:05d}", "scenario": "家電量販店でスマホを見ていたところ声をかけられた"}, i)
+        for i in range(sessions)
+    ]
+    try:
+        return await run_batch(scenarios, concurrency=concurrency, max_turns=max_turns, output_dir=output_dir)
+    finally:
+        await shared_pool.close_all()
+
+
+def run_level(concurrency: int, sessions: int, max_turns: int, output_dir: str, env: dict) -> dict:
+    """1段階分のバッチ実行（新しいプロセスで呼ぶ）"""
+    os.environ.update(env)
+    raise_open_file_limit()
+    import batch_runner  # noqa: F401  インポート後のメモリを基準にする
+    from metrics import global_metrics
+
+    rss_before = peak_rss_mb()
+    started = time.monotonic()
+    with redirect_stdout(io.StringIO()):
+        summary = asyncio.run(_run_level_async(concurrency, sessions, max_turns, Path(output_dir)))
+    elapsed = time.monotonic() - started
+
+    succeeded = [s for s in summary["sessions"] if s["status"] == "ok"]
+    turns = sum(s.get("total_turns") or 0 for s in succeeded)
+    session_seconds = sum(s.get("elapsed_seconds") or 0 for s in succeeded)
+    succeeded_ids = {s["id"] for s in succeeded}
+    model_seconds = sum(e["latency_seconds"] for e in global_metrics.records if e.get("session_id") in succeeded_ids)
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "succeeded": len(succeeded),
+        "turns": turns,
+        "elapsed_seconds": round(elapsed, 3),
+        "sessions_per_second": round(len(succeeded) / elapsed, 3) if elapsed else None,
+        "turns_per_second": round(turns / elapsed, 3) if elapsed else None,
+        "overhead_ms_per_turn": round((session_seconds - model_seconds) / turns * 1000, 3) if turns else None,
+        "model_calls": len(global_metrics.records),
+        "model_errors": sum(1 for e in global_metrics.records if e.get("error") is not None),
+        "rss_after_import_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_results(results: list):
+    print("\n📊 負荷試験結果")
+    print("-" * 96)
+    print(f"{'conc':>6} {'ok/sessions':>12} {'elapsed(s)':>10} {'sess/s':>8} {'turns/s':>8} "
+          f"{'ovh ms/turn':>11} {'peak RSS':>9} {'srv in-flight':>13}")
+    for r in results:
+        print(f"{r['concurrency']:>6} {r['succeeded']:>5}/{r['sessions']:<6} {r['elapsed_seconds']:>10} "
+              f"{r['sessions_per_second']:>8} {r['turns_per_second']:>8} {r['overhead_ms_per_turn'] or '-':>11} "
+              f"{r['peak_rss_mb']:>7}MB {r['server']['peak_in_flight']:>13}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="疑似 LLM サーバーを使った会話テストの負荷試験")
+    parser.add_argument("--levels", default="1,10,100,1000", help="同時実行数の段階（カンマ区切り）")
+    parser.add_argument("--sessions", type=int, default=None,
+                        help="各段階のセッション数 (デフォルト: 同時実行数と20の大きい方)")
+    parser.add_argument("--max-turns", type=int, default=6, help="1セッションの最大ターン数 (デフォルト: 6)")
+    parser.add_argument("--provider", default="anthropic", choices=["anthropic", "gemini"])
+    parser.add_argument("--stream", action="store_true", help="顧客・スタッフの応答をストリーミングで受け取る")
+    parser.add_argument("--latency", default="fixed:0.05", help="疑似サーバーの応答待ち時間の分布")
+    parser.add_argument("--token-interval", default="fixed:0", help="ストリーミング時のトークン間隔の分布")
+    parser.add_argument("--output-tokens", default="uniform:20,60", help="出力トークン数の分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="疑似サーバーがエラーを返す割合")
+    parser.add_argument("--error-status", default="429,500,529")
+    parser.add_argument("--output-dir", default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    levels = [int(level) for level in args.levels.split(",") if level.strip()]
+    output_dir = Path(args.output_dir or Path("logs") / f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    process, base_url = start_server(args)
+    print(f"🧪 疑似 LLM サーバー: {base_url} (latency={args.latency}, error_rate={args.error_rate})")
+    env = benchmark_env(args.provider, base_url, args.stream)
+    started_at = datetime.now().isoformat()
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for concurrency in levels:
+            sessions = args.sessions or max(concurrency, 20)
+            print(f"🚀 同時実行数 {concurrency}: {sessions}セッション × 最大{args.max_turns}ターン")
+            before = _server_stats(base_url, reset=True)
+            with context.Pool(1) as pool:
+                result = pool.apply(run_level, (
+                    concurrency, sessions, args.max_turns, str(output_dir / f"c{concurrency}"), env,
+                ))
+            after = _server_stats(base_url)
+            result["server"] = {
+                "requests": after["requests"] - before["requests"],
+                "errors": after["errors"] - before["errors"],
+                "streamed": after["streamed"] - before["streamed"],
+                "peak_in_flight": after["peak_in_flight"],
+                "peak_connections": after["peak_connections"],
+            }
+            results.append(result)
+            print(f"   {result['sessions_per_second']} sessions/s, "
+                  f"オーバーヘッド {result['overhead_ms_per_turn']} ms/turn, peak RSS {result['peak_rss_mb']} MB")
+    finally:
+        process.terminate()
+        process.wait()
+
+    print_results(results)
+    report = {
+        "started_at": started_at,
+        "provider": args.provider,
+        "stream": args.stream,
+        "max_turns": args.max_turns,
+        "server": {"latency": args.latency, "token_interval": args.token_interval,
+                   "output_tokens": args.output_tokens, "error_rate": args.error_rate},
+        "results": results,
+    }
+    with open(output_dir / "benchmark.json", 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 結果: {output_dir / 'benchmark.json'}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
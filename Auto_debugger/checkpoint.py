@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+長い会話のチェックポイント（途中状態の保存と再開）
+
+会話は CHECKPOINT_EVERY ターンごとの区間に分けて実行し、区間の終わり（チームが停止している時点）で
+RoundRobinGroupChat.save_state() の状態（各 AssistantAgent のモデルコンテキストとラウンドロビンの順番を含む）を
+会話ログ・レイテンシと一緒に checkpoint_<タグ>.json に保存する。
+実行中のチームの状態は一貫しないことがあるため、保存は区間の境界でのみ行う。
+
+ネットワークエラー等で失敗した場合は最後に保存した区間の状態を status="failed" として残し、
+再開時はその状態から会話を続ける（失われるのは最大で CHECKPOINT_EVERY - 1 ターン）。
+
+ステータス:
+- running: 実行中（区間の境界で保存）
+- failed: 失敗（最後の区間の境界から再開できる）
+- complete: 完了（result に結果を保持。バッチ実行では再実行しない）
+"""
+
+import os
+import json
+import logging
+from pathlib import Path
+from datetime import datetime
+
+CHECKPOINT_VERSION = 1
+
+STATUS_RUNNING = "running"
+STATUS_FAILED = "failed"
+STATUS_COMPLETE = "complete"
+
+logger = logging.getLogger("ConversationTest.Checkpoint")
+
+
+def checkpoint_path(log_dir, file_tag: str) -> Path:
+    return Path(log_dir) / f"checkpoint_{file_tag}.json"
+
+
+def save_checkpoint(path, checkpoint: dict):
+    """チェックポイントを一時ファイル経由で書き込む（書き込み途中のクラッシュで壊れないように）"""
+    path = Path(path)
+    checkpoint = {**checkpoint, "version": CHECKPOINT_VERSION, "saved_at": datetime.now().isoformat()}
+    tmp_path = path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """チェックポイントの読み込み（存在しない・読めない場合は None）"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Checkpoint {path} could not be read: {e}")
+        return None
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        logger.warning(f"Checkpoint {path} has unsupported version {checkpoint.get('version')}")
+        return None
+    return checkpoint
+
+
+def is_complete(path) -> bool:
+    checkpoint = load_checkpoint(path)
+    return bool(checkpoint) and checkpoint.get("status") == STATUS_COMPLETE
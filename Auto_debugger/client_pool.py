@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+セッション間で共有するモデルクライアントのプール
+
+- (プロバイダ, モデル) ごとにクライアントを1つだけ生成し、全セッションで使い回す（HTTP接続の再利用）
+- プロバイダごとのトークンバケットで、リクエスト数/分とトークン数/分を制限する
+- 429 / 5xx / 接続エラーはジッター付き指数バックオフで再試行する
+- クライアントのクローズはプロセス終了時（close_all）のみ
+
+環境変数:
+- ANTHROPIC_RPM / ANTHROPIC_TPM, GEMINI_RPM / GEMINI_TPM: 1分あたりのリクエスト数/トークン数の上限（未設定なら無制限）
+- RETRY_MAX_ATTEMPTS（デフォルト: 5）, RETRY_BASE_DELAY（秒, 1.0）, RETRY_MAX_DELAY（秒, 60.0）
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+
+from model_clients import DelegatingChatCompletionClient
+from metrics import call_retries
+from context_policy import estimate_tokens
+
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+RETRYABLE_ERROR_NAMES = {"APIConnectionError", "APITimeoutError", "TimeoutException", "ConnectError", "ReadTimeout"}
+
+logger = logging.getLogger("ConversationTest.ClientPool")
+
+
+class TokenBucket:
+    """1分あたり rate_per_minute 単位を補充するトークンバケット"""
+
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        """amount 単位が使えるようになるまで待って消費する"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        """見積もりとの差分など、事後に判明した消費を反映する（負の残高も許容）"""
+        self._refill()
+        self.tokens -= amount
+
+
+def status_code_of(error) -> int:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error) -> bool:
+    """再試行すべきエラーか（レート制限・サーバーエラー・接続エラー）"""
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES or isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+
+def retry_after_of(error):
+    """Retry-After ヘッダー（秒）があれば返す"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitedChatCompletionClient(DelegatingChatCompletionClient):
+    """レート制限と再試行を行うクライアント（プール内で共有される）"""
+
+    def __init__(self, inner, request_bucket: TokenBucket = None, token_bucket: TokenBucket = None,
+                 max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        super().__init__(inner)
+        self.request_bucket = request_bucket
+        self.token_bucket = token_bucket
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def _throttle(self, messages) -> int:
+        estimated = sum(estimate_tokens(m) for m in messages)
+        if self.request_bucket:
+            await self.request_bucket.acquire(1)
+        if self.token_bucket:
+            await self.token_bucket.acquire(estimated)
+        return estimated
+
+    def _settle(self, result, estimated: int):
+        usage = getattr(result, "usage", None)
+        if self.token_bucket and usage is not None:
+            self.token_bucket.consume(usage.prompt_tokens + usage.completion_tokens - estimated)
+
+    async def _backoff(self, attempt: int, error):
+        # Full jitter: 0〜min(上限, 基準×2^attempt) の一様乱数。Retry-After があればそれ以上待つ
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        retry_after = retry_after_of(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        call_retries.set(call_retries.get() + 1)
+        logger.warning(f"Retrying model call in {delay:.2f}s (attempt {attempt + 1}/{self.max_attempts - 1}): {type(error).__name__}: {error}")
+        await asyncio.sleep(delay)
+
+    async def create(self, messages, **kwargs):
+        for attempt in range(self.max_attempts):
+            estimated = await self._throttle(messages)
+            try:
+                result = await self.inner.create(messages, **kwargs)
+            except Exception as e:
+                if attempt + 1 >= self.max_attempts or not is_retryable(e):
+                    raise
+                await self._backoff(attempt, e)
+                continue
+            self._settle(result, estimated)
+            return result
+
+    async def create_stream(self, messages, **kwargs):
+        for attempt in range(self.max_attempts):
+            estimated = await self._throttle(messages)
+            started = False
+            try:
+                async for chunk in self.inner.create_stream(messages, **kwargs):
+                    started = True
+                    if not isinstance(chunk, str):
+                        self._settle(chunk, estimated)
+                    yield chunk
+                return
+            except Exception as e:
+                # 出力を返し始めた後の失敗は再試行すると重複するため、そのまま送出する
+                if started or attempt + 1 >= self.max_attempts or not is_retryable(e):
+                    raise
+                await self._backoff(attempt, e)
+
+
+def _env_float(name: str):
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+class ClientPool:
+    """(プロバイダ, モデル) ごとに共有クライアントを保持するプール"""
+
+    def __init__(self):
+        self._clients = {}
+        self._buckets = {}
+
+    def _provider_buckets(self, provider: str):
+        if provider not in self._buckets:
+            prefix = provider.upper()
+            rpm = _env_float(f"{prefix}_RPM")
+            tpm = _env_float(f"{prefix}_TPM")
+            self._buckets[provider] = (
+                TokenBucket(rpm) if rpm else None,
+                TokenBucket(tpm) if tpm else None,
+            )
+            logger.info(f"Rate limits for {provider}: rpm={rpm or 'unlimited'}, tpm={tpm or 'unlimited'}")
+        return self._buckets[provider]
+
+    def get(self, provider: str, model: str, factory):
+        """共有クライアントを取得（未作成なら factory() で生成してプールに登録）"""
+        key = (provider, model)
+        if key not in self._clients:
+            request_bucket, token_bucket = self._provider_buckets(provider)
+            self._clients[key] = RateLimitedChatCompletionClient(
+                factory(),
+                request_bucket=request_bucket,
+                token_bucket=token_bucket,
+                max_attempts=int(os.getenv('RETRY_MAX_ATTEMPTS', '5')),
+                base_delay=float(os.getenv('RETRY_BASE_DELAY', '1.0')),
+                max_delay=float(os.getenv('RETRY_MAX_DELAY', '60.0')),
+            )
+            logger.info(f"Pooled client created: {provider}:{model}")
+        return self._clients[key]
+
+    async def close_all(self):
+        """プール内の全クライアントをクローズ（プロセス終了時に呼ぶ）"""
+        clients, self._clients = self._clients, {}
+        for (provider, model), client in clients.items():
+            try:
+                await client.close()
+            except Exception as e:
+                logger.error(f"Error closing pooled client {provider}:{model}: {e}", exc_info=True)
+
+
+# プロセス全体で共有するプール
+shared_pool = ClientPool()
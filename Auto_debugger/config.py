@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+実行設定（環境変数）とプロンプトファイルの読み込み・検証
+
+autogen やプロバイダの SDK を import せずに使えるモジュール。起動時にはここで設定を解決・検証するだけにし、
+モデルクライアントとエージェントは実際に使うロールの分だけ、最初に使う時点で作成する
+（auto_debugging.ConversationTestingSystem）。バッチのワーカーの起動や、1件の会話ログの再評価のような
+短い実行で、使わないクライアントの作成や agent スタックの import を待たずに済む。
+
+- RunSettings: API_PROVIDER・モデル名・ルーティング・応答キャッシュ・履歴の制限などの解決と検証
+- read_prompt_file: プロンプトファイルの読み込み（更新時刻・サイズが変わらない限りプロセス内で再利用する）
+- check_config: 設定・API キー・必要なパッケージ・プロンプトファイルの検証（python auto_debugging.py --check）
+"""
+
+import os
+import logging
+from importlib.util import find_spec
+
+from results_store import content_hash
+
+ROLES = ("customer", "staff", "evaluator")
+CACHE_MODES = ("passthrough", "record", "replay")
+CONTEXT_POLICIES = ("full", "last_n", "token_budget", "summary")
+EVALUATION_MODES = ("inline", "deferred")
+# レイテンシの集計で報告するパーセンタイル（metrics・analytics）
+PERCENTILES = (50, 95, 99)
+
+CUSTOMER_PERSONA_FILE = "customer_persona.md"
+STAFF_PERSONA_FILE = "staff_persona.md"
+EVALUATOR_PROMPT_FILE = "evaluator_prompt.md"
+
+# プロバイダごとの API キー・モデル名（環境変数名, デフォルト）・クライアントに必要なパッケージ
+PROVIDERS = {
+    "anthropic": {
+        "api_key_env": "ANTHROPIC_API_KEY",
+        "customer_model": ("ANTHROPIC_CUSTOMER_MODEL", "claude-3-haiku-20240307"),
+        "staff_model": ("ANTHROPIC_STAFF_MODEL", "claude-3-5-sonnet-20240620"),
+        "modules": ("autogen_ext", "anthropic"),
+        "package": "autogen-ext[anthropic]",
+    },
+    "gemini": {
+        "api_key_env": "GOOGLE_API_KEY",
+        "customer_model": ("GEMINI_CUSTOMER_MODEL", "gemini-1.5-flash-latest"),
+        "staff_model": ("GEMINI_STAFF_MODEL", "gemini-1.5-flash-latest"),
+        "modules": ("autogen_ext", "openai"),
+        "package": "autogen-ext[openai]",
+    },
+}
+AGENT_MODULES = ("autogen_core", "autogen_agentchat")
+
+logger = logging.getLogger("ConversationTest.Config")
+
+# 読み込んだプロンプトファイル {絶対パス: (更新時刻, サイズ, 内容, 内容ハッシュ)}
+_prompt_files = {}
+
+
+def parse_routes(spec: str) -> list:
+    """"provider:model,provider:model" を [(provider, model), ...] に変換"""
+    routes = []
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        provider, sep, model = item.strip().partition(":")
+        if not sep or not model:
+            raise ValueError(f"ルートの指定が不正です: {item!r}（provider:model の形式で指定してください）")
+        routes.append((provider.strip().lower(), model.strip()))
+    return routes
+
+
+def routes_from_env(role: str) -> list:
+    return parse_routes(os.getenv(f"ROUTE_{role.upper()}"))
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+
+class RunSettings:
+    """環境変数から解決したセッションの実行設定（不正な値は ValueError）"""
+
+    def __init__(self, api_provider: str = None):
+        self.api_provider = (api_provider or os.getenv('API_PROVIDER', 'anthropic')).lower()
+        if self.api_provider not in PROVIDERS:
+            raise ValueError(f"Unsupported API_PROVIDER: {self.api_provider}. Choose 'anthropic' or 'gemini'.")
+        self.cache_mode = os.getenv('MODEL_CACHE_MODE', 'passthrough').lower()
+        if self.cache_mode not in CACHE_MODES:
+            raise ValueError(f"Unsupported MODEL_CACHE_MODE: {self.cache_mode}. Choose one of {', '.join(CACHE_MODES)}.")
+        self.loop_detection = _flag('LOOP_DETECTION', '1')
+        self.checkpoint_every = int(os.getenv('CHECKPOINT_EVERY', '10'))
+        # 顧客・スタッフの応答をストリーミングで受け取る（チャンクは記録せず、完成した発言のみ記録する）
+        self.model_client_stream = _flag('MODEL_CLIENT_STREAM', '0')
+        # deferred: 会話の生成のみ行い、評価は後で --evaluate-only（バッチ API など）でまとめて実行する
+        self.evaluation_mode = os.getenv('EVALUATION_MODE', 'inline').lower()
+        if self.evaluation_mode not in EVALUATION_MODES:
+            raise ValueError(f"Unsupported EVALUATION_MODE: {self.evaluation_mode}. Choose 'inline' or 'deferred'.")
+        self.context_policy = os.getenv('CONTEXT_POLICY', 'full').lower()
+        if self.context_policy not in CONTEXT_POLICIES:
+            raise ValueError(f"Unsupported CONTEXT_POLICY: {self.context_policy}. Choose one of {', '.join(CONTEXT_POLICIES)}.")
+        self.prompt_cache_enabled = _flag('PROMPT_CACHE', '0')
+        self.prompt_cache_history = _flag('PROMPT_CACHE_HISTORY', '1')
+
+        # ロールごとのルート（ROUTE_<ROLE>）。設定されたロールは先頭のルートのモデル名を使う
+        provider = PROVIDERS[self.api_provider]
+        self.routes = {role: routes_from_env(role) for role in ROLES}
+        for routes in self.routes.values():
+            for route_provider, _ in routes:
+                if route_provider not in PROVIDERS:
+                    raise ValueError(f"Unsupported provider: {route_provider}. Choose 'anthropic' or 'gemini'.")
+        self.model_names = {
+            "customer": os.getenv(*provider["customer_model"]),
+            "staff": os.getenv(*provider["staff_model"]),
+        }
+        for role in ("customer", "staff"):
+            if self.routes[role]:
+                self.model_names[role] = self.routes[role][0][1]
+        # 評価エージェントはスタッフと同じモデルを使う（ROUTE_EVALUATOR が設定されていなければ）
+        self.model_names["evaluator"] = (self.routes["evaluator"] or [(None, self.model_names["staff"])])[0][1]
+
+    def provider_of(self, role: str) -> str:
+        """ロールが呼び出す（先頭のルートの）プロバイダ（評価エージェントは ROUTE_EVALUATOR がなければスタッフと同じ）"""
+        routes = self.routes[role] or (self.routes["staff"] if role == "evaluator" else [])
+        return routes[0][0] if routes else self.api_provider
+
+    def providers(self) -> list:
+        """いずれかのロールで使うプロバイダ"""
+        used = {self.api_provider} if not (self.routes["customer"] and self.routes["staff"]) else set()
+        used.update(provider for routes in self.routes.values() for provider, _ in routes)
+        return sorted(used)
+
+    def missing_api_keys(self) -> list:
+        """未設定の API キーの環境変数名（replay モードではオフライン実行のため不要）"""
+        if self.cache_mode == 'replay':
+            return []
+        return [PROVIDERS[p]["api_key_env"] for p in self.providers() if not os.getenv(PROVIDERS[p]["api_key_env"])]
+
+    def missing_packages(self) -> list:
+        """インストールされていないパッケージ（import せずに find_spec で確認する）"""
+        missing = []
+        for modules, package in [(AGENT_MODULES, "autogen-agentchat")] + [
+                (PROVIDERS[p]["modules"], PROVIDERS[p]["package"]) for p in self.providers()]:
+            if any(find_spec(module) is None for module in modules) and package not in missing:
+                missing.append(package)
+        return missing
+
+
+def read_prompt_file(path) -> tuple:
+    """プロンプトファイルの (内容（前後の空白を除く）, 内容ハッシュ)
+
+    バッチ実行ではセッションごとに同じファイルを読むため、更新時刻とサイズが前回と同じなら読み直さない。
+    ファイルがなければ FileNotFoundError。
+    """
+    key = os.path.abspath(path)
+    stat = os.stat(key)
+    cached = _prompt_files.get(key)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2], cached[3]
+    with open(key, 'r', encoding='utf-8') as f:
+        content = f.read().strip()
+    _prompt_files[key] = (stat.st_mtime_ns, stat.st_size, content, content_hash(content))
+    logger.debug(f"Prompt file loaded: {key}")
+    return content, _prompt_files[key][3]
+
+
+def check_config(api_provider: str = None, customer_persona_file: str = None) -> bool:
+    """設定・API キー・必要なパッケージ・プロンプトファイルを検証して結果を表示する（問題がなければ True）"""
+    ok = True
+    print("🔎 設定の検証")
+    print("-" * 40)
+    try:
+        settings = RunSettings(api_provider)
+    except ValueError as e:
+        print(f"❌ 設定: {e}")
+        settings = None
+        ok = False
+
+    if settings is not None:
+        print(f"✅ API_PROVIDER: {settings.api_provider} (MODEL_CACHE_MODE={settings.cache_mode}, "
+              f"CONTEXT_POLICY={settings.context_policy}, EVALUATION_MODE={settings.evaluation_mode})")
+        for role in ROLES:
+            routes = settings.routes[role]
+            if routes:
+                target = ", ".join(f"{p}:{m}" for p, m in routes)
+            elif role == "evaluator":
+                target = "staff と同じクライアント"
+            else:
+                target = f"{settings.api_provider}:{settings.model_names[role]}"
+            print(f"   {role}: {target}")
+        for env_name in settings.missing_api_keys():
+            print(f"❌ {env_name}環境変数が設定されていません。")
+            ok = False
+        for package in settings.missing_packages():
+            print(f"❌ パッケージがインストールされていません: pip install '{package}'")
+            ok = False
+
+    for path, description in (
+        (customer_persona_file or CUSTOMER_PERSONA_FILE, "顧客ペルソナ"),
+        (STAFF_PERSONA_FILE, "スタッフペルソナ"),
+        (EVALUATOR_PROMPT_FILE, "評価プロンプト"),
+    ):
+        try:
+            content, digest = read_prompt_file(path)
+        except OSError as e:
+            print(f"❌ {description}: ファイルを読み込めません: {path} ({e.strerror or e})")
+            ok = False
+            continue
+        if not content:
+            print(f"❌ {description}: ファイルが空です: {path}")
+            ok = False
+        else:
+            print(f"✅ {description}: {path} ({len(content)}文字, ハッシュ {digest})")
+
+    print("-" * 40)
+    print("✅ 設定に問題はありません" if ok else "❌ 設定に問題があります")
+    return ok
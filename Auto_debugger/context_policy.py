@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+エージェントに送る会話履歴（モデルコンテキスト）の長さを制限するポリシー
+
+ターンが進むほど全履歴を送り直すとトークン数とレイテンシが二次的に増えるため、
+送信する履歴を以下のいずれかの方針で絞る（環境変数 CONTEXT_POLICY）:
+- full: 全履歴を送る（従来の挙動・デフォルト）
+- last_n: 最初のメッセージ（シナリオ）＋直近 CONTEXT_LAST_N 件
+- token_budget: 最初のメッセージ＋直近の履歴を CONTEXT_TOKEN_BUDGET トークン以内で
+- summary: 古い履歴を要約モデル（顧客用の軽量モデル）で1件の要約にまとめ、直近 CONTEXT_LAST_N 件と一緒に送る
+
+トークン数は UTF-8 のバイト数から見積もる概算値（日本語1文字 ≒ 1トークン）。
+"""
+
+import os
+import logging
+
+from autogen_core.model_context import ChatCompletionContext
+from autogen_core.models import SystemMessage, UserMessage
+
+from config import CONTEXT_POLICIES
+
+SUMMARY_SOURCE = "ContextSummary"
+
+SUMMARY_PROMPT = """以下はロールプレイ会話の一部です。後続の会話で一貫性を保つために必要な情報
+（話題、相手から得た情報、提示された提案や金額、双方の態度の変化、未解決の質問）を落とさずに、
+簡潔な日本語で要約してください。要約のみを出力してください。"""
+
+logger = logging.getLogger("ConversationTest.ContextPolicy")
+
+
+def estimate_tokens(message) -> int:
+    """メッセージのトークン数の概算"""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return max(1, len(content.encode("utf-8")) // 3) + 4
+
+
+class PolicyChatCompletionContext(ChatCompletionContext):
+    """ポリシーに従って送信する履歴を絞るモデルコンテキスト"""
+
+    def __init__(self, policy: str = "full", last_n: int = 20, token_budget: int = 4000,
+                 summarizer=None, summary_every: int = 6, initial_messages=None):
+        if policy not in CONTEXT_POLICIES:
+            raise ValueError(f"Unsupported CONTEXT_POLICY: {policy}. Choose one of {', '.join(CONTEXT_POLICIES)}.")
+        if policy == "summary" and summarizer is None:
+            raise ValueError("CONTEXT_POLICY=summary には要約用のモデルクライアントが必要です。")
+        super().__init__(initial_messages)
+        self.policy = policy
+        self.last_n = max(1, last_n)
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.summary_every = max(1, summary_every)
+        self._token_counts = []
+        self._summary = None
+        self._summarized_count = 0
+        self.calls = 0
+        self.tokens_full = 0
+        self.tokens_sent = 0
+
+    @classmethod
+    def from_env(cls, summarizer=None):
+        """環境変数 CONTEXT_POLICY / CONTEXT_LAST_N / CONTEXT_TOKEN_BUDGET / CONTEXT_SUMMARY_EVERY から生成"""
+        return cls(
+            policy=os.getenv('CONTEXT_POLICY', 'full').lower(),
+            last_n=int(os.getenv('CONTEXT_LAST_N', '20')),
+            token_budget=int(os.getenv('CONTEXT_TOKEN_BUDGET', '4000')),
+            summarizer=summarizer,
+            summary_every=int(os.getenv('CONTEXT_SUMMARY_EVERY', '6')),
+        )
+
+    def _counts(self) -> list:
+        # 追加済みメッセージのトークン数は一度だけ計算して保持する
+        for message in self._messages[len(self._token_counts):]:
+            self._token_counts.append(estimate_tokens(message))
+        return self._token_counts
+
+    async def clear(self) -> None:
+        await super().clear()
+        self._token_counts = []
+        self._summary = None
+        self._summarized_count = 0
+
+    async def get_messages(self):
+        messages = list(self._messages)
+        counts = self._counts()
+        full_tokens = sum(counts)
+
+        # 件数で絞る方針は last_n 件以内なら全履歴を送る（token_budget は件数によらず予算で判定する）
+        short = len(messages) <= 1 or (self.policy != "token_budget" and len(messages) <= self.last_n + 1)
+        if self.policy == "full" or short:
+            selected, sent_tokens = messages, full_tokens
+        elif self.policy == "last_n":
+            selected = messages[:1] + messages[-self.last_n:]
+            sent_tokens = counts[0] + sum(counts[-self.last_n:])
+        elif self.policy == "token_budget":
+            # 先頭（シナリオ）は必ず残し、新しい発言から予算に収まるだけ含める（最低1件）
+            sent_tokens = counts[0]
+            start = len(messages)
+            while start > 1 and (start == len(messages) or sent_tokens + counts[start - 1] <= self.token_budget):
+                start -= 1
+                sent_tokens += counts[start]
+            selected = messages[:1] + messages[start:]
+        else:
+            selected, sent_tokens = await self._summarized_messages(messages, counts)
+
+        self.calls += 1
+        self.tokens_full += full_tokens
+        self.tokens_sent += sent_tokens
+        return selected
+
+    async def _summarized_messages(self, messages, counts):
+        """先頭＋要約＋未要約の履歴を返す（要約は summary_every 件ごとにまとめて更新）"""
+        aged_end = len(messages) - self.last_n
+        if aged_end - 1 - self._summarized_count >= self.summary_every:
+            # 要約に失敗した場合は要約済みの件数を進めない（未要約の履歴を落とさずに送り、次の呼び出しで再試行する）
+            if await self._update_summary(messages[1 + self._summarized_count:aged_end]):
+                self._summarized_count = aged_end - 1
+
+        rest_start = 1 + self._summarized_count
+        selected = messages[:1]
+        sent_tokens = counts[0]
+        if self._summary:
+            summary_message = UserMessage(content=f"（これまでの会話の要約）\n{self._summary}", source=SUMMARY_SOURCE)
+            selected.append(summary_message)
+            sent_tokens += estimate_tokens(summary_message)
+        selected.extend(messages[rest_start:])
+        sent_tokens += sum(counts[rest_start:])
+        return selected, sent_tokens
+
+    async def _update_summary(self, new_messages) -> bool:
+        """要約を更新する（失敗した・空の要約が返った場合は False）"""
+        transcript = "\n".join(
+            f"[{getattr(m, 'source', None) or 'Self'}]: {m.content}" for m in new_messages
+        )
+        if self._summary:
+            transcript = f"（これまでの要約）\n{self._summary}\n\n（続きの会話）\n{transcript}"
+        try:
+            result = await self.summarizer.create([
+                SystemMessage(content=SUMMARY_PROMPT),
+                UserMessage(content=transcript, source="user"),
+            ])
+        except Exception as e:
+            # 要約に失敗しても会話は止めない（前回の要約と未要約の履歴で続行）
+            logger.warning(f"Context summary update failed: {e}")
+            return False
+        if not (isinstance(result.content, str) and result.content.strip()):
+            logger.warning("Context summary update returned an empty summary")
+            return False
+        self._summary = result.content.strip()
+        return True
+
+    def report(self) -> dict:
+        """送信を省略できたトークン数（概算）"""
+        return {
+            "policy": self.policy,
+            "calls": self.calls,
+            "tokens_full": self.tokens_full,
+            "tokens_sent": self.tokens_sent,
+            "tokens_saved": self.tokens_full - self.tokens_sent,
+        }
+
+    async def save_state(self):
+        state = dict(await super().save_state())
+        state["summary"] = self._summary
+        state["summarized_count"] = self._summarized_count
+        return state
+
+    async def load_state(self, state) -> None:
+        await super().load_state(state)
+        self._token_counts = []
+        self._summary = state.get("summary")
+        self._summarized_count = state.get("summarized_count", 0)
@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+"""
+ローカルの疑似 LLM サーバー（Anthropic Messages API / OpenAI 互換 Chat Completions API）
+
+実際のプロバイダに課金せずに、会話テスト（run_conversation_test）自体のオーバーヘッドや
+同時実行時の挙動を計測するためのスタブ。既存のクライアントはベース URL を向けるだけで使える:
+
+    python fake_llm_server.py --port 8089 --latency lognormal:0.3,0.5 --error-rate 0.02
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8089 python auto_debugging.py --batch scenarios.jsonl
+    API_PROVIDER=gemini GEMINI_API_BASE_URL=http://127.0.0.1:8089/v1beta python auto_debugging.py ...
+
+- POST /v1/messages: Anthropic Messages API（stream=true なら SSE のイベント列）
+- POST .../chat/completions: OpenAI 互換 API（stream=true なら data: チャンク列と [DONE]）
+- POST /v1/messages/batches: Anthropic Message Batches API（GET /v1/messages/batches/{id} で状態、
+  .../results で JSONL の結果を返す。各リクエストは --batch-latency の後にまとめて処理済みになる）
+- GET /stats: リクエスト数・エラー数・同時接続数と同時処理中リクエスト数のピーク（POST /stats/reset でピークをリセット）
+
+応答までの待ち時間（--latency）、ストリーミング時のトークン間隔（--token-interval）、
+出力トークン数（--output-tokens）は分布で指定する:
+    fixed:0.2 / uniform:0.1,0.5 / normal:0.3,0.1 / lognormal:0.3,0.5（中央値, σ）/ exp:0.3（平均）
+--error-rate の割合で --error-status のいずれかのエラー（429 / 500 / 529 など）を返す。
+
+評価エージェントへの入力（"### 評価対象の会話" を含むメッセージ）には ★ 形式の評価を返し、
+複数の会話をまとめた入力（"=== 会話 <id> ===" の見出し）には会話ごとの "=== 評価 <id> ===" の節を返すため、
+結果データベースのスコア集計まで通して動かせる。外部パッケージには依存しない（標準ライブラリのみ）。
+"""
+
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import resource
+from datetime import datetime, timezone
+
+EVALUATION_MARKER = "### 評価対象の会話"
+# 複数の会話をまとめた評価リクエスト（batch_eval.PackedEvaluator）の各会話の見出し
+PACKED_CONVERSATION_PATTERN = re.compile(r"^=== 会話 (\S+) ===$", re.MULTILINE)
+EVALUATION_CRITERIA = ("ペルソナ一貫性", "会話の自然さ", "問題解決効果", "コミュニケーション品質")
+
+WORDS = (
+    "こんにちは", "ありがとうございます", "そうですね", "確認します", "スマホ", "料金プラン", "在庫", "色",
+    "サイズ", "保証", "ポイント", "少々お待ちください", "なるほど", "検討します", "おすすめ", "価格",
+    "機能", "カメラ", "バッテリー", "容量", "分割払い", "下取り", "キャンペーン", "店舗", "予約",
+)
+
+ERROR_TYPES = {
+    400: ("invalid_request_error", "Invalid request (injected)"),
+    429: ("rate_limit_error", "Rate limited (injected)"),
+    500: ("api_error", "Internal server error (injected)"),
+    503: ("api_error", "Service unavailable (injected)"),
+    529: ("overloaded_error", "Overloaded (injected)"),
+}
+
+HTTP_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+                500: "Internal Server Error", 503: "Service Unavailable", 529: "Overloaded"}
+
+
+def parse_distribution(spec: str, rng: random.Random):
+    """分布の指定（"lognormal:0.3,0.5" など）から、値（0以上）を返す関数を作る"""
+    kind, _, params = str(spec).partition(":")
+    if not params:
+        kind, params = "fixed", kind
+    values = [float(v) for v in params.split(",")]
+    samplers = {
+        "fixed": lambda: values[0],
+        "uniform": lambda: rng.uniform(values[0], values[1]),
+        "normal": lambda: rng.gauss(values[0], values[1]),
+        "lognormal": lambda: values[0] * rng.lognormvariate(0.0, values[1]),
+        "exp": lambda: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0,
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unsupported distribution: {spec}. Choose one of {', '.join(samplers)}.")
+    sampler = samplers[kind]
+    return lambda: max(0.0, sampler())
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content", "")
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+class FakeLLMServer:
+    """Anthropic / OpenAI 互換の疑似 LLM サーバー（asyncio の HTTP/1.1 実装）"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8089, latency: str = "fixed:0.05",
+                 token_interval: str = "fixed:0", output_tokens: str = "uniform:20,60",
+                 error_rate: float = 0.0, error_status=(429, 500, 529), end_after: int = 0, seed: int = None,
+                 batch_latency: str = "fixed:1"):
+        self.host = host
+        self.port = port
+        self.rng = random.Random(seed)
+        self.latency = parse_distribution(latency, self.rng)
+        self.token_interval = parse_distribution(token_interval, self.rng)
+        self.output_tokens = parse_distribution(output_tokens, self.rng)
+        self.error_rate = error_rate
+        self.error_status = tuple(error_status)
+        self.end_after = end_after
+        self.batch_latency = parse_distribution(batch_latency, self.rng)
+        self.stats = {"requests": 0, "errors": 0, "streamed": 0, "connections": 0, "peak_connections": 0,
+                      "in_flight": 0, "peak_in_flight": 0, "batches": 0, "batched_requests": 0, "by_path": {}}
+        self.batches = {}
+        self._batch_tasks = set()
+        self._server = None
+        self._connections = set()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=4096)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        for task in list(self._batch_tasks):
+            task.cancel()
+        if self._server:
+            self._server.close()
+            # キープアライブ中の接続を閉じ、各接続のハンドラが終了するのを待つ
+            for writer in list(self._connections):
+                writer.close()
+            while self._connections:
+                await asyncio.sleep(0.01)
+            await self._server.wait_closed()
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    # --- 応答内容 ---
+
+    def _evaluation_text(self) -> str:
+        return "\n".join(f"- {name}：{'★' * stars}{'☆' * (5 - stars)} (5段階)"
+                         for name, stars in ((n, self.rng.randint(2, 5)) for n in EVALUATION_CRITERIA))
+
+    def _reply_text(self, messages: list) -> str:
+        last = _message_text(messages[-1]) if messages else ""
+        packed = PACKED_CONVERSATION_PATTERN.findall(last)
+        if packed:
+            return "\n\n".join(f"=== 評価 {item_id} ===\n{self._evaluation_text()}" for item_id in packed)
+        if EVALUATION_MARKER in last:
+            return self._evaluation_text()
+        text = " ".join(self.rng.choice(WORDS) for _ in range(max(1, int(self.output_tokens()))))
+        if self.end_after and len(messages) >= self.end_after:
+            text += " DONE"
+        return text
+
+    def _pieces(self, text: str) -> list:
+        words = text.split(" ")
+        return [word + (" " if i < len(words) - 1 else "") for i, word in enumerate(words)]
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections.add(writer)
+        self.stats["connections"] += 1
+        self.stats["peak_connections"] = max(self.stats["peak_connections"], self.stats["connections"])
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, path, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", "0") or 0))
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self.stats["in_flight"] += 1
+                self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.stats["in_flight"])
+                try:
+                    await self._dispatch(method, path.split("?", 1)[0], body, writer)
+                    await writer.drain()
+                finally:
+                    self.stats["in_flight"] -= 1
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.stats["connections"] -= 1
+            self._connections.discard(writer)
+            writer.close()
+
+    def _write_response(self, writer, status: int, payload: dict, extra_headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Content-Length": str(len(body)), **(extra_headers or {})}
+        writer.write(self._head(status, headers) + body)
+
+    @staticmethod
+    def _head(status: int, headers: dict) -> bytes:
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Error')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _write_stream(self, writer, events):
+        """SSE を chunked エンコーディングで送る（events は (イベント名, データ) のリスト）"""
+        writer.write(self._head(200, {"Content-Type": "text/event-stream", "Transfer-Encoding": "chunked",
+                                      "Cache-Control": "no-cache"}))
+        for event, data in events:
+            if event == "sleep":
+                await writer.drain()
+                await asyncio.sleep(data)
+                continue
+            payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+            frame = (f"event: {event}\ndata: {payload}\n\n" if event else f"data: {payload}\n\n").encode("utf-8")
+            writer.write(f"{len(frame):x}\r\n".encode("latin-1") + frame + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+
+    async def _dispatch(self, method: str, path: str, body: bytes, writer):
+        self.stats["requests"] += 1
+        self.stats["by_path"][path] = self.stats["by_path"].get(path, 0) + 1
+        if method == "GET" and path == "/stats":
+            self._write_response(writer, 200, {**self.stats, "peak_rss_mb": peak_rss_mb()})
+            return
+        if method == "POST" and path == "/stats/reset":
+            # ピーク値を現在値に戻す（負荷試験の段階ごとに計測するため）
+            self.stats["peak_connections"] = self.stats["connections"]
+            self.stats["peak_in_flight"] = self.stats["in_flight"]
+            self._write_response(writer, 200, self.stats)
+            return
+        if path.startswith("/v1/messages/batches"):
+            self._handle_batches(method, path, body, writer)
+            return
+        if method != "POST":
+            self._write_response(writer, 404, {"error": {"message": f"Not found: {method} {path}"}})
+            return
+
+        request = json.loads(body or b"{}")
+        anthropic = path.endswith("/v1/messages")
+        if not anthropic and not path.endswith("/chat/completions"):
+            self._write_response(writer, 404, {"error": {"message": f"Not found: {path}"}})
+            return
+
+        await asyncio.sleep(self.latency())
+
+        if self._inject_error():
+            status = self.rng.choice(self.error_status)
+            error_type, message = ERROR_TYPES.get(status, ("api_error", "Injected error"))
+            if anthropic:
+                payload = {"type": "error", "error": {"type": error_type, "message": message}}
+            else:
+                payload = {"error": {"message": message, "type": error_type, "code": status}}
+            self._write_response(writer, status, payload, {"retry-after": "0"} if status == 429 else None)
+            return
+
+        text, usage = self._reply(request)
+        model = request.get("model", "fake-model")
+
+        if request.get("stream"):
+            self.stats["streamed"] += 1
+            builder = self._anthropic_stream if anthropic else self._openai_stream
+            await self._write_stream(writer, builder(model, text, usage, request))
+        elif anthropic:
+            self._write_response(writer, 200, self._anthropic_message(model, text, usage))
+        else:
+            self._write_response(writer, 200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:24]}", "object": "chat.completion", "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1], "total_tokens": sum(usage)},
+            })
+
+    def _inject_error(self) -> bool:
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.stats["errors"] += 1
+            return True
+        return False
+
+    def _reply(self, request: dict) -> tuple:
+        """リクエストに対する応答テキストと (入力トークン数, 出力トークン数)"""
+        messages = request.get("messages", [])
+        text = self._reply_text(messages)
+        prompt = _message_text({"content": request.get("system", "")}) + "".join(_message_text(m) for m in messages)
+        return text, (_estimate_tokens(prompt), _estimate_tokens(text))
+
+    @staticmethod
+    def _anthropic_message(model: str, text: str, usage: tuple) -> dict:
+        return {
+            "id": f"msg_{uuid.uuid4().hex[:24]}", "type": "message", "role": "assistant", "model": model,
+            "content": [{"type": "text", "text": text}],
+            "stop_reason": "end_turn", "stop_sequence": None,
+            "usage": {"input_tokens": usage[0], "output_tokens": usage[1]},
+        }
+
+    # --- Message Batches API ---
+
+    def _handle_batches(self, method: str, path: str, body: bytes, writer):
+        parts = path.rstrip("/").split("/")[4:]  # /v1/messages/batches 以降
+        if method == "POST" and not parts:
+            requests = json.loads(body or b"{}").get("requests") or []
+            if not requests:
+                self._write_response(writer, 400, {"type": "error", "error": {
+                    "type": "invalid_request_error", "message": "requests: must not be empty"}})
+                return
+            batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+            now = _iso_now()
+            batch = {
+                "id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+                "request_counts": {"processing": len(requests), "succeeded": 0, "errored": 0,
+                                   "canceled": 0, "expired": 0},
+                "created_at": now, "ended_at": None, "expires_at": now, "archived_at": None,
+                "cancel_initiated_at": None, "results_url": None,
+            }
+            self.batches[batch_id] = {"batch": batch, "results": []}
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(requests)
+            task = asyncio.ensure_future(self._process_batch(batch_id, requests))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+            self._write_response(writer, 200, batch)
+            return
+
+        entry = self.batches.get(parts[0]) if parts else None
+        if method != "GET" or entry is None or len(parts) > 2 or (len(parts) == 2 and parts[1] != "results"):
+            self._write_response(writer, 404, {"type": "error", "error": {
+                "type": "not_found_error", "message": f"Not found: {method} {path}"}})
+            return
+        if len(parts) == 1:
+            self._write_response(writer, 200, entry["batch"])
+            return
+        if entry["batch"]["processing_status"] != "ended":
+            self._write_response(writer, 404, {"type": "error", "error": {
+                "type": "not_found_error", "message": "Batch results are not available yet"}})
+            return
+        body = "".join(json.dumps(result, ensure_ascii=False) + "\n" for result in entry["results"]).encode("utf-8")
+        writer.write(self._head(200, {"Content-Type": "application/binary", "Content-Length": str(len(body))}) + body)
+
+    async def _process_batch(self, batch_id: str, requests: list):
+        """--batch-latency の後に、バッチ内の全リクエストの結果をまとめて確定する"""
+        await asyncio.sleep(self.batch_latency())
+        entry = self.batches[batch_id]
+        counts = entry["batch"]["request_counts"]
+        for item in requests:
+            if self._inject_error():
+                status = self.rng.choice(self.error_status)
+                error_type, message = ERROR_TYPES.get(status, ("api_error", "Injected error"))
+                result = {"type": "errored", "error": {"type": "error", "error": {"type": error_type, "message": message}}}
+                counts["errored"] += 1
+            else:
+                params = item.get("params") or {}
+                text, usage = self._reply(params)
+                result = {"type": "succeeded",
+                          "message": self._anthropic_message(params.get("model", "fake-model"), text, usage)}
+                counts["succeeded"] += 1
+            counts["processing"] -= 1
+            entry["results"].append({"custom_id": item.get("custom_id"), "result": result})
+        entry["batch"].update(processing_status="ended", ended_at=_iso_now(),
+                              results_url=f"{self.base_url}/v1/messages/batches/{batch_id}/results")
+
+    def _token_events(self, pieces: list, make_event):
+        events = []
+        for piece in pieces:
+            interval = self.token_interval()
+            if interval:
+                events.append(("sleep", interval))
+            events.append(make_event(piece))
+        return events
+
+    def _anthropic_stream(self, model: str, text: str, usage: tuple, request: dict) -> list:
+        message_id = f"msg_{uuid.uuid4().hex[:24]}"
+        return [
+            ("message_start", {"type": "message_start", "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+                "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": usage[0], "output_tokens": 1}}}),
+            ("content_block_start", {"type": "content_block_start", "index": 0,
+                                     "content_block": {"type": "text", "text": ""}}),
+            *self._token_events(self._pieces(text), lambda piece: ("content_block_delta", {
+                "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": piece}})),
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": usage[1]}}),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+
+    def _openai_stream(self, model: str, text: str, usage: tuple, request: dict) -> list:
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def chunk(delta: dict, finish_reason=None, **extra):
+            return (None, {"id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                           "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}], **extra})
+
+        events = [chunk({"role": "assistant", "content": ""})]
+        events += self._token_events(self._pieces(text), lambda piece: chunk({"content": piece}))
+        events.append(chunk({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            events.append((None, {"id": chunk_id, "object": "chat.completion.chunk", "created": created,
+                                  "model": model, "choices": [],
+                                  "usage": {"prompt_tokens": usage[0], "completion_tokens": usage[1],
+                                            "total_tokens": sum(usage)}}))
+        events.append((None, "[DONE]"))
+        return events
+
+
+def _iso_now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def peak_rss_mb() -> float:
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def raise_open_file_limit():
+    """同時接続数が多い場合に備え、ファイルディスクリプタの上限をハードリミットまで引き上げる"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="疑似 LLM サーバー（Anthropic / OpenAI 互換）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="fixed:0.05", help="応答（最初のトークン）までの待ち時間の分布 (秒)")
+    parser.add_argument("--token-interval", default="fixed:0", help="ストリーミング時のトークン間隔の分布 (秒)")
+    parser.add_argument("--output-tokens", default="uniform:20,60", help="出力トークン数（単語数）の分布")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="エラーを返す割合 (0〜1)")
+    parser.add_argument("--error-status", default="429,500,529", help="返すエラーの HTTP ステータス（カンマ区切り）")
+    parser.add_argument("--end-after", type=int, default=0,
+                        help="リクエストのメッセージ数がこの値以上になったら応答に DONE を含める (0: 含めない)")
+    parser.add_argument("--batch-latency", default="fixed:1",
+                        help="Message Batches API のバッチが処理済みになるまでの時間の分布 (秒)")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    raise_open_file_limit()
+    server = FakeLLMServer(
+        host=args.host, port=args.port, latency=args.latency, token_interval=args.token_interval,
+        output_tokens=args.output_tokens, error_rate=args.error_rate,
+        error_status=[int(s) for s in args.error_status.split(",") if s.strip()],
+        end_after=args.end_after, seed=args.seed, batch_latency=args.batch_latency,
+    )
+
+    async def serve():
+        await server.start()
+        print(f"🧪 疑似 LLM サーバー: {server.base_url}", flush=True)
+        print(f"   ANTHROPIC_BASE_URL={server.base_url}", flush=True)
+        print(f"   GEMINI_API_BASE_URL={server.base_url}/v1beta", flush=True)
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+複数プロセス（複数マシン）で共有する会話ジョブのキュー（SQLite）
+
+- ジョブの取得（claim）はリース付き: 取得したワーカーは lease_seconds 以内にハートビートでリースを延長する
+- リースが切れたジョブ（ワーカーのクラッシュ・停止）は次の claim 時に待ち状態へ戻され、別のワーカーが引き継ぐ
+  （会話はチェックポイントから再開される）。max_attempts 回失敗したジョブは failed になる
+- ジョブIDはシナリオIDで、キューへの再投入を何度行っても重複しない。待ち・実行中・完了済みのジョブの再登録は無視し、
+  失敗したジョブとリースが切れたジョブは試行回数をリセットして待ち状態に戻す
+- 接続はスレッド間で共有でき（操作はロックで直列化する）、ワーカーは asyncio.to_thread で呼び出して
+  SQLite のロック待ちでイベントループを止めない
+
+キューのファイル（queue.db）はバッチの出力ディレクトリに置き、ワーカーはその隣にセッションのログを書き込む。
+"""
+
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires_at REAL,
+    enqueued_at REAL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, seq);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class JobQueue:
+    """SQLite によるリース付きジョブキュー"""
+
+    def __init__(self, path, max_attempts: int = 3):
+        self.path = Path(path)
+        self.max_attempts = max(1, max_attempts)
+        # トランザクションは明示的に制御する（claim は BEGIN IMMEDIATE で書き込みロックを先に取る）
+        self.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _transaction(self):
+        return _ImmediateTransaction(self.conn, self._lock)
+
+    def set_meta(self, **values):
+        with self._transaction():
+            self.conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                [(key, json.dumps(value, ensure_ascii=False)) for key, value in values.items()],
+            )
+
+    def meta(self) -> dict:
+        with self._lock:
+            return {row["key"]: json.loads(row["value"]) for row in self.conn.execute("SELECT key, value FROM meta")}
+
+    def enqueue(self, jobs: list) -> int:
+        """ジョブ（"id" を持つ dict）をまとめて登録し、新たに登録された・待ち状態に戻された件数を返す"""
+        now = time.time()
+        with self._transaction():
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT INTO jobs (id, payload, enqueued_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET status = ?, payload = excluded.payload, attempts = 0, "
+                "worker_id = NULL, lease_expires_at = NULL, enqueued_at = excluded.enqueued_at, "
+                "started_at = NULL, finished_at = NULL, error = NULL, result = NULL "
+                "WHERE jobs.status = ? OR (jobs.status = ? AND jobs.lease_expires_at < excluded.enqueued_at)",
+                [(job["id"], json.dumps(job, ensure_ascii=False), now, STATUS_QUEUED, STATUS_FAILED, STATUS_RUNNING)
+                 for job in jobs],
+            )
+            return self.conn.total_changes - before
+
+    def _requeue_expired(self, now: float) -> int:
+        # リース切れのジョブを待ち状態に戻す（試行回数を使い切っていれば failed）
+        self.conn.execute(
+            "UPDATE jobs SET status = ?, error = 'lease expired', finished_at = ? "
+            "WHERE status = ? AND lease_expires_at < ? AND attempts >= ?",
+            (STATUS_FAILED, now, STATUS_RUNNING, now, self.max_attempts),
+        )
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, worker_id = NULL, lease_expires_at = NULL "
+            "WHERE status = ? AND lease_expires_at < ?",
+            (STATUS_QUEUED, STATUS_RUNNING, now),
+        )
+        return cursor.rowcount
+
+    def requeue_expired(self) -> int:
+        with self._transaction():
+            return self._requeue_expired(time.time())
+
+    def claim(self, worker_id: str, lease_seconds: float):
+        """待ち状態のジョブを1件取得してリースを設定する（なければ None）"""
+        now = time.time()
+        with self._transaction():
+            self._requeue_expired(now)
+            row = self.conn.execute(
+                "SELECT id, payload, attempts FROM jobs WHERE status = ? ORDER BY seq LIMIT 1",
+                (STATUS_QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_expires_at = ?, attempts = attempts + 1, "
+                "started_at = ? WHERE id = ?",
+                (STATUS_RUNNING, worker_id, now + lease_seconds, now, row["id"]),
+            )
+        return {"id": row["id"], "payload": json.loads(row["payload"]), "attempt": row["attempts"] + 1}
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """リースを延長する（リースが切れていた・他のワーカーに移っていた場合は False）"""
+        now = time.time()
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? "
+                "WHERE id = ? AND worker_id = ? AND status = ? AND lease_expires_at >= ?",
+                (now + lease_seconds, job_id, worker_id, STATUS_RUNNING, now),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: dict) -> bool:
+        with self._transaction():
+            cursor = self.conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = NULL, lease_expires_at = NULL "
+                "WHERE id = ? AND worker_id = ? AND status = ?",
+                (STATUS_DONE, time.time(), json.dumps(result, ensure_ascii=False), job_id, worker_id, STATUS_RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str, result: dict = None) -> str:
+        """失敗を記録する（試行回数が残っていれば待ち状態に戻す）。新しいステータスを返す"""
+        with self._transaction():
+            row = self.conn.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND worker_id = ? AND status = ?",
+                (job_id, worker_id, STATUS_RUNNING),
+            ).fetchone()
+            if row is None:
+                return None
+            status = STATUS_QUEUED if row["attempts"] < self.max_attempts else STATUS_FAILED
+            self.conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = NULL, lease_expires_at = NULL, finished_at = ?, "
+                "error = ?, result = ? WHERE id = ?",
+                (status, time.time(), error, json.dumps(result, ensure_ascii=False) if result else None, job_id),
+            )
+            return status
+
+    def counts(self) -> dict:
+        counts = {status: 0 for status in (STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED)}
+        with self._lock:
+            rows = self.conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        for row in rows:
+            counts[row["status"]] = row["n"]
+        return counts
+
+    def is_drained(self) -> bool:
+        """待ち・実行中のジョブがなくなったか"""
+        counts = self.counts()
+        return counts[STATUS_QUEUED] == 0 and counts[STATUS_RUNNING] == 0
+
+    def results(self) -> list:
+        """登録順の各ジョブの結果（未完了のジョブは失敗として扱う）"""
+        results = []
+        with self._lock:
+            rows = self.conn.execute("SELECT id, payload, status, attempts, error, result FROM jobs ORDER BY seq").fetchall()
+        for row in rows:
+            result = json.loads(row["result"]) if row["result"] else {
+                "id": row["id"],
+                "scenario": json.loads(row["payload"]).get("scenario"),
+                "status": "failed",
+            }
+            if row["status"] != STATUS_DONE:
+                result["status"] = "failed"
+                result["error"] = row["error"] or f"job {row['status']}"
+            result["attempts"] = row["attempts"]
+            results.append(result)
+        return results
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE ... COMMIT / ROLLBACK（接続のロックを保持したまま）"""
+
+    def __init__(self, conn, lock):
+        self.conn = conn
+        self.lock = lock
+
+    def __enter__(self):
+        self.lock.acquire()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.lock.release()
+            raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.lock.release()
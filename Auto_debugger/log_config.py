@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+ログ設定（キュー経由の非同期書き込み・ロガーごとのレベル・ローテーション・イベントのサンプリング）
+
+ログレコードはルートロガーの QueueHandler でキューに積むだけにし、ファイル・コンソールへの書き込みは
+QueueListener のバックグラウンドスレッドで行う（イベントループをファイル I/O で止めない）。
+バッチ実行でのセッションごとの振り分け（SessionLogRouter）やバッチ全体のログも、このスレッドから書き込まれる。
+別スレッドではコンテキスト変数を参照できないため、キューに積む時点でレコードに session_id を付ける。
+ハンドラを閉じる処理もキューに積んでリスナースレッドで行い、それまでに積まれたレコードを書き終えてから閉じる
+（キューが空になるのをイベントループ上で待たない）。
+
+環境変数:
+- LOG_LEVEL（デフォルト: INFO）: ルートロガーのレベル
+- LOG_LEVELS: ロガーごとのレベル（例: "autogen_core=INFO,ConversationTest.ModelCache=DEBUG"）
+  autogen の内部ロガー（autogen_core / autogen_core.events / autogen_agentchat）と HTTP クライアントは
+  デフォルトで WARNING（1メッセージごとのイベントレコードでログが膨らむため）
+- LOG_EVENT_SAMPLE_RATE（デフォルト: 1.0）: autogen_core.events のレコードを残す割合（レベルを INFO に下げた場合）
+- LOG_MAX_BYTES（デフォルト: 10MB）/ LOG_BACKUP_COUNT（デフォルト: 3）: ログファイルのローテーション
+"""
+
+import os
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+from pathlib import Path
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+EVENT_LOGGER_NAME = "autogen_core.events"
+
+DEFAULT_LOGGER_LEVELS = {
+    "autogen_core": "WARNING",
+    EVENT_LOGGER_NAME: "WARNING",
+    "autogen_agentchat": "WARNING",
+    "autogen_ext": "WARNING",
+    "httpx": "WARNING",
+    "httpcore": "WARNING",
+    "anthropic": "WARNING",
+    "google_genai": "WARNING",
+}
+
+# バッチ実行時に、どのセッションのログかを判別するためのコンテキスト変数
+current_session_id = contextvars.ContextVar("current_session_id", default=None)
+
+
+def record_session_id(record: logging.LogRecord):
+    """レコードが発生したセッションのID（セッション外なら None）"""
+    return getattr(record, "session_id", None)
+
+
+def outside_session(record: logging.LogRecord) -> bool:
+    """セッションに属さないレコードだけを通すフィルタ"""
+    return record_session_id(record) is None
+
+
+def rotating_file_handler(path) -> logging.Handler:
+    """LOG_FORMAT で書き込み、LOG_MAX_BYTES を超えたらローテーションするファイルハンドラ"""
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+        backupCount=int(os.getenv('LOG_BACKUP_COUNT', '3')),
+        encoding='utf-8',
+    )
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+class SessionLogRouter(logging.Handler):
+    """ログレコードを実行中セッションのログファイルへ振り分けるハンドラ
+
+    asyncio のタスクはコンテキストを引き継ぐため、autogen 内部のログも
+    current_session_id に従って各セッションのファイルに書き込まれる。
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._handlers = {}
+
+    def register(self, session_id: str, path: Path):
+        self._handlers[session_id] = rotating_file_handler(path)
+
+    def unregister(self, session_id: str):
+        handler = self._handlers.get(session_id)
+        if handler is None:
+            return
+
+        def close():
+            # 同じ session_id で登録し直されていれば、新しいハンドラは残す
+            if self._handlers.get(session_id) is handler:
+                del self._handlers[session_id]
+            handler.close()
+
+        # キューに残っているセッションのレコードを書き終えてから閉じる
+        _run_in_listener(close)
+
+    def emit(self, record):
+        handler = self._handlers.get(record_session_id(record))
+        if handler:
+            handler.handle(record)
+
+
+session_log_router = SessionLogRouter()
+
+
+class _SessionQueueHandler(QueueHandler):
+    """キューに積む時点で session_id を付け、イベントレコードをサンプリングする"""
+
+    def __init__(self, log_queue, event_sample_rate: float = 1.0):
+        super().__init__(log_queue)
+        self.event_sample_rate = event_sample_rate
+
+    def emit(self, record):
+        if record.name == EVENT_LOGGER_NAME and self.event_sample_rate < 1.0 and random.random() >= self.event_sample_rate:
+            return
+        super().emit(record)
+
+    def prepare(self, record):
+        record.session_id = current_session_id.get()
+        return super().prepare(record)
+
+
+class _Dispatcher(logging.Handler):
+    """リスナースレッドで、登録されたハンドラにレコードを渡す（ハンドラは実行中に追加・削除できる）"""
+
+    def __init__(self):
+        super().__init__()
+        self._handlers = []
+        self._handlers_lock = threading.Lock()
+
+    def add(self, handler: logging.Handler):
+        with self._handlers_lock:
+            if handler not in self._handlers:
+                self._handlers.append(handler)
+
+    def remove(self, handler: logging.Handler):
+        with self._handlers_lock:
+            if handler in self._handlers:
+                self._handlers.remove(handler)
+
+    def emit(self, record):
+        action = getattr(record, "log_action", None)
+        if action is not None:
+            action()
+            return
+        with self._handlers_lock:
+            handlers = list(self._handlers)
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+_queue = queue.Queue(-1)
+_dispatcher = _Dispatcher()
+_listener = None
+_console_handler = None
+_config_lock = threading.Lock()
+
+
+def parse_logger_levels(spec: str) -> dict:
+    """"name=LEVEL,name=LEVEL" 形式の指定を dict に変換"""
+    levels = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        name, sep, level = item.partition("=")
+        if not sep:
+            raise ValueError(f"LOG_LEVELS の指定が不正です: {item!r}（name=LEVEL の形式で指定してください）")
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(console: bool = False):
+    """ルートロガーをキュー経由の書き込みに切り替える（何度呼んでもよい。console は一度有効にすると維持する）"""
+    global _listener, _console_handler
+    with _config_lock:
+        if _listener is None:
+            root = logging.getLogger()
+            root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+            for name, level in {**DEFAULT_LOGGER_LEVELS, **parse_logger_levels(os.getenv('LOG_LEVELS'))}.items():
+                logging.getLogger(name).setLevel(level)
+
+            sample_rate = float(os.getenv('LOG_EVENT_SAMPLE_RATE', '1.0'))
+            root.addHandler(_SessionQueueHandler(_queue, event_sample_rate=sample_rate))
+            _dispatcher.add(session_log_router)
+            _listener = QueueListener(_queue, _dispatcher)
+            _listener.start()
+
+        if console and _console_handler is None:
+            _console_handler = logging.StreamHandler()
+            _console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            _dispatcher.add(_console_handler)
+
+
+def add_log_handler(handler: logging.Handler) -> logging.Handler:
+    """リスナースレッドから書き込むハンドラを追加"""
+    configure_logging()
+    _dispatcher.add(handler)
+    return handler
+
+
+def _run_in_listener(action):
+    """それまでにキューに積まれたレコードを書き終えた後、リスナースレッドで action を実行する（待たずに戻る）"""
+    if _listener is None:
+        action()
+    else:
+        _queue.put_nowait(logging.makeLogRecord({"log_action": action}))
+
+
+def remove_log_handler(handler: logging.Handler):
+    def remove():
+        _dispatcher.remove(handler)
+        handler.close()
+
+    _run_in_listener(remove)
+
+
+def flush_logging():
+    """キューに積まれたレコードがすべて書き込まれるまで待つ（ブロックするため、イベントループ上では呼ばない）"""
+    if _listener is not None:
+        _queue.join()
+
+
+def shutdown_logging():
+    global _listener
+    with _config_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+            for handler in logging.getLogger().handlers[:]:
+                if isinstance(handler, _SessionQueueHandler):
+                    logging.getLogger().removeHandler(handler)
+
+
+atexit.register(shutdown_logging)
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+モデル呼び出しの計測（レイテンシ・トークン数・リトライ回数）
+
+InstrumentedChatCompletionClient がモデル呼び出しごとに1レコードを MetricsRecorder に記録する。
+レコードはセッションごとの metrics_<session>.jsonl に追記され、
+ロール（customer / staff / evaluator）ごとの p50/p95/p99 を summary() で集計できる。
+
+セッションの MetricsRecorder は親（プロセス全体の global_metrics）にも記録を伝えるため、
+バッチ全体の集計や Prometheus 形式のエンドポイント（serve_prometheus）にも反映される。
+"""
+
+import math
+import time
+import threading
+import contextvars
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from autogen_core.models import CreateResult
+
+from model_clients import DelegatingChatCompletionClient
+from transcript_log import TranscriptWriter
+from config import PERCENTILES
+
+# 内側のラッパー（リトライ処理など）が、現在の呼び出しで行ったリトライ回数を加算する
+call_retries = contextvars.ContextVar("call_retries", default=0)
+# プロンプトキャッシュのフック（prompt_cache）が、現在の呼び出しのキャッシュ読み書きトークン数を書き込む dict
+# （SDK 呼び出しは別タスクで実行されるため、値ではなく共有の dict を渡す）
+call_cache_usage = contextvars.ContextVar("call_cache_usage", default=None)
+# ルーティング（routing.RoutingChatCompletionClient）が、応答したルートとヘッジ・フェイルオーバーの有無を書き込む dict
+call_route = contextvars.ContextVar("call_route", default=None)
+
+def percentile(values, pct: float):
+    """最近傍順位法によるパーセンタイル（values が空なら None）"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class MetricsRecorder:
+    """モデル呼び出しレコードの収集と集計"""
+
+    def __init__(self, session_id: str = None, path=None, parent: "MetricsRecorder" = None):
+        self.session_id = session_id
+        self.parent = parent
+        self.records = []
+        self._writer = TranscriptWriter(path) if path else None
+        self._lock = threading.Lock()
+
+    def record(self, entry: dict):
+        with self._lock:
+            self.records.append(entry)
+        if self._writer and not self._writer.closed:
+            self._writer.write(entry)
+        if self.parent:
+            self.parent.record(entry)
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+
+    def reopen(self):
+        if self._writer:
+            self._writer.reopen()
+
+    def summary(self) -> dict:
+        """ロールごとの呼び出し数・エラー数・トークン数・レイテンシのパーセンタイル"""
+        with self._lock:
+            records = list(self.records)
+
+        by_role = {}
+        for entry in records:
+            by_role.setdefault(entry["role"], []).append(entry)
+
+        summary = {}
+        for role, entries in sorted(by_role.items()):
+            latencies = [e["latency_seconds"] for e in entries if e.get("error") is None]
+            role_summary = {
+                "calls": len(entries),
+                "errors": sum(1 for e in entries if e.get("error") is not None),
+                "retries": sum(e.get("retries", 0) for e in entries),
+                "cached": sum(1 for e in entries if e.get("cached")),
+                "prompt_tokens": sum(e.get("prompt_tokens") or 0 for e in entries),
+                "completion_tokens": sum(e.get("completion_tokens") or 0 for e in entries),
+                "cache_read_tokens": sum(e.get("cache_read_tokens") or 0 for e in entries),
+                "cache_write_tokens": sum(e.get("cache_write_tokens") or 0 for e in entries),
+                "cache_hit_calls": sum(1 for e in entries if e.get("cache_read_tokens")),
+                "latency_mean_seconds": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            }
+            for pct in PERCENTILES:
+                role_summary[f"latency_p{pct}_seconds"] = percentile(latencies, pct)
+            routes = {}
+            for e in entries:
+                if e.get("route"):
+                    routes[e["route"]] = routes.get(e["route"], 0) + 1
+            if routes:
+                role_summary["routes"] = routes
+                role_summary["hedged"] = sum(1 for e in entries if e.get("hedged"))
+                role_summary["failovers"] = sum(1 for e in entries if e.get("failed_over"))
+            summary[role] = role_summary
+        return summary
+
+    def to_prometheus(self) -> str:
+        """Prometheus のテキスト形式で出力"""
+        lines = [
+            "# HELP llm_request_latency_seconds Model request latency.",
+            "# TYPE llm_request_latency_seconds summary",
+        ]
+        summary = self.summary()
+        with self._lock:
+            records = list(self.records)
+
+        for role, role_summary in summary.items():
+            for pct in PERCENTILES:
+                value = role_summary[f"latency_p{pct}_seconds"]
+                if value is not None:
+                    lines.append(f'llm_request_latency_seconds{{role="{role}",quantile="{pct / 100}"}} {value}')
+            ok_latencies = [e["latency_seconds"] for e in records if e["role"] == role and e.get("error") is None]
+            lines.append(f'llm_request_latency_seconds_sum{{role="{role}"}} {round(sum(ok_latencies), 6)}')
+            lines.append(f'llm_request_latency_seconds_count{{role="{role}"}} {len(ok_latencies)}')
+
+        for name, key, help_text in (
+            ("llm_requests_total", "calls", "Model requests."),
+            ("llm_request_errors_total", "errors", "Failed model requests."),
+            ("llm_request_retries_total", "retries", "Retried model requests."),
+            ("llm_cached_responses_total", "cached", "Responses served from the response cache."),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for role, role_summary in summary.items():
+                lines.append(f'{name}{{role="{role}"}} {role_summary[key]}')
+
+        lines.append("# HELP llm_tokens_total Tokens used by model requests.")
+        lines.append("# TYPE llm_tokens_total counter")
+        for role, role_summary in summary.items():
+            lines.append(f'llm_tokens_total{{role="{role}",kind="prompt"}} {role_summary["prompt_tokens"]}')
+            lines.append(f'llm_tokens_total{{role="{role}",kind="completion"}} {role_summary["completion_tokens"]}')
+            lines.append(f'llm_tokens_total{{role="{role}",kind="cache_read"}} {role_summary["cache_read_tokens"]}')
+            lines.append(f'llm_tokens_total{{role="{role}",kind="cache_write"}} {role_summary["cache_write_tokens"]}')
+
+        if any("routes" in role_summary for role_summary in summary.values()):
+            lines.append("# HELP llm_route_responses_total Responses by the route that answered.")
+            lines.append("# TYPE llm_route_responses_total counter")
+            for role, role_summary in summary.items():
+                for route, count in role_summary.get("routes", {}).items():
+                    lines.append(f'llm_route_responses_total{{role="{role}",route="{route}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+# プロセス全体（バッチ全体）の集計先
+global_metrics = MetricsRecorder(session_id="global")
+
+
+class InstrumentedChatCompletionClient(DelegatingChatCompletionClient):
+    """呼び出しごとのレイテンシ・トークン数・リトライ回数を記録するクライアント"""
+
+    def __init__(self, inner, role: str, recorder: MetricsRecorder, model: str = None):
+        super().__init__(inner)
+        self.role = role
+        self.recorder = recorder
+        self.model_name = model
+
+    def _record(self, started: float, result=None, error=None, first_chunk=None, retries: int = 0):
+        usage = getattr(result, "usage", None)
+        cache_usage = call_cache_usage.get() or {}
+        route = call_route.get() or {}
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "session_id": self.recorder.session_id,
+            "role": self.role,
+            "model": self.model_name,
+            "latency_seconds": round(time.monotonic() - started, 4),
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "cache_read_tokens": cache_usage.get("cache_read_tokens"),
+            "cache_write_tokens": cache_usage.get("cache_write_tokens"),
+            "retries": retries,
+            "cached": bool(getattr(result, "cached", False)),
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+        }
+        if route:
+            entry.update(route=route.get("route"), hedged=route.get("hedged"), failed_over=route.get("failed_over"))
+        if first_chunk is not None:
+            entry["first_chunk_seconds"] = round(first_chunk - started, 4)
+        self.recorder.record(entry)
+
+    async def create(self, messages, **kwargs) -> CreateResult:
+        call_retries.set(0)
+        call_cache_usage.set({})
+        call_route.set({})
+        started = time.monotonic()
+        try:
+            result = await self.inner.create(messages, **kwargs)
+        except Exception as e:
+            self._record(started, error=e, retries=call_retries.get())
+            raise
+        self._record(started, result=result, retries=call_retries.get())
+        return result
+
+    async def create_stream(self, messages, **kwargs):
+        call_retries.set(0)
+        call_cache_usage.set({})
+        call_route.set({})
+        started = time.monotonic()
+        first_chunk = None
+        try:
+            async for chunk in self.inner.create_stream(messages, **kwargs):
+                if first_chunk is None:
+                    first_chunk = time.monotonic()
+                if isinstance(chunk, CreateResult):
+                    self._record(started, result=chunk, first_chunk=first_chunk, retries=call_retries.get())
+                yield chunk
+        except Exception as e:
+            self._record(started, error=e, first_chunk=first_chunk, retries=call_retries.get())
+            raise
+
+
+def serve_prometheus(port: int, recorder: MetricsRecorder = None, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """/metrics で Prometheus 形式のテキストを返す HTTP サーバーをバックグラウンドで起動"""
+    recorder = recorder or global_metrics
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = recorder.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
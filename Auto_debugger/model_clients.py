@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+モデルクライアントのラッパー群
+
+autogen の ChatCompletionClient を包み、呼び出し前後に処理を差し込むためのクラスを定義する。
+- DelegatingChatCompletionClient: 全メソッドを内側のクライアントへ委譲する基底クラス
+- CachingChatCompletionClient: プロンプト内容のハッシュをキーに応答をディスクへ記録/再生する
+
+キャッシュモード（環境変数 MODEL_CACHE_MODE）:
+- passthrough: キャッシュを使わない（デフォルト）
+- record: キャッシュにあれば再生し、なければ API を呼び出して記録する
+  再生した応答の使用量（usage）は 0 トークンとして返す（計測に実際には消費していないトークンを含めない）
+- replay: キャッシュからのみ応答する。存在しない場合は ModelCacheMissError（API は呼ばない）
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from pathlib import Path
+
+from autogen_core.models import ChatCompletionClient, CreateResult, RequestUsage
+
+from config import CACHE_MODES
+
+logger = logging.getLogger("ConversationTest.ModelCache")
+
+
+class ModelCacheMissError(RuntimeError):
+    """replay モードでキャッシュに応答が存在しない場合のエラー"""
+
+
+class DelegatingChatCompletionClient(ChatCompletionClient):
+    """内側のクライアントへ全ての呼び出しを委譲するラッパーの基底クラス"""
+
+    def __init__(self, inner: ChatCompletionClient):
+        self.inner = inner
+
+    async def create(self, messages, **kwargs) -> CreateResult:
+        return await self.inner.create(messages, **kwargs)
+
+    def create_stream(self, messages, **kwargs):
+        return self.inner.create_stream(messages, **kwargs)
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+    def actual_usage(self):
+        return self.inner.actual_usage()
+
+    def total_usage(self):
+        return self.inner.total_usage()
+
+    def count_tokens(self, messages, **kwargs) -> int:
+        return self.inner.count_tokens(messages, **kwargs)
+
+    def remaining_tokens(self, messages, **kwargs) -> int:
+        return self.inner.remaining_tokens(messages, **kwargs)
+
+    @property
+    def capabilities(self):
+        return self.inner.capabilities
+
+    @property
+    def model_info(self):
+        return self.inner.model_info
+
+    def __getattr__(self, name):
+        # model 属性など、ラッパーが持たない属性は内側のクライアントから取得
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+
+class ModelResponseCache:
+    """モデル応答のディスクキャッシュ（内容ハッシュをキーとし、サイズ上限を超えたら古い順に削除）"""
+
+    def __init__(self, cache_dir, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = sum(p.stat().st_size for p in self.cache_dir.glob("*/*.json"))
+
+    @classmethod
+    def from_env(cls):
+        """環境変数 MODEL_CACHE_DIR / MODEL_CACHE_MAX_MB から生成"""
+        return cls(
+            os.getenv('MODEL_CACHE_DIR', str(Path("logs") / "model_cache")),
+            max_bytes=int(float(os.getenv('MODEL_CACHE_MAX_MB', '512')) * 1024 * 1024),
+        )
+
+    @staticmethod
+    def make_key(namespace: str, messages, kwargs: dict) -> str:
+        """モデル名・メッセージ列・生成オプションから決定的なキーを作る"""
+        payload = {
+            "namespace": namespace,
+            "messages": [m.model_dump(mode="json") if hasattr(m, "model_dump") else m for m in messages],
+            "json_output": repr(kwargs.get("json_output")),
+            "tools": [getattr(t, "name", None) or t.get("name") for t in kwargs.get("tools", [])],
+            "extra_create_args": kwargs.get("extra_create_args", {}),
+        }
+        raw = json.dumps(payload, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.misses += 1
+            return None
+        # 最近使われたエントリを残すため、ヒット時に更新時刻を進める
+        os.utime(path, None)
+        self.hits += 1
+        result = CreateResult.model_validate(data["result"])
+        result.cached = True
+        # 再生した応答ではトークンを消費していないため、記録時の使用量は返さない
+        result.usage = RequestUsage(prompt_tokens=0, completion_tokens=0)
+        return result
+
+    def put(self, key: str, namespace: str, result: CreateResult):
+        path = self._path(key)
+        path.parent.mkdir(exist_ok=True)
+        body = json.dumps({
+            "key": key,
+            "namespace": namespace,
+            "created_at": time.time(),
+            "result": result.model_dump(mode="json"),
+        }, ensure_ascii=False)
+
+        # 書き込み途中のファイルを読まれないよう、一時ファイル経由で置き換える
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(body)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(tmp_path, path)
+        self._total_bytes += path.stat().st_size - old_size
+
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """合計サイズが上限の 90% を下回るまで、最も古く使われたエントリから削除"""
+        entries = []
+        for p in self.cache_dir.glob("*/*.json"):
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+        entries.sort()
+
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        removed = 0
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        self._total_bytes = total
+        if removed:
+            logger.info(f"Model cache evicted {removed} entries (size now {total} bytes)")
+
+
+class CachingChatCompletionClient(DelegatingChatCompletionClient):
+    """プロンプト内容をキーに応答を記録/再生するクライアント"""
+
+    def __init__(self, inner: ChatCompletionClient, cache: ModelResponseCache, namespace: str, mode: str = "record"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unsupported MODEL_CACHE_MODE: {mode}. Choose one of {', '.join(CACHE_MODES)}.")
+        super().__init__(inner)
+        self.cache = cache
+        self.namespace = namespace
+        self.mode = mode
+
+    def _lookup(self, messages, kwargs):
+        if self.mode == "passthrough":
+            return None, None
+        key = self.cache.make_key(self.namespace, messages, kwargs)
+        cached = self.cache.get(key)
+        if cached is None and self.mode == "replay":
+            raise ModelCacheMissError(f"キャッシュに応答がありません (namespace={self.namespace}, key={key[:12]})")
+        return key, cached
+
+    async def create(self, messages, **kwargs) -> CreateResult:
+        key, cached = self._lookup(messages, kwargs)
+        if cached is not None:
+            return cached
+
+        result = await self.inner.create(messages, **kwargs)
+        if key is not None:
+            self.cache.put(key, self.namespace, result)
+        return result
+
+    async def create_stream(self, messages, **kwargs):
+        key, cached = self._lookup(messages, kwargs)
+        if cached is not None:
+            if isinstance(cached.content, str):
+                yield cached.content
+            yield cached
+            return
+
+        async for chunk in self.inner.create_stream(messages, **kwargs):
+            if isinstance(chunk, CreateResult) and key is not None:
+                self.cache.put(key, self.namespace, chunk)
+            yield chunk
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+保存済みの会話ログの再評価（評価のみモード）
+
+会話を生成し直さずに、logs/ 以下の chat_*.jsonl（従来形式の chat_*.json を含む）を読み込み、
+評価エージェントを同時実行数を制限して並列に実行する。
+
+評価結果は <logs_dir>/evaluations/<プロンプトハッシュ>/ 以下に1会話1ファイルで保存する。
+プロンプトハッシュは evaluator_prompt.md の内容から計算するため、同じプロンプトで
+評価済みの会話は読み飛ばし、プロンプトを変更した場合のみ再評価される。
+評価結果には評価したメッセージのハッシュ（transcript_hash）も記録し、会話ログが変わった
+（チェックポイントから再開して発言が増えたなど）場合は同じプロンプトでも再評価する。
+評価結果は結果データベース（results_store, RESULTS_DB）にもまとめて記録する。
+
+評価の方式（backend）:
+- agent: 1会話ずつ評価エージェントを実行する（デフォルト）
+- batch: Anthropic の Message Batches API にまとめて送信し、処理済みになるまでポーリングする（batch_eval）
+- packed: pack_size 件の会話を1つの評価リクエストにまとめる（batch_eval）
+"""
+
+import json
+import asyncio
+import logging
+import time
+from pathlib import Path
+from datetime import datetime
+
+from auto_debugging import ConversationTestingSystem
+from transcript import ConversationLog
+from transcript_log import find_transcripts
+from results_store import ResultsStore, content_hash, EVALUATIONS_DIRNAME
+EVALUATION_BACKENDS = ("agent", "batch", "packed")
+
+logger = logging.getLogger("ConversationTest.OfflineEval")
+
+
+def transcript_messages(path) -> list:
+    """会話ログから評価エージェントへ渡すメッセージ（run_conversation_test と同じ形式）を復元"""
+    return ConversationLog.load(path).messages()
+
+
+def _result_path(output_dir: Path, logs_dir: Path, transcript: Path) -> Path:
+    """評価結果の保存先（ログディレクトリからの相対パスをファイル名にする）"""
+    relative = transcript.relative_to(logs_dir).with_suffix("")
+    return output_dir / ("__".join(relative.parts) + ".json")
+
+
+def _messages_hash(messages: list) -> str:
+    """評価するメッセージの内容ハッシュ（会話ログが変わったかの判定に使う）"""
+    return content_hash(json.dumps(messages, ensure_ascii=False))
+
+
+def _is_evaluated(result_path: Path, transcript: Path) -> bool:
+    """現在の会話ログの内容で評価済みか（評価結果の transcript_hash と一致するか）"""
+    try:
+        with open(result_path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return False
+    return record.get("transcript_hash") == _messages_hash(transcript_messages(transcript))
+
+
+def _save_result(test_system, transcript: Path, result_path: Path, digest: str, messages: list,
+                 evaluation: str, records: list, **extra):
+    """1件分の評価結果を保存し、結果データベースへの記録対象に加える"""
+    record = {
+        "transcript": str(transcript),
+        "prompt_hash": digest,
+        "transcript_hash": _messages_hash(messages),
+        "model": test_system.evaluator_model_name,
+        "evaluated_at": datetime.now().isoformat(),
+        "messages": len(messages),
+        "evaluation": evaluation,
+        **extra,
+    }
+    tmp_path = result_path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(result_path)
+    records.append(record)
+
+
+async def _evaluate_one(test_system, transcript: Path, result_path: Path, digest: str,
+                        semaphore: asyncio.Semaphore, records: list) -> str:
+    """1件の会話ログを評価して保存し、状態（evaluated / skipped / failed）を返す"""
+    async with semaphore:
+        try:
+            messages = transcript_messages(transcript)
+            if not messages:
+                logger.warning(f"No conversation messages in {transcript}, skipped.")
+                return "skipped"
+
+            # 評価エージェントは履歴を持つため、並列評価では会話ごとに個別のインスタンスを使う
+            evaluation = await test_system.evaluate_conversation(messages, test_system.create_evaluator_agent())
+            _save_result(test_system, transcript, result_path, digest, messages, evaluation, records)
+        except Exception as e:
+            logger.error(f"Evaluation failed for {transcript}: {e}", exc_info=True)
+            print(f"❌ {transcript}: {e}")
+            return "failed"
+
+    print(f"✅ {transcript}")
+    return "evaluated"
+
+
+async def _evaluate_pack(test_system, packer, pack: list, digest: str,
+                         semaphore: asyncio.Semaphore, records: list) -> list:
+    """複数の会話ログを1つの評価リクエストで評価し、会話ごとの状態を返す
+
+    まとめた応答から評価を取り出せなかった会話は、1件ずつ評価エージェントで評価し直す。
+    """
+    async with semaphore:
+        targets = []
+        statuses = []
+        for transcript, result_path in pack:
+            messages = transcript_messages(transcript)
+            if messages:
+                targets.append((transcript, result_path, messages))
+            else:
+                logger.warning(f"No conversation messages in {transcript}, skipped.")
+                statuses.append("skipped")
+        if not targets:
+            return statuses
+
+        try:
+            evaluations = await packer.evaluate([messages for _, _, messages in targets])
+        except Exception as e:
+            logger.error(f"Packed evaluation failed for {len(targets)} transcripts: {e}", exc_info=True)
+            evaluations = [None] * len(targets)
+
+        retry = []
+        for (transcript, result_path, messages), evaluation in zip(targets, evaluations):
+            if evaluation is None:
+                retry.append((transcript, result_path))
+                continue
+            try:
+                _save_result(test_system, transcript, result_path, digest, messages, evaluation, records,
+                             pack_size=len(targets))
+            except Exception as e:
+                logger.error(f"Saving evaluation failed for {transcript}: {e}", exc_info=True)
+                print(f"❌ {transcript}: {e}")
+                statuses.append("failed")
+                continue
+            print(f"✅ {transcript}")
+            statuses.append("evaluated")
+
+    if retry:
+        logger.warning(f"{len(retry)} of {len(targets)} evaluations missing from packed response, evaluating individually.")
+    for transcript, result_path in retry:
+        statuses.append(await _evaluate_one(test_system, transcript, result_path, digest, semaphore, records))
+    return statuses
+
+
+async def _evaluate_batched(test_system, logs_dir: Path, pending: list, digest: str, output_dir: Path,
+                            records: list) -> list:
+    """Message Batches API で評価し、会話ごとの状態を返す"""
+    from batch_eval import AnthropicBatchEvaluator, BATCH_STATE_FILENAME
+
+    statuses = []
+    items = {}
+    targets = {}
+    for transcript, result_path in pending:
+        messages = transcript_messages(transcript)
+        if not messages:
+            logger.warning(f"No conversation messages in {transcript}, skipped.")
+            statuses.append("skipped")
+            continue
+        # custom_id はログディレクトリからの相対パスで決める（再実行時に送信済みのバッチと対応付ける）
+        custom_id = content_hash(transcript.relative_to(logs_dir).as_posix())
+        items[custom_id] = test_system.build_evaluation_input(messages)
+        targets[custom_id] = (transcript, result_path, messages)
+
+    def on_result(custom_id: str, evaluation: str, error: str, batch_id: str):
+        transcript, result_path, messages = targets[custom_id]
+        if evaluation is None:
+            logger.error(f"Batch evaluation failed for {transcript}: {error}")
+            print(f"❌ {transcript}: {error}")
+            statuses.append("failed")
+            return
+        try:
+            _save_result(test_system, transcript, result_path, digest, messages, evaluation, records,
+                         batch_id=batch_id)
+        except Exception as e:
+            logger.error(f"Saving evaluation failed for {transcript}: {e}", exc_info=True)
+            print(f"❌ {transcript}: {e}")
+            statuses.append("failed")
+            return
+        print(f"✅ {transcript}")
+        statuses.append("evaluated")
+
+    if items:
+        evaluator = AnthropicBatchEvaluator.from_env(test_system, output_dir / BATCH_STATE_FILENAME)
+        try:
+            await evaluator.evaluate(items, on_result)
+        finally:
+            await evaluator.close()
+    return statuses
+
+
+async def run_offline_evaluation(logs_dir="logs", concurrency: int = 4, force: bool = False,
+                                 backend: str = "agent", pack_size: int = 5) -> dict:
+    """logs_dir 以下の会話ログを評価プロンプトで再評価し、結果サマリーを返す"""
+    if concurrency < 1:
+        raise ValueError("concurrency は1以上を指定してください。")
+    if backend not in EVALUATION_BACKENDS:
+        raise ValueError(f"Unsupported backend: {backend}. Choose one of {', '.join(EVALUATION_BACKENDS)}.")
+
+    logs_dir = Path(logs_dir)
+    if not logs_dir.is_dir():
+        raise FileNotFoundError(f"ログディレクトリが見つかりません: {logs_dir}")
+
+    # 評価エージェントだけを使うため、会話ログ・システムログ・メトリクスのファイルは作らない
+    test_system = ConversationTestingSystem(log_dir=logs_dir / EVALUATIONS_DIRNAME, verbose=False, session_files=False)
+    digest = test_system.prompt_hashes["evaluator"]
+    output_dir = logs_dir / EVALUATIONS_DIRNAME / digest
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    transcripts = find_transcripts(logs_dir, exclude_dirs=(EVALUATIONS_DIRNAME,))
+    pending = []
+    skipped = 0
+    for transcript in transcripts:
+        result_path = _result_path(output_dir, logs_dir, transcript)
+        if not force and _is_evaluated(result_path, transcript):
+            skipped += 1
+            continue
+        pending.append((transcript, result_path))
+
+    print(f"🔍 会話ログ: {len(transcripts)}件 (評価済み: {skipped}件, 評価対象: {len(pending)}件)")
+    print(f"📝 評価プロンプト: {digest} (方式: {backend}, 同時実行数: {concurrency})")
+    test_system.logger.info(f"Offline evaluation: {len(pending)} pending, {skipped} already scored with prompt {digest}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    records = []
+    try:
+        if backend == "batch":
+            statuses = await _evaluate_batched(test_system, logs_dir, pending, digest, output_dir, records)
+        elif backend == "packed":
+            from batch_eval import PackedEvaluator
+            packer = PackedEvaluator(test_system, pack_size)
+            packs = [pending[i:i + pack_size] for i in range(0, len(pending), pack_size)]
+            results = await asyncio.gather(*[
+                _evaluate_pack(test_system, packer, pack, digest, semaphore, records) for pack in packs
+            ])
+            statuses = [status for pack_statuses in results for status in pack_statuses]
+        else:
+            statuses = await asyncio.gather(*[
+                _evaluate_one(test_system, transcript, result_path, digest, semaphore, records)
+                for transcript, result_path in pending
+            ])
+    finally:
+        test_system.metrics.close()
+
+    store = ResultsStore.from_env()
+    if store and records:
+        with store:
+            store.record_evaluations([
+                {
+                    "transcript": record["transcript"],
+                    "content": record["evaluation"],
+                    "evaluator_prompt_hash": record["prompt_hash"],
+                    "evaluator_model": record["model"],
+                    "evaluated_at": record["evaluated_at"],
+                }
+                for record in records
+            ])
+
+    summary = {
+        "prompt_hash": digest,
+        "backend": backend,
+        "output_dir": str(output_dir),
+        "total_transcripts": len(transcripts),
+        "evaluated": statuses.count("evaluated"),
+        "skipped": skipped + statuses.count("skipped"),
+        "failed": statuses.count("failed"),
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+        "metrics": test_system.metrics.summary(),
+    }
+
+    print("\n📊 再評価結果")
+    print("-" * 40)
+    print(f"  評価: {summary['evaluated']}件 / スキップ: {summary['skipped']}件 / 失敗: {summary['failed']}件")
+    print(f"  所要時間: {summary['elapsed_seconds']}秒")
+    print(f"💾 評価結果: {output_dir}")
+    return summary
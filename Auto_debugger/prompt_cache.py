@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+プロバイダのプロンプトキャッシュ（プレフィックスキャッシュ）の利用
+
+ペルソナ＋会話ガイドライン、評価プロンプトといったシステムプロンプトは毎ターン・毎セッション同一のため、
+プロバイダ側でキャッシュさせると入力トークンの料金と最初のトークンまでの時間を削減できる。
+
+- Anthropic: リクエストの system を以下のブロックに分け、cache_control のブレークポイントを付ける
+    1. シナリオ節（SCENARIO_SECTION_MARKER）より前の静的部分（セッションをまたいで共有）
+    2. システムプロンプト全体（同一セッション内で共有）
+  さらに最後のメッセージにもブレークポイントを付け、伸びていく会話履歴のプレフィックスを再利用する。
+- Gemini（OpenAI互換API）: キャッシュは暗黙的に行われるため、リクエストは変更せず
+  usage.prompt_tokens_details.cached_tokens を記録するのみ。
+
+キャッシュの読み込み/書き込みトークン数は metrics.call_cache_usage を通じてメトリクスに記録される。
+
+フックする先は autogen-ext のクライアントが内部に持つ SDK クライアント（非公開の _client）の
+messages.create / chat.completions.create。実行時に構造が変わって見つからない・非同期関数でない場合はフックせず、
+警告を出してキャッシュなしで続行する。SDK や autogen-ext の更新でこの構造が変わったことは、インストールされている
+実際のクライアントに対するテスト（tests/test_prompt_cache.py）の失敗で検知する。
+共有クライアントへのフックは1回だけ行い、2回目以降（有効化済み）は True を返す。
+"""
+
+import inspect
+import logging
+
+from metrics import call_cache_usage
+
+# create_agents が組み立てるシステムプロンプトで、セッションごとに変わる部分の見出し
+SCENARIO_SECTION_MARKER = "### 現在のシナリオ"
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+logger = logging.getLogger("ConversationTest.PromptCache")
+
+
+def _add_usage(read_tokens: int = 0, write_tokens: int = 0):
+    """呼び出し元（InstrumentedChatCompletionClient）が用意した集計用 dict に加算"""
+    usage = call_cache_usage.get()
+    if usage is None:
+        return
+    usage["cache_read_tokens"] = usage.get("cache_read_tokens", 0) + (read_tokens or 0)
+    usage["cache_write_tokens"] = usage.get("cache_write_tokens", 0) + (write_tokens or 0)
+
+
+def anthropic_system_blocks(system: str) -> list:
+    """system 文字列をキャッシュ用ブレークポイント付きのブロック列に変換"""
+    split_at = system.find(SCENARIO_SECTION_MARKER)
+    if split_at <= 0:
+        return [{"type": "text", "text": system, "cache_control": CACHE_CONTROL}]
+    return [
+        {"type": "text", "text": system[:split_at], "cache_control": CACHE_CONTROL},
+        {"type": "text", "text": system[split_at:], "cache_control": CACHE_CONTROL},
+    ]
+
+
+def _mark_last_message(messages: list) -> list:
+    """最後のメッセージにブレークポイントを付ける（会話履歴のプレフィックス用）"""
+    if not messages:
+        return messages
+    last = dict(messages[-1])
+    content = last.get("content")
+    if isinstance(content, str):
+        if not content:
+            return messages
+        last["content"] = [{"type": "text", "text": content, "cache_control": CACHE_CONTROL}]
+    elif isinstance(content, list) and content and isinstance(content[-1], dict):
+        blocks = list(content)
+        blocks[-1] = {**blocks[-1], "cache_control": CACHE_CONTROL}
+        last["content"] = blocks
+    else:
+        return messages
+    return list(messages[:-1]) + [last]
+
+
+def _hook_target(api) -> bool:
+    """フックできる SDK の API か（create が非同期関数であること。SDK は引数検証のデコレーターで包んでいる）"""
+    create = getattr(api, "create", None)
+    return api is not None and create is not None and inspect.iscoroutinefunction(inspect.unwrap(create))
+
+
+def enable_anthropic_prompt_cache(model_client, cache_history: bool = True) -> bool:
+    """AnthropicChatCompletionClient が使う SDK クライアントの messages.create をフックする（有効化済みなら True）"""
+    messages_api = getattr(getattr(model_client, "_client", None), "messages", None)
+    if getattr(messages_api, "_prompt_cache_enabled", False):
+        return True
+    if not _hook_target(messages_api):
+        return False
+    original_create = messages_api.create
+
+    async def create(**request_args):
+        system = request_args.get("system")
+        if isinstance(system, str) and system:
+            request_args["system"] = anthropic_system_blocks(system)
+        if cache_history and isinstance(request_args.get("messages"), list):
+            request_args["messages"] = _mark_last_message(request_args["messages"])
+
+        response = await original_create(**request_args)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            _add_usage(
+                read_tokens=getattr(usage, "cache_read_input_tokens", 0),
+                write_tokens=getattr(usage, "cache_creation_input_tokens", 0),
+            )
+        return response
+
+    messages_api.create = create
+    messages_api._prompt_cache_enabled = True
+    return True
+
+
+def enable_openai_cache_reporting(model_client) -> bool:
+    """OpenAI互換クライアント（Gemini）の暗黙キャッシュのヒットトークン数を記録する（有効化済みなら True）"""
+    completions_api = getattr(getattr(getattr(model_client, "_client", None), "chat", None), "completions", None)
+    if getattr(completions_api, "_prompt_cache_enabled", False):
+        return True
+    if not _hook_target(completions_api):
+        return False
+    original_create = completions_api.create
+
+    async def create(*args, **kwargs):
+        response = await original_create(*args, **kwargs)
+        details = getattr(getattr(response, "usage", None), "prompt_tokens_details", None)
+        if details is not None:
+            _add_usage(read_tokens=getattr(details, "cached_tokens", 0))
+        return response
+
+    completions_api.create = create
+    completions_api._prompt_cache_enabled = True
+    return True
+
+
+def enable_prompt_cache(model_client, api_provider: str, cache_history: bool = True) -> bool:
+    """プロバイダに応じてプロンプトキャッシュを有効化（対応していないクライアントでは何もしない）"""
+    if api_provider == "anthropic":
+        enabled = enable_anthropic_prompt_cache(model_client, cache_history=cache_history)
+    elif api_provider == "gemini":
+        enabled = enable_openai_cache_reporting(model_client)
+    else:
+        enabled = False
+    if not enabled:
+        logger.warning(f"Prompt cache could not be enabled for {type(model_client).__name__} ({api_provider})")
+    return enabled
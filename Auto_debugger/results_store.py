@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+会話テスト結果のローカルデータベース（SQLite）
+
+セッション（シナリオ・モデル設定・ペルソナファイルのハッシュ・レイテンシ）、各発言、
+評価結果と、評価テキストから抽出した数値スコア（★の数）を索引付きで保存する。
+プロンプトの改訂ごとの比較などを SQL 1本で行えるようにする。
+
+テーブル:
+- sessions: 1会話1行（transcript = 会話ログのパスで一意。結果データベースのディレクトリからの相対パスに正規化し、
+  "logs" / "./logs/" / 絶対パスのような指定の違いで同じ会話が重複しないようにする）
+- turns: 各発言（latency_seconds を含む）
+- evaluations: 評価結果（同じ会話でも評価プロンプトのハッシュごとに1行）
+- scores: 評価項目ごとの数値スコア
+
+環境変数:
+- RESULTS_DB: データベースファイルのパス（デフォルト: logs/results.db、"none" で記録しない）
+
+使い方（既存ログの取り込みと集計の表示）:
+    python results_store.py import [logs]
+    python results_store.py report
+"""
+
+import os
+import re
+import sys
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from datetime import datetime
+
+from transcript_log import read_transcript, find_transcripts
+
+DEFAULT_DB_PATH = "logs/results.db"
+# 再評価の結果と評価用のログの保存先（<ログディレクトリ>/evaluations/、offline_eval）。会話ログとしては取り込まない
+EVALUATIONS_DIRNAME = "evaluations"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    transcript TEXT NOT NULL UNIQUE,
+    session_tag TEXT,
+    scenario TEXT,
+    started_at TEXT,
+    api_provider TEXT,
+    customer_model TEXT,
+    staff_model TEXT,
+    customer_persona_hash TEXT,
+    staff_persona_hash TEXT,
+    context_policy TEXT,
+    total_turns INTEGER,
+    termination_reason TEXT,
+    ended_naturally INTEGER,
+    time_to_first_turn_seconds REAL,
+    mean_turn_latency_seconds REAL,
+    max_turn_latency_seconds REAL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_customer_persona ON sessions (customer_persona_hash);
+CREATE INDEX IF NOT EXISTS idx_sessions_scenario ON sessions (scenario);
+
+CREATE TABLE IF NOT EXISTS turns (
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    turn_index INTEGER NOT NULL,
+    speaker TEXT,
+    content TEXT,
+    latency_seconds REAL,
+    timestamp TEXT,
+    route TEXT,
+    PRIMARY KEY (session_id, turn_index)
+);
+
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    evaluator_prompt_hash TEXT NOT NULL DEFAULT '',
+    evaluator_model TEXT,
+    evaluated_at TEXT,
+    content TEXT,
+    UNIQUE (session_id, evaluator_prompt_hash)
+);
+CREATE INDEX IF NOT EXISTS idx_evaluations_prompt ON evaluations (evaluator_prompt_hash);
+
+CREATE TABLE IF NOT EXISTS scores (
+    evaluation_id INTEGER NOT NULL REFERENCES evaluations (id) ON DELETE CASCADE,
+    criterion TEXT NOT NULL,
+    score REAL NOT NULL,
+    max_score REAL,
+    PRIMARY KEY (evaluation_id, criterion)
+);
+CREATE INDEX IF NOT EXISTS idx_scores_criterion ON scores (criterion);
+"""
+
+# mean_scores の group_by に指定できる列
+GROUPABLE_COLUMNS = (
+    "customer_persona_hash", "staff_persona_hash", "evaluator_prompt_hash",
+    "customer_model", "staff_model", "api_provider", "context_policy", "scenario",
+)
+
+# 「- 顧客ペルソナ一貫性：★★★★☆ (5段階)」形式
+_STAR_SCORE_PATTERN = re.compile(
+    r"^[\s#>*・\-]*(?:\d+[.)]\s*)?\**(?P<name>[^：:\n*★☆]+?)\**\s*[：:]\s*\**(?P<stars>[★☆]+)(?:\s*[（(](?P<max>\d+)段階[)）])?",
+    re.MULTILINE,
+)
+# 「### 1. ペルソナ一貫性: 5/5点」形式
+_NUMERIC_SCORE_PATTERN = re.compile(
+    r"^[\s#>*・\-]*(?:\d+[.)]\s*)?\**(?P<name>[^：:\n*★☆]+?)\**\s*[：:]\s*\**(?P<score>\d+(?:\.\d+)?)\s*/\s*(?P<max>\d+(?:\.\d+)?)\s*点?",
+    re.MULTILINE,
+)
+
+
+def content_hash(text: str) -> str:
+    """プロンプト・ペルソナの内容ハッシュ（バージョンの識別に使う）"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_scores(evaluation: str) -> dict:
+    """評価テキストから {評価項目: (スコア, 満点)} を抽出（評価プロンプトの ★ 形式と「n/m点」形式）"""
+    scores = {}
+    if not evaluation:
+        return scores
+    for match in _STAR_SCORE_PATTERN.finditer(evaluation):
+        stars = match.group("stars")
+        max_score = float(match.group("max")) if match.group("max") else float(len(stars))
+        scores[match.group("name").strip()] = (float(stars.count("★")), max_score)
+    for match in _NUMERIC_SCORE_PATTERN.finditer(evaluation):
+        scores.setdefault(match.group("name").strip(), (float(match.group("score")), float(match.group("max"))))
+    return scores
+
+
+class ResultsStore:
+    """結果データベースへの書き込みと集計クエリ"""
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.root = self.path.parent.resolve()
+        # 複数プロセスからの同時書き込みはロック解放を待つ（WAL で読み込みは書き込みを妨げない）
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls):
+        """環境変数 RESULTS_DB から生成（"none" / 空文字の場合は None）"""
+        path = os.getenv('RESULTS_DB', DEFAULT_DB_PATH)
+        if not path or path.lower() == "none":
+            return None
+        return cls(path)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def transcript_key(self, transcript) -> str:
+        """会話ログのパスを sessions.transcript のキーに正規化（データベースのディレクトリ外なら絶対パス）"""
+        path = Path(transcript).resolve()
+        try:
+            return path.relative_to(self.root).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def _upsert_session(self, session: dict) -> int:
+        session = {**session, "transcript": self.transcript_key(session["transcript"])}
+        columns = list(session)
+        updates = ", ".join(f"{c} = excluded.{c}" for c in columns if c != "transcript")
+        self.conn.execute(
+            f"INSERT INTO sessions ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+            f"ON CONFLICT (transcript) DO {f'UPDATE SET {updates}' if updates else 'NOTHING'}",
+            [session[c] for c in columns],
+        )
+        return self.conn.execute("SELECT id FROM sessions WHERE transcript = ?", (session["transcript"],)).fetchone()[0]
+
+    def _insert_evaluation(self, session_id: int, evaluation: dict):
+        # 評価プロンプト不明（過去ログの取り込み）は空文字として一意制約に含める
+        prompt_hash = evaluation.get("evaluator_prompt_hash") or ""
+        self.conn.execute(
+            "INSERT INTO evaluations (session_id, evaluator_prompt_hash, evaluator_model, evaluated_at, content) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (session_id, evaluator_prompt_hash) DO UPDATE SET "
+            "evaluator_model = excluded.evaluator_model, evaluated_at = excluded.evaluated_at, content = excluded.content",
+            (session_id, prompt_hash, evaluation.get("evaluator_model"),
+             evaluation.get("evaluated_at") or datetime.now().isoformat(), evaluation["content"]),
+        )
+        evaluation_id = self.conn.execute(
+            "SELECT id FROM evaluations WHERE session_id = ? AND evaluator_prompt_hash = ?",
+            (session_id, prompt_hash),
+        ).fetchone()[0]
+        self.conn.execute("DELETE FROM scores WHERE evaluation_id = ?", (evaluation_id,))
+        self.conn.executemany(
+            "INSERT INTO scores (evaluation_id, criterion, score, max_score) VALUES (?, ?, ?, ?)",
+            [(evaluation_id, name, score, max_score) for name, (score, max_score) in parse_scores(evaluation["content"]).items()],
+        )
+
+    def record_sessions(self, records: list):
+        """セッションをまとめて記録（1トランザクション）
+
+        records の各要素: {"session": {sessions の列}, "turns": [会話ログのエントリ], "evaluation": {...} または None}
+        同じ transcript のセッションは上書きされる。
+        """
+        with self.conn:
+            for record in records:
+                session_id = self._upsert_session(record["session"])
+                turns = record.get("turns")
+                if turns is not None:
+                    self.conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+                    self.conn.executemany(
+                        "INSERT INTO turns (session_id, turn_index, speaker, content, latency_seconds, timestamp, route) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        [(session_id, i, t.get("speaker"), t.get("content"), t.get("latency_seconds"), t.get("timestamp"),
+                          t.get("route"))
+                         for i, t in enumerate(turns)],
+                    )
+                if record.get("evaluation"):
+                    self._insert_evaluation(session_id, record["evaluation"])
+
+    def record_session(self, session: dict, turns: list = None, evaluation: dict = None):
+        self.record_sessions([{"session": session, "turns": turns, "evaluation": evaluation}])
+
+    def record_evaluations(self, evaluations: list):
+        """既存セッションの評価をまとめて記録（offline_eval の再評価結果など）
+
+        evaluations の各要素: {"transcript": 会話ログのパス, "content": 評価テキスト, "evaluator_prompt_hash": ..., ...}
+        セッションが未登録の場合は transcript のみのセッションとして登録する。
+        """
+        with self.conn:
+            for evaluation in evaluations:
+                row = self.conn.execute(
+                    "SELECT id FROM sessions WHERE transcript = ?", (self.transcript_key(evaluation["transcript"]),)
+                ).fetchone()
+                session_id = row[0] if row else self._upsert_session({"transcript": evaluation["transcript"]})
+                self._insert_evaluation(session_id, evaluation)
+
+    def query(self, sql: str, params=()) -> list:
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def mean_scores(self, group_by: str = "customer_persona_hash", criterion: str = None,
+                    evaluator_prompt_hash: str = None) -> list:
+        """評価項目ごとの平均スコア（デフォルトは顧客ペルソナのバージョン別）"""
+        if group_by not in GROUPABLE_COLUMNS:
+            raise ValueError(f"Unsupported group_by: {group_by}. Choose one of {', '.join(GROUPABLE_COLUMNS)}.")
+        column = f"e.{group_by}" if group_by == "evaluator_prompt_hash" else f"s.{group_by}"
+        conditions, params = [], []
+        if criterion:
+            conditions.append("sc.criterion = ?")
+            params.append(criterion)
+        if evaluator_prompt_hash:
+            conditions.append("e.evaluator_prompt_hash = ?")
+            params.append(evaluator_prompt_hash)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return self.query(
+            f"SELECT {column} AS {group_by}, sc.criterion, COUNT(*) AS n, "
+            f"ROUND(AVG(sc.score), 3) AS mean_score, MAX(sc.max_score) AS max_score "
+            f"FROM scores sc JOIN evaluations e ON e.id = sc.evaluation_id JOIN sessions s ON s.id = e.session_id "
+            f"{where} GROUP BY {column}, sc.criterion ORDER BY {column}, sc.criterion",
+            params,
+        )
+
+    def slowest_scenarios(self, limit: int = 10) -> list:
+        """1ターンあたりの平均レイテンシが大きいシナリオ"""
+        return self.query(
+            "SELECT s.scenario, COUNT(DISTINCT s.id) AS sessions, COUNT(t.latency_seconds) AS turns, "
+            "ROUND(AVG(t.latency_seconds), 3) AS mean_latency_seconds, ROUND(MAX(t.latency_seconds), 3) AS max_latency_seconds "
+            "FROM sessions s JOIN turns t ON t.session_id = s.id "
+            "WHERE t.latency_seconds IS NOT NULL "
+            "GROUP BY s.scenario ORDER BY mean_latency_seconds DESC LIMIT ?",
+            (limit,),
+        )
+
+    def termination_counts(self, group_by: str = "customer_persona_hash") -> list:
+        """終了理由（done / loop / stall / ...）の件数"""
+        if group_by not in GROUPABLE_COLUMNS or group_by == "evaluator_prompt_hash":
+            raise ValueError(f"Unsupported group_by: {group_by}.")
+        return self.query(
+            f"SELECT {group_by}, termination_reason, COUNT(*) AS n FROM sessions "
+            f"GROUP BY {group_by}, termination_reason ORDER BY {group_by}, n DESC"
+        )
+
+
+def session_row(transcript, entries: list, **fields) -> dict:
+    """会話ログのエントリから sessions の行を組み立てる（fields で列を上書き）"""
+    latencies = [e["latency_seconds"] for e in entries if e.get("latency_seconds") is not None]
+    scenario_entry = next((e for e in entries if e.get("speaker") == "System"), None)
+    scenario = scenario_entry["content"].removeprefix("シナリオ: ") if scenario_entry else None
+    row = {
+        "transcript": str(transcript),
+        "session_tag": Path(transcript).stem.removeprefix("chat_"),
+        "scenario": scenario,
+        "started_at": entries[0].get("timestamp") if entries else None,
+        "total_turns": sum(1 for e in entries if e.get("speaker") not in ("System", "Evaluator")),
+        "mean_turn_latency_seconds": round(sum(latencies) / len(latencies), 3) if latencies else None,
+        "max_turn_latency_seconds": max(latencies) if latencies else None,
+    }
+    row.update(fields)
+    return row
+
+
+def import_logs(store: ResultsStore, logs_dir="logs", batch_size: int = 500) -> int:
+    """既存の会話ログ（chat_*.jsonl / chat_*.json）をまとめて取り込み、件数を返す
+
+    記録済みの会話ログと evaluations/ 以下は読み飛ばす。ログ内の Evaluator の発言は評価プロンプト不明
+    （evaluator_prompt_hash = ''）の評価として記録する。
+    """
+    known = {row["transcript"] for row in store.query("SELECT transcript FROM sessions")}
+    records = []
+    count = 0
+    for transcript in find_transcripts(logs_dir, exclude_dirs=(EVALUATIONS_DIRNAME,)):
+        if store.transcript_key(transcript) in known:
+            continue
+        entries = read_transcript(transcript)
+        evaluation_entry = next((e for e in reversed(entries) if e.get("speaker") == "Evaluator"), None)
+        records.append({
+            "session": session_row(transcript, entries),
+            "turns": entries,
+            "evaluation": {
+                "content": evaluation_entry["content"],
+                "evaluated_at": evaluation_entry.get("timestamp"),
+            } if evaluation_entry else None,
+        })
+        if len(records) >= batch_size:
+            store.record_sessions(records)
+            count += len(records)
+            records = []
+    if records:
+        store.record_sessions(records)
+        count += len(records)
+    return count
+
+
+def _print_rows(title: str, rows: list):
+    print(f"\n{title}")
+    print("-" * 40)
+    for row in rows:
+        print("  " + json.dumps(row, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("import", "report"):
+        print("使い方: python results_store.py import [ログディレクトリ] | report")
+        sys.exit(1)
+    store = ResultsStore.from_env() or ResultsStore()
+    with store:
+        if sys.argv[1] == "import":
+            logs_dir = sys.argv[2] if len(sys.argv) > 2 else "logs"
+            print(f"💾 {import_logs(store, logs_dir)}件の会話ログを取り込みました: {store.path}")
+        else:
+            _print_rows("📊 顧客ペルソナ別の平均スコア", store.mean_scores())
+            _print_rows("🐢 平均レイテンシの大きいシナリオ", store.slowest_scenarios())
+            _print_rows("🛑 終了理由の内訳", store.termination_counts())
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+ロールごとのモデルルーティング（ヘッジリクエストとフェイルオーバー）
+
+1つのプロバイダの遅い応答（テールレイテンシ）がバッチ全体の進みを決めてしまうため、
+ロール（customer / staff / evaluator）ごとに複数のルート（プロバイダ:モデル）を設定できるようにする。
+
+- ヘッジ: 最初のルートが締め切り（デフォルト: そのルートの直近の成功レイテンシの p95）までに応答しなければ、
+  次のルートにも同じリクエストを送り、先に返ってきた応答を使う（もう一方はキャンセルする）
+- フェイルオーバー: ルートがエラーになった場合（プール側の再試行を使い切った後）は次のルートで再実行する
+- どのルートが応答したかは call_route に書き込まれ、メトリクス（metrics_*.jsonl の route / hedged / failed_over）と
+  会話ログの各ターンに記録される
+- ストリーミング（MODEL_CLIENT_STREAM=1）ではフェイルオーバーのみ行う（最初のチャンクを受け取る前のエラーに限る）
+
+環境変数:
+- ROUTE_CUSTOMER / ROUTE_STAFF / ROUTE_EVALUATOR: "プロバイダ:モデル" のカンマ区切り（先頭が優先ルート）
+  例: ROUTE_STAFF=anthropic:claude-3-5-sonnet-20240620,gemini:gemini-1.5-flash-latest
+- HEDGE_DEADLINE（デフォルト: p95）: "p95" などのパーセンタイル、秒数、または "off"（フェイルオーバーのみ）
+  ロールごとに HEDGE_DEADLINE_STAFF のように上書きできる
+- HEDGE_MIN_SAMPLES（デフォルト: 20）: パーセンタイルを使うのに必要な成功レイテンシの件数
+- HEDGE_INITIAL_DEADLINE（秒, デフォルト: 10.0）: 件数が足りない間の締め切り
+"""
+
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from model_clients import DelegatingChatCompletionClient
+from metrics import call_route, call_retries, call_cache_usage, percentile
+
+LATENCY_WINDOW = 200
+
+logger = logging.getLogger("ConversationTest.Routing")
+
+# ルートごとの直近の成功レイテンシ（プロセス内の全セッションで共有し、締め切りの p95 を求める）
+route_latencies = {}
+
+
+def record_latency(route: str, seconds: float):
+    route_latencies.setdefault(route, deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+
+class HedgeDeadline:
+    """ヘッジを送るまでの締め切り（固定秒数、またはルートの成功レイテンシのパーセンタイル）"""
+
+    def __init__(self, spec: str = "p95", min_samples: int = 20, initial: float = 10.0):
+        spec = (spec or "p95").strip().lower()
+        self.enabled = spec not in ("off", "none", "0")
+        self.pct = float(spec[1:]) if spec.startswith("p") else None
+        self.fixed = None if self.pct is not None or not self.enabled else float(spec)
+        self.min_samples = min_samples
+        self.initial = initial
+
+    @classmethod
+    def from_env(cls, role: str):
+        return cls(
+            spec=os.getenv(f"HEDGE_DEADLINE_{role.upper()}") or os.getenv('HEDGE_DEADLINE', 'p95'),
+            min_samples=int(os.getenv('HEDGE_MIN_SAMPLES', '20')),
+            initial=float(os.getenv('HEDGE_INITIAL_DEADLINE', '10.0')),
+        )
+
+    def seconds(self, route: str):
+        if not self.enabled:
+            return None
+        if self.fixed is not None:
+            return self.fixed
+        latencies = route_latencies.get(route) or ()
+        if len(latencies) < self.min_samples:
+            return self.initial
+        return percentile(list(latencies), self.pct)
+
+
+class RoutingChatCompletionClient(DelegatingChatCompletionClient):
+    """複数ルートへのヘッジとフェイルオーバーを行うクライアント（inner は優先ルート）
+
+    routes は (ルート名, クライアント) のリスト。先頭が優先ルートで、model_info などは優先ルートのものを使う。
+    """
+
+    def __init__(self, routes: list, role: str, deadline: HedgeDeadline = None):
+        if not routes:
+            raise ValueError("ルートが1つもありません。")
+        super().__init__(routes[0][1])
+        self.routes = routes
+        self.role = role
+        self.deadline = deadline or HedgeDeadline()
+        # 直近の呼び出しで応答したルート（同じセッション・ロールの呼び出しは順番に行われる）
+        self.last_route = None
+
+    def _report(self, route: str, hedged: bool, failed_over: bool):
+        self.last_route = route
+        info = call_route.get()
+        if info is not None:
+            info.update(route=route, hedged=hedged, failed_over=failed_over)
+
+    async def _call(self, name: str, client, messages, kwargs, attempt: dict):
+        """1ルートへの呼び出し（タスクとして実行する）
+
+        タスクは呼び出し元のコンテキストのコピーで動くため、プール側が書き込むリトライ回数とキャッシュの利用量は
+        タスク内で初期化し、attempt に書き出す（呼び出し元には採用したルートの分だけ反映する）。
+        """
+        call_retries.set(0)
+        call_cache_usage.set({})
+        started = time.monotonic()
+        try:
+            result = await client.create(messages, **kwargs)
+        except asyncio.CancelledError:
+            # ヘッジに負けて取り消された呼び出しも、少なくともここまでかかったことを記録する
+            # （速い応答だけを記録すると締め切りのパーセンタイルが下がり続け、ヘッジが増えていくため）
+            record_latency(name, time.monotonic() - started)
+            raise
+        finally:
+            attempt.update(retries=call_retries.get(), cache_usage=call_cache_usage.get())
+        record_latency(name, time.monotonic() - started)
+        return result
+
+    @staticmethod
+    def _merge_attempt(attempt: dict, with_cache_usage: bool):
+        """ルートの呼び出しのリトライ回数（と採用したルートのキャッシュの利用量）を呼び出し元に反映する"""
+        call_retries.set(call_retries.get() + attempt.get("retries", 0))
+        usage = call_cache_usage.get()
+        if with_cache_usage and usage is not None:
+            for key, value in (attempt.get("cache_usage") or {}).items():
+                usage[key] = usage.get(key, 0) + value
+
+    async def create(self, messages, **kwargs):
+        pending = list(self.routes)
+        running = {}
+        errors = []
+        hedged = False
+        started = time.monotonic()
+
+        attempts = {}
+
+        def launch(route):
+            name, client = route
+            attempt = {}
+            task = asyncio.ensure_future(self._call(name, client, messages, kwargs, attempt))
+            running[task] = name
+            attempts[task] = attempt
+
+        launch(pending.pop(0))
+        deadline = self.deadline.seconds(self.routes[0][0])
+        try:
+            while running:
+                timeout = None
+                if pending and not hedged and deadline is not None:
+                    timeout = max(0.0, deadline - (time.monotonic() - started))
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 締め切りまでに応答がない: 次のルートにもリクエストを送る
+                    hedged = True
+                    logger.info(f"Hedging {self.role} request to {pending[0][0]} after {deadline:.2f}s")
+                    launch(pending.pop(0))
+                    continue
+                for task in done:
+                    name = running.pop(task)
+                    if task.exception() is None:
+                        self._merge_attempt(attempts[task], with_cache_usage=True)
+                        self._report(name, hedged, failed_over=bool(errors))
+                        return task.result()
+                    self._merge_attempt(attempts[task], with_cache_usage=False)
+                    errors.append(task.exception())
+                    logger.warning(f"Route {name} failed for {self.role}: {type(task.exception()).__name__}: {task.exception()}")
+                if not running and pending:
+                    launch(pending.pop(0))
+            raise errors[-1]
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+    async def create_stream(self, messages, **kwargs):
+        errors = []
+        for name, client in self.routes:
+            received = False
+            started = time.monotonic()
+            try:
+                async for chunk in client.create_stream(messages, **kwargs):
+                    received = True
+                    yield chunk
+                record_latency(name, time.monotonic() - started)
+                self._report(name, hedged=False, failed_over=bool(errors))
+                return
+            except Exception as e:
+                # 出力を返し始めた後の失敗は、別のルートで再実行すると重複するため、そのまま送出する
+                if received:
+                    raise
+                errors.append(e)
+                logger.warning(f"Route {name} failed for {self.role}: {type(e).__name__}: {e}")
+        raise errors[-1]
+
+    async def close(self):
+        # ルートのクライアントはプールで共有しているため、ここではクローズしない
+        pass
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+顧客ペルソナ × シナリオ × プロバイダのスイープ実行
+
+スイープ定義ファイル（YAML / JSON）から全組み合わせ（セル）を展開し、バッチ実行で同時に実行する。
+
+- セルIDは内容ハッシュ（顧客ペルソナ・スタッフペルソナ・評価プロンプトの内容、シナリオ、初期メッセージ、
+  最大ターン数、プロバイダと config.RunSettings で解決したモデル名・ROUTE_<ROLE> のルート）から決まるため、
+  内容が同じセル（同一内容のペルソナファイルなど）は
+  1回だけ実行する（比較表には同じセルになったすべてのペルソナのラベルで集計する）
+- 出力先はスイープ定義のファイル名から決まる（logs/sweep_<ファイル名>）。完了したセルはチェックポイントに記録されるため、
+  中断したスイープを同じコマンドで再実行すると、完了済みのセルをスキップして途中から再開する
+  （ペルソナやシナリオを追加した場合も、既存のセルは再実行しない）
+- 終了時に（ペルソナ, プロバイダ）ごとの評価スコアとレイテンシの比較表を表示し、comparison.csv に保存する
+
+スイープ定義の例（YAML）:
+    personas:                       # 顧客ペルソナファイル（ラベル: パス、またはパスのリスト）
+      v1: personas/customer_v1.md
+      v2: personas/customer_v2.md
+    providers: [anthropic, gemini]  # 省略時は API_PROVIDER
+    scenarios: scenarios.jsonl      # シナリオファイル、またはシナリオのリスト（バッチ実行と同じ形式）
+    max_turns: 40
+"""
+
+import os
+import csv
+import json
+from pathlib import Path
+from itertools import zip_longest
+
+from batch_runner import load_scenarios, run_batch, _normalize_scenario
+from checkpoint import checkpoint_path, is_complete
+from results_store import content_hash, parse_scores
+from config import PROVIDERS, RunSettings
+
+
+def load_sweep(path) -> dict:
+    """スイープ定義ファイル（YAML / JSON）の読み込み"""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"スイープ定義ファイルが見つかりません: {path}")
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.suffix.lower() in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML形式のスイープ定義には PyYAML が必要です。pip install pyyaml を実行してください")
+            spec = yaml.safe_load(f) or {}
+        else:
+            spec = json.load(f)
+
+    if not spec.get("personas"):
+        raise ValueError("スイープ定義に personas がありません。")
+    if not spec.get("scenarios"):
+        raise ValueError("スイープ定義に scenarios がありません。")
+
+    # 相対パスはスイープ定義ファイルの場所から解決する
+    base_dir = path.parent
+    personas = spec["personas"]
+    if isinstance(personas, list):
+        personas = {Path(p).stem: p for p in personas}
+    spec["personas"] = {label: str(base_dir / p) for label, p in personas.items()}
+
+    if isinstance(spec["scenarios"], str):
+        spec["scenarios"] = load_scenarios(base_dir / spec["scenarios"])
+    else:
+        spec["scenarios"] = [_normalize_scenario(entry, i) for i, entry in enumerate(spec["scenarios"])]
+
+    providers = spec.get("providers") or [os.getenv('API_PROVIDER', 'anthropic')]
+    spec["providers"] = [p.lower() for p in providers]
+    for provider in spec["providers"]:
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unsupported provider: {provider}. Choose 'anthropic' or 'gemini'.")
+    return spec
+
+
+def _read_text(path) -> str:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def plan_cells(spec: dict, default_max_turns: int = 100) -> list:
+    """全組み合わせを展開し、内容ハッシュが同じセルを除いて返す（プロバイダが交互になる順に並べる）"""
+    shared_hash = content_hash(_read_text("staff_persona.md") + "\n" + _read_text("evaluator_prompt.md"))
+    cells_by_provider = {provider: [] for provider in spec["providers"]}
+    seen = {}
+    # プロバイダごとに解決したモデル名（デフォルトを含む）と ROUTE_<ROLE> のルートをセルの内容に含める
+    resolved = {}
+    for provider in spec["providers"]:
+        settings = RunSettings(provider)
+        resolved[provider] = [
+            settings.model_names,
+            {role: [f"{p}:{m}" for p, m in routes] for role, routes in settings.routes.items()},
+        ]
+
+    for label, persona_file in spec["personas"].items():
+        persona_hash = content_hash(_read_text(persona_file))
+        for scenario in spec["scenarios"]:
+            max_turns = scenario["max_turns"] or spec.get("max_turns") or default_max_turns
+            for provider in spec["providers"]:
+                cell_id = content_hash(json.dumps(
+                    [persona_hash, shared_hash, scenario["scenario"], scenario["initial_message"], max_turns, provider,
+                     *resolved[provider]],
+                    ensure_ascii=False, sort_keys=True,
+                ))
+                if cell_id in seen:
+                    if label != seen[cell_id]["persona"] and label not in seen[cell_id]["aliases"]:
+                        seen[cell_id]["aliases"].append(label)
+                    continue
+                cell = {
+                    "id": cell_id,
+                    "persona": label,
+                    "aliases": [],
+                    "persona_hash": persona_hash,
+                    "scenario_id": scenario["id"],
+                    "scenario": scenario["scenario"],
+                    "initial_message": scenario["initial_message"],
+                    "max_turns": max_turns,
+                    "api_provider": provider,
+                    "customer_persona_file": persona_file,
+                }
+                seen[cell_id] = cell
+                cells_by_provider[provider].append(cell)
+
+    # プロバイダごとのレート制限を同時に使えるよう、プロバイダを交互に並べる
+    return [cell for group in zip_longest(*cells_by_provider.values()) for cell in group if cell is not None]
+
+
+def _add_to_group(group: dict, session: dict):
+    group["cells"] += 1
+    if not session or session["status"] not in ("ok", "skipped"):
+        return
+    group["completed"] += 1
+    for criterion, (score, _) in parse_scores(session.get("evaluation")).items():
+        group["scores"].setdefault(criterion, []).append(score)
+    if session.get("time_to_first_turn_seconds") is not None:
+        group["ttft"].append(session["time_to_first_turn_seconds"])
+    if session.get("mean_turn_latency_seconds") is not None:
+        group["turn_latency"].append(session["mean_turn_latency_seconds"])
+
+
+def comparison_rows(cells: list, sessions: list) -> list:
+    """（ペルソナ, プロバイダ）ごとの評価スコアとレイテンシの集計
+
+    内容が同じため1回だけ実行したセルは、同じセルになったすべてのペルソナ（aliases）の行にも集計する。
+    """
+    sessions_by_id = {s["id"]: s for s in sessions}
+    groups = {}
+    for cell in cells:
+        for label in [cell["persona"], *cell.get("aliases", [])]:
+            _add_to_group(groups.setdefault((label, cell["api_provider"]), {
+                "cells": 0, "completed": 0, "scores": {}, "ttft": [], "turn_latency": [],
+            }), sessions_by_id.get(cell["id"]))
+
+    def mean(values):
+        return round(sum(values) / len(values), 3) if values else None
+
+    rows = []
+    for (persona, provider), group in groups.items():
+        criterion_means = {criterion: mean(values) for criterion, values in sorted(group["scores"].items())}
+        rows.append({
+            "persona": persona,
+            "provider": provider,
+            "cells": group["cells"],
+            "completed": group["completed"],
+            "mean_score": mean([v for v in criterion_means.values() if v is not None]),
+            "time_to_first_turn_seconds": mean(group["ttft"]),
+            "mean_turn_latency_seconds": mean(group["turn_latency"]),
+            "scores": criterion_means,
+        })
+    return rows
+
+
+def print_comparison(rows: list):
+    print("\n📊 スイープ比較表（ペルソナ × プロバイダ）")
+    print("-" * 80)
+    print(f"{'persona':<16} {'provider':<10} {'done':>7} {'score':>6} {'ttft(s)':>8} {'turn(s)':>8}  scores")
+    for row in rows:
+        scores = ", ".join(f"{k}={v}" for k, v in row["scores"].items())
+        print(f"{row['persona']:<16} {row['provider']:<10} {row['completed']:>3}/{row['cells']:<3} "
+              f"{row['mean_score'] if row['mean_score'] is not None else '-':>6} "
+              f"{row['time_to_first_turn_seconds'] if row['time_to_first_turn_seconds'] is not None else '-':>8} "
+              f"{row['mean_turn_latency_seconds'] if row['mean_turn_latency_seconds'] is not None else '-':>8}  {scores}")
+
+
+def write_comparison_csv(rows: list, path):
+    criteria = sorted({criterion for row in rows for criterion in row["scores"]})
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["persona", "provider", "cells", "completed", "mean_score",
+                         "time_to_first_turn_seconds", "mean_turn_latency_seconds"] + criteria)
+        for row in rows:
+            writer.writerow([row["persona"], row["provider"], row["cells"], row["completed"], row["mean_score"],
+                             row["time_to_first_turn_seconds"], row["mean_turn_latency_seconds"]]
+                            + [row["scores"].get(c) for c in criteria])
+
+
+async def run_sweep(sweep_file, concurrency: int = 4, max_turns: int = 100, output_dir=None, workers: int = 1) -> dict:
+    """スイープを実行（中断後の再実行では完了済みのセルをスキップ）し、比較表を返す"""
+    spec = load_sweep(sweep_file)
+    cells = plan_cells(spec, default_max_turns=max_turns)
+    output_dir = Path(output_dir or Path("logs") / f"sweep_{Path(sweep_file).stem}")
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with open(output_dir / "plan.json", 'w', encoding='utf-8') as f:
+        json.dump({"sweep_file": str(sweep_file), "cells": cells}, f, ensure_ascii=False, indent=2)
+
+    total = len(spec["personas"]) * len(spec["scenarios"]) * len(spec["providers"])
+    done = sum(1 for cell in cells if is_complete(checkpoint_path(output_dir / cell["id"], cell["id"])))
+    print(f"🧮 スイープ: {total}通り → 重複除外後 {len(cells)}セル (完了済み: {done}セル)")
+
+    if workers > 1:
+        from worker import run_workers
+        summary = await run_workers(cells, workers=workers, concurrency=concurrency, max_turns=max_turns,
+                                    output_dir=output_dir)
+    else:
+        summary = await run_batch(cells, concurrency=concurrency, max_turns=max_turns, output_dir=output_dir)
+
+    rows = comparison_rows(cells, summary["sessions"])
+    print_comparison(rows)
+    write_comparison_csv(rows, output_dir / "comparison.csv")
+    with open(output_dir / "comparison.json", 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    print(f"💾 比較表: {output_dir / 'comparison.csv'}")
+    return {"output_dir": str(output_dir), "cells": len(cells), "comparison": rows}
+
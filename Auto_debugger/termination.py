@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+会話の堂々巡り・停滞を検知する終了条件（モデル呼び出しなし）
+
+DONE による終了（TextMentionTermination）と並行して使い、以下のいずれかで会話を打ち切る:
+- loop: 同じ話者の直近の発言とほぼ同じ内容（文字 n-gram の Jaccard 類似度）が続いた
+- stall: 新しい内容（これまでに出ていない n-gram）の割合が低い発言が続いた
+- farewell: 顧客とスタッフの双方が続けて別れの挨拶をした（発言の最後の文が別れの挨拶である場合のみ数える）
+
+打ち切った理由は StopMessage の内容（"<理由>: <詳細>"）として TaskResult.stop_reason に残り、
+classify_stop_reason で終了理由のキーに変換できる。
+"""
+
+import os
+import re
+
+from autogen_agentchat.base import TerminationCondition, TerminatedException
+from autogen_agentchat.messages import StopMessage
+
+# 終了理由のキー（結果の termination_reason）
+REASON_DONE = "done"
+REASON_LOOP = "loop"
+REASON_STALL = "stall"
+REASON_FAREWELL = "farewell"
+REASON_MAX_TURNS = "max_turns"
+REASON_OTHER = "other"
+
+FAREWELL_PHRASES = (
+    "ありがとうございました", "失礼します", "失礼いたします", "さようなら", "またのご来店",
+    "お待ちしております", "また来ます", "また検討します", "考えておきます",
+    "goodbye", "good bye", "bye", "see you",
+)
+
+# 英語の挨拶は単語単位で照合する（"bye" が "maybe" などに一致しないように）
+_FAREWELL_PATTERN = re.compile(
+    "|".join(rf"\b{re.escape(p)}\b" if p.isascii() else re.escape(p) for p in FAREWELL_PHRASES),
+    re.IGNORECASE,
+)
+_SENTENCE_END_PATTERN = re.compile(r"(?:[。！？!?\n]|\.(?=\s|$))+")
+_NORMALIZE_PATTERN = re.compile(r"[\s、。，．,.!?！？「」『』（）()\-ー…・:：]+")
+
+
+def char_ngrams(text: str, n: int = 3) -> set:
+    """正規化した文字列の文字 n-gram 集合（日本語を分かち書きせずに比較するため文字単位）"""
+    text = _NORMALIZE_PATTERN.sub("", text.replace("DONE", "")).lower()
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def closing_sentence(text: str) -> str:
+    """発言の最後の文（DONE は除く）"""
+    sentences = [s.strip() for s in _SENTENCE_END_PATTERN.split(text.replace("DONE", "")) if s.strip()]
+    return sentences[-1] if sentences else ""
+
+
+def is_farewell(text: str) -> bool:
+    """発言が別れの挨拶で締めくくられているか
+
+    「ありがとうございました」「お待ちしております」は会話の途中でも使われるため、
+    発言の途中に含まれるだけでは別れの挨拶とみなさない。
+    """
+    return _FAREWELL_PATTERN.search(closing_sentence(text)) is not None
+
+
+class ConversationLoopTermination(TerminationCondition):
+    """堂々巡り・停滞・双方の別れの挨拶を検知して会話を終了させる終了条件"""
+
+    def __init__(self, sources=("Customer", "Staff"), window: int = 4, repeat_threshold: float = 0.7,
+                 repeat_patience: int = 2, novelty_threshold: float = 0.15, stall_patience: int = 4,
+                 detect_farewell: bool = True):
+        self._sources = set(sources)
+        self.window = window
+        self.repeat_threshold = repeat_threshold
+        self.repeat_patience = repeat_patience
+        self.novelty_threshold = novelty_threshold
+        self.stall_patience = stall_patience
+        self.detect_farewell = detect_farewell
+        self._terminated = False
+        self._history = []
+        self._seen_ngrams = set()
+        self._repeat_streak = 0
+        self._stall_streak = 0
+
+    @classmethod
+    def from_env(cls):
+        """環境変数 LOOP_REPEAT_THRESHOLD / LOOP_REPEAT_PATIENCE / LOOP_NOVELTY_THRESHOLD / LOOP_STALL_PATIENCE から生成"""
+        return cls(
+            repeat_threshold=float(os.getenv('LOOP_REPEAT_THRESHOLD', '0.7')),
+            repeat_patience=int(os.getenv('LOOP_REPEAT_PATIENCE', '2')),
+            novelty_threshold=float(os.getenv('LOOP_NOVELTY_THRESHOLD', '0.15')),
+            stall_patience=int(os.getenv('LOOP_STALL_PATIENCE', '4')),
+            detect_farewell=os.getenv('LOOP_DETECT_FAREWELL', '1').lower() in ('1', 'true', 'yes'),
+        )
+
+    @property
+    def terminated(self) -> bool:
+        return self._terminated
+
+    def _stop(self, reason: str, detail: str) -> StopMessage:
+        self._terminated = True
+        return StopMessage(content=f"{reason}: {detail}", source="ConversationLoopTermination")
+
+    def _check(self, source: str, text: str):
+        ngrams = char_ngrams(text)
+
+        # 同じ話者の直近の発言との類似度（堂々巡り）
+        recent_same = [g for s, g, _ in self._history[-self.window:] if s == source]
+        similarity = max((jaccard(ngrams, g) for g in recent_same), default=0.0)
+        self._repeat_streak = self._repeat_streak + 1 if similarity >= self.repeat_threshold else 0
+
+        # これまでに出ていない内容の割合（停滞）
+        novelty = len(ngrams - self._seen_ngrams) / len(ngrams) if ngrams else 0.0
+        self._stall_streak = self._stall_streak + 1 if novelty < self.novelty_threshold else 0
+
+        farewell = is_farewell(text)
+        previous = self._history[-1] if self._history else None
+
+        self._history.append((source, ngrams, farewell))
+        self._seen_ngrams |= ngrams
+
+        if self._repeat_streak >= self.repeat_patience:
+            return self._stop(REASON_LOOP, f"{self._repeat_streak} consecutive repetitive turns (similarity {similarity:.2f})")
+        if self._stall_streak >= self.stall_patience:
+            return self._stop(REASON_STALL, f"{self._stall_streak} consecutive turns without new content (novelty {novelty:.2f})")
+        if self.detect_farewell and farewell and previous and previous[0] != source and previous[2]:
+            return self._stop(REASON_FAREWELL, f"both {previous[0]} and {source} said goodbye")
+        return None
+
+    async def __call__(self, messages):
+        if self._terminated:
+            raise TerminatedException("Termination condition has already been reached")
+        for message in messages:
+            if getattr(message, "source", None) not in self._sources:
+                continue
+            stop_message = self._check(message.source, message.to_text())
+            if stop_message is not None:
+                return stop_message
+        return None
+
+    def prime(self, turns) -> None:
+        """これまでの発言 [(話者, 内容), ...] で判定用の履歴を復元する（終了判定は行わない）
+
+        チェックポイントからの再開や、区間ごとの実行で reset() された後に、
+        堂々巡り・停滞の判定を途切れさせずに続けるために使う。
+        """
+        for source, text in turns:
+            if source in self._sources:
+                self._check(source, text)
+        self._terminated = False
+
+    async def reset(self) -> None:
+        self._terminated = False
+        self._history = []
+        self._seen_ngrams = set()
+        self._repeat_streak = 0
+        self._stall_streak = 0
+
+
+def classify_stop_reason(stop_reason: str) -> str:
+    """TaskResult.stop_reason を終了理由のキーに変換（複数の条件が同時に成立した場合は DONE を優先）"""
+    if not stop_reason:
+        return REASON_OTHER
+    # OrTerminationCondition は複数の StopMessage の内容を ", " で連結する
+    parts = [part.strip() for part in re.split(r"[;,]", stop_reason)]
+    if any(part.startswith("Text ") and "mentioned" in part for part in parts):
+        return REASON_DONE
+    for reason in (REASON_FAREWELL, REASON_LOOP, REASON_STALL):
+        if any(part.startswith(f"{reason}:") for part in parts):
+            return reason
+    if any(part.startswith("Maximum number of turns") for part in parts):
+        return REASON_MAX_TURNS
+    return REASON_OTHER
@@ -0,0 +1,40 @@
+import sys
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+MODULE_DIR = Path(__file__).resolve().parent.parent
+# モジュールは Auto_debugger/ 直下から import する（python auto_debugging.py と同じ）
+sys.path.insert(0, str(MODULE_DIR))
+
+PROMPT_FILES = ("customer_persona.md", "staff_persona.md", "evaluator_prompt.md")
+
+
+def write_transcript(path, scenario="返品の相談", turns=("返品したいです", "承知しました")):
+    """シナリオと顧客・スタッフの発言からなる会話ログ（JSONL）を書き込む"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    entries = [{"speaker": "System", "content": f"シナリオ: {scenario}"}]
+    entries += [{"speaker": ("Customer", "Staff")[i % 2], "content": text} for i, text in enumerate(turns)]
+    path.write_text("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries), encoding="utf-8")
+    return path
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """プロンプトファイルを置いた作業ディレクトリ（API キーはダミー、ルート・キャッシュ・結果データベースは無効、クライアントのプールは新規）"""
+    for name in PROMPT_FILES:
+        shutil.copy(MODULE_DIR / name, tmp_path / name)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("API_PROVIDER", "anthropic")
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setenv("RESULTS_DB", "none")
+    for name in ("ROUTE_CUSTOMER", "ROUTE_STAFF", "ROUTE_EVALUATOR", "MODEL_CACHE_MODE", "PROMPT_CACHE",
+                 "CONTEXT_POLICY", "ANTHROPIC_BASE_URL"):
+        monkeypatch.delenv(name, raising=False)
+    # 共有クライアントはベース URL ごと保持されるため、テストごとに新しいプールを使う
+    import client_pool
+    monkeypatch.setattr(client_pool, "shared_pool", client_pool.ClientPool())
+    return tmp_path
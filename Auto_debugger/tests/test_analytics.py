@@ -0,0 +1,110 @@
+import os
+import json
+
+import numpy as np
+
+from analytics import load_table, _ragged_index, _offsets, CACHE_DIRNAME
+from checkpoint import checkpoint_path, save_checkpoint, STATUS_COMPLETE
+
+
+def _write_jsonl(path, entries):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries), encoding="utf-8")
+
+
+def _session(logs_dir, name, persona, latencies, stars, errors=0):
+    """会話ログ・チェックポイント・メトリクスからなる1セッション（発言は1秒ごと）"""
+    session_dir = logs_dir / name
+    entries = [{"timestamp": "2024-01-01T00:00:00", "speaker": "System", "content": f"シナリオ: {persona}の相談"}]
+    for i, latency in enumerate(latencies, start=1):
+        entries.append({"timestamp": f"2024-01-01T00:00:{i:02d}", "speaker": ("Customer", "Staff")[(i - 1) % 2],
+                        "content": f"発言{i}", "latency_seconds": latency})
+    entries.append({"timestamp": "2024-01-01T00:01:00", "speaker": "Evaluator",
+                    "content": f"- ペルソナ一貫性：{'★' * stars}{'☆' * (5 - stars)}"})
+    _write_jsonl(session_dir / f"chat_{name}.jsonl", entries)
+    save_checkpoint(checkpoint_path(session_dir, name), {
+        "status": STATUS_COMPLETE,
+        "session_info": {"customer_persona_file": f"personas/{persona}.md", "api_provider": "anthropic",
+                         "customer_model": "claude-haiku", "staff_model": "claude-sonnet"},
+        "result": {"termination_reason": "max_turns", "time_to_first_turn_seconds": latencies[0]},
+    })
+    calls = [{"role": "staff", "model": "claude-sonnet", "latency_seconds": 0.5, "prompt_tokens": 10,
+              "completion_tokens": 5, "error": None}]
+    calls += [{"role": "staff", "model": "claude-sonnet", "latency_seconds": 9.0, "error": "Timeout"}] * errors
+    _write_jsonl(session_dir / f"metrics_{name}.jsonl", calls)
+
+
+def _by(rows, key):
+    return {row[key]: row for row in rows}
+
+
+def test_group_by_persona(tmp_path):
+    _session(tmp_path, "a", "急ぎ", [1.0, 2.0], 4)
+    _session(tmp_path, "b", "急ぎ", [3.0, 4.0, 5.0, 6.0], 2, errors=1)
+    _session(tmp_path, "c", "丁寧", [0.5, 0.5], 5)
+
+    table = load_table(tmp_path)
+    assert len(table) == 3
+    rows = table.summarize("persona")
+    assert [row["persona"] for row in rows] == ["急ぎ", "丁寧"]
+    hurried = _by(rows, "persona")["急ぎ"]
+    assert hurried["sessions"] == 2
+    assert (hurried["turns"]["p50"], hurried["turns"]["p95"]) == (2.0, 4.0)
+    # System のシナリオ記録から最後の発言まで（評価結果は含めない）
+    assert hurried["duration_seconds"]["mean"] == 3.0
+    assert hurried["turn_latency_seconds"]["p50"] == 3.0
+    assert hurried["termination_reasons"] == {"max_turns": 2}
+    assert hurried["scores"] == {"ペルソナ一貫性": 3.0}
+
+    calls = table.summarize_calls()
+    assert [(row["model"], row["role"], row["calls"], row["errors"]) for row in calls] == [("claude-sonnet", "staff", 4, 1)]
+    # エラーになった呼び出しはレイテンシの分布に含めない
+    assert calls[0]["latency_seconds"]["p99"] == 0.5
+
+
+def test_unchanged_logs_reuse_saved_columns(tmp_path):
+    _session(tmp_path, "a", "急ぎ", [1.0, 2.0], 4)
+    first = load_table(tmp_path)
+    assert (tmp_path / CACHE_DIRNAME / "manifest.json").exists()
+    second = load_table(tmp_path)
+    # 変更がなければ保存済みの列をメモリマップで開く
+    assert isinstance(second.columns["turns"], np.memmap)
+    assert second.summarize("persona") == first.summarize("persona")
+
+
+def test_only_modified_session_is_reread(tmp_path, monkeypatch):
+    import analytics
+    _session(tmp_path, "a", "急ぎ", [1.0, 2.0], 4)
+    _session(tmp_path, "b", "丁寧", [0.5, 0.5], 5)
+    load_table(tmp_path)
+
+    _session(tmp_path, "b", "丁寧", [0.5, 0.5, 0.5], 1)
+    # 同じ時刻に書き直した場合でも更新時刻が変わるように進める
+    chat_b = tmp_path / "b" / "chat_b.jsonl"
+    os.utime(chat_b, ns=(chat_b.stat().st_atime_ns, chat_b.stat().st_mtime_ns + 10**9))
+    parsed = []
+    parse_session = analytics._parse_session
+
+    def recording_parse_session(transcript, *args):
+        parsed.append(transcript)
+        return parse_session(transcript, *args)
+
+    monkeypatch.setattr(analytics, "_parse_session", recording_parse_session)
+
+    rows = _by(load_table(tmp_path).summarize("persona"), "persona")
+    assert parsed == [str(chat_b)]
+    assert rows["丁寧"]["turns"]["p50"] == 3.0 and rows["丁寧"]["scores"] == {"ペルソナ一貫性": 1.0}
+    assert rows["急ぎ"]["turns"]["p50"] == 2.0 and rows["急ぎ"]["turn_latency_seconds"]["p95"] == 2.0
+
+
+def test_ragged_index_with_empty_sessions():
+    offsets = _offsets([2, 0, 3, 0])
+    values = np.arange(5)
+    gather, new_offsets = _ragged_index(offsets, np.array([1, 2, 3]))
+    assert values[gather].tolist() == [2, 3, 4]
+    assert new_offsets.tolist() == [0, 0, 3, 3]
+
+    gather, new_offsets = _ragged_index(offsets, np.array([1, 3]))
+    assert gather.tolist() == [] and new_offsets.tolist() == [0, 0, 0]
+    gather, new_offsets = _ragged_index(_offsets([]), np.array([], dtype=np.int64))
+    assert gather.tolist() == [] and new_offsets.tolist() == [0]
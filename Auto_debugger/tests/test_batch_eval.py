@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+import pytest
+
+from conftest import write_transcript
+from config import RunSettings
+from fake_llm_server import FakeLLMServer
+
+
+def test_evaluator_provider_follows_inherited_staff_route(workspace, monkeypatch):
+    # ROUTE_EVALUATOR がなければ評価エージェントはスタッフのルートを使う
+    monkeypatch.setenv("ROUTE_STAFF", "gemini:gemini-1.5-flash-latest")
+    assert RunSettings().provider_of("evaluator") == "gemini"
+
+    from auto_debugging import ConversationTestingSystem
+    from batch_eval import AnthropicBatchEvaluator
+    test_system = ConversationTestingSystem(log_dir="logs", verbose=False)
+    with pytest.raises(ValueError, match="gemini"):
+        AnthropicBatchEvaluator(test_system, workspace / "batches.json")
+
+    monkeypatch.setenv("ROUTE_EVALUATOR", "anthropic:claude-3-5-sonnet-20240620")
+    assert RunSettings().provider_of("evaluator") == "anthropic"
+
+
+@pytest.mark.parametrize("backend", ["packed", "batch"])
+def test_backends_write_per_session_results(workspace, monkeypatch, backend):
+    transcripts = [write_transcript(workspace / "logs" / name / f"chat_{name}.jsonl", scenario=f"シナリオ{name}")
+                   for name in ("a", "b", "c")]
+    monkeypatch.setenv("BATCH_POLL_INTERVAL", "0.05")
+
+    async def run():
+        server = await FakeLLMServer(port=0, latency="fixed:0", batch_latency="fixed:0.1", seed=1).start()
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", server.base_url)
+        try:
+            from offline_eval import run_offline_evaluation
+            return await run_offline_evaluation("logs", backend=backend, pack_size=2), server.stats
+        finally:
+            await server.close()
+
+    summary, stats = asyncio.run(run())
+    assert (summary["evaluated"], summary["failed"]) == (3, 0)
+    if backend == "batch":
+        assert (stats["batches"], stats["batched_requests"]) == (1, 3)
+    else:
+        # 2件 + 1件の2リクエストにまとめる
+        assert stats["by_path"].get("/v1/messages") == 2
+
+    results = sorted((workspace / summary["output_dir"]).glob("*__chat_*.json"))
+    assert [path.name for path in results] == ["a__chat_a.json", "b__chat_b.json", "c__chat_c.json"]
+    for path, transcript in zip(results, transcripts):
+        record = json.loads(path.read_text(encoding="utf-8"))
+        assert record["transcript"] == str(transcript.relative_to(workspace))
+        assert record["messages"] == 2
+        assert "★" in record["evaluation"]
+        assert ("batch_id" in record) == (backend == "batch")
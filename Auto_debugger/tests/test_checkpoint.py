@@ -0,0 +1,31 @@
+import json
+
+from checkpoint import (
+    checkpoint_path, save_checkpoint, load_checkpoint, is_complete,
+    CHECKPOINT_VERSION, STATUS_RUNNING, STATUS_COMPLETE,
+)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = checkpoint_path(tmp_path, "a")
+    state = {"status": STATUS_RUNNING, "agent_turns": 10, "team_state": {"messages": ["こんにちは"]}}
+    save_checkpoint(path, state)
+    loaded = load_checkpoint(path)
+    assert {key: loaded[key] for key in state} == state
+    assert loaded["version"] == CHECKPOINT_VERSION and loaded["saved_at"]
+    # 一時ファイルは残らない
+    assert [p.name for p in tmp_path.iterdir()] == ["checkpoint_a.json"]
+    assert not is_complete(path)
+
+    save_checkpoint(path, {**state, "status": STATUS_COMPLETE, "result": {"total_turns": 10}})
+    assert is_complete(path)
+
+
+def test_missing_corrupt_or_unsupported_checkpoint_is_ignored(tmp_path):
+    path = checkpoint_path(tmp_path, "a")
+    assert load_checkpoint(path) is None
+    path.write_text('{"status": "runn', encoding="utf-8")
+    assert load_checkpoint(path) is None
+    path.write_text(json.dumps({"status": STATUS_COMPLETE, "version": CHECKPOINT_VERSION + 1}), encoding="utf-8")
+    assert load_checkpoint(path) is None
+    assert not is_complete(path)
@@ -0,0 +1,122 @@
+import asyncio
+
+import client_pool
+from client_pool import TokenBucket
+from metrics import call_retries
+
+
+class FakeClock:
+    """time.monotonic と asyncio.sleep の代わり（待った秒数だけ時刻を進める）"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _bucket(monkeypatch, rate_per_minute, capacity=None):
+    clock = FakeClock()
+    monkeypatch.setattr(client_pool.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(client_pool.asyncio, "sleep", clock.sleep)
+    return TokenBucket(rate_per_minute, capacity), clock
+
+
+def test_acquire_waits_for_refill(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate_per_minute=60)
+
+    async def run():
+        await bucket.acquire(60)
+        await bucket.acquire(3)
+
+    asyncio.run(run())
+    # 1秒あたり1単位を補充するため、3単位には3秒待つ
+    assert clock.sleeps == [3.0]
+    assert bucket.tokens == 0
+
+
+def test_refill_is_capped_at_capacity(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate_per_minute=60, capacity=10)
+    asyncio.run(bucket.acquire(10))
+    clock.now += 3600
+    bucket._refill()
+    assert bucket.tokens == 10
+
+
+def test_oversized_request_and_negative_balance(monkeypatch):
+    bucket, clock = _bucket(monkeypatch, rate_per_minute=60, capacity=10)
+
+    async def run():
+        # 容量を超える要求は容量分として扱う（永久に待たない）
+        await bucket.acquire(100)
+        assert bucket.tokens == 0
+        # 見積もりより多く消費した分は負の残高になり、次の取得はその分だけ長く待つ
+        bucket.consume(5)
+        await bucket.acquire(1)
+
+    asyncio.run(run())
+    assert bucket.tokens == -5 + 6 - 1
+    assert clock.sleeps == [6.0]
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"status_code": status_code, "headers": headers or {}})()
+
+
+class FlakyClient:
+    """errors を順に送出した後に成功するクライアント"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+def _create(monkeypatch, inner, max_attempts=5):
+    clock = FakeClock()
+    monkeypatch.setattr(client_pool.asyncio, "sleep", clock.sleep)
+    client = client_pool.RateLimitedChatCompletionClient(inner, max_attempts=max_attempts, base_delay=1.0, max_delay=60.0)
+
+    async def run():
+        call_retries.set(0)
+        try:
+            return await client.create([]), call_retries.get()
+        except Exception as e:
+            return e, call_retries.get()
+
+    return asyncio.run(run()), clock
+
+
+def test_rate_limit_and_server_errors_are_retried(monkeypatch):
+    inner = FlakyClient([StatusError(429, {"retry-after": "7"}), StatusError(503), ConnectionError("reset")])
+    (result, retries), clock = _create(monkeypatch, inner)
+    assert (result, retries, inner.calls) == ("ok", 3, 4)
+    # Retry-After があればそれ以上待つ
+    assert clock.sleeps[0] >= 7.0
+    assert all(delay <= 60.0 for delay in clock.sleeps)
+
+
+def test_client_errors_are_not_retried(monkeypatch):
+    error = StatusError(400)
+    inner = FlakyClient([error])
+    (result, retries), clock = _create(monkeypatch, inner)
+    assert (result, retries, inner.calls, clock.sleeps) == (error, 0, 1, [])
+
+
+def test_gives_up_after_max_attempts(monkeypatch):
+    inner = FlakyClient([StatusError(500)] * 5)
+    (result, retries), _ = _create(monkeypatch, inner, max_attempts=3)
+    assert isinstance(result, StatusError) and (retries, inner.calls) == (2, 3)
@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+from autogen_core.models import UserMessage
+
+from context_policy import PolicyChatCompletionContext, estimate_tokens
+
+
+def _messages(*contents):
+    return [UserMessage(content=content, source="user") for content in contents]
+
+
+async def _selected(context, messages):
+    for message in messages:
+        await context.add_message(message)
+    return await context.get_messages()
+
+
+def test_token_budget_trims_even_when_within_last_n():
+    long = "あ" * 300
+    messages = _messages("シナリオ", long, long, "短い発言")
+    budget = estimate_tokens(messages[0]) + estimate_tokens(messages[-1]) + 10
+    context = PolicyChatCompletionContext("token_budget", last_n=20, token_budget=budget)
+    selected = asyncio.run(_selected(context, messages))
+    assert [m.content for m in selected] == ["シナリオ", "短い発言"]
+
+
+def test_last_n_keeps_everything_within_last_n():
+    messages = _messages("シナリオ", "a", "b", "c")
+    context = PolicyChatCompletionContext("last_n", last_n=3)
+    assert asyncio.run(_selected(context, messages)) == messages
+
+
+class FailingSummarizer:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        raise ConnectionError("down")
+
+
+class Summarizer:
+    async def create(self, messages, **kwargs):
+        return SimpleNamespace(content="要約")
+
+
+def test_failed_summary_keeps_unsummarized_history():
+    summarizer = FailingSummarizer()
+    messages = _messages("シナリオ", *[f"発言{i}" for i in range(8)])
+    context = PolicyChatCompletionContext("summary", last_n=2, summarizer=summarizer, summary_every=2)
+    selected = asyncio.run(_selected(context, messages))
+    assert summarizer.calls == 1
+    assert selected == messages
+
+
+def test_successful_summary_replaces_aged_history():
+    messages = _messages("シナリオ", *[f"発言{i}" for i in range(8)])
+    context = PolicyChatCompletionContext("summary", last_n=2, summarizer=Summarizer(), summary_every=2)
+    selected = asyncio.run(_selected(context, messages))
+    assert [m.content for m in selected] == ["シナリオ", "（これまでの会話の要約）\n要約", "発言6", "発言7"]
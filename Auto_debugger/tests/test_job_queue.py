@@ -0,0 +1,65 @@
+import time
+
+from job_queue import JobQueue, STATUS_QUEUED, STATUS_RUNNING, STATUS_DONE, STATUS_FAILED
+
+
+def _expire(queue, job_id):
+    # ハートビートが途絶えたワーカーを再現する
+    queue.conn.execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, job_id))
+
+
+def test_claim_heartbeat_and_complete(tmp_path):
+    with JobQueue(tmp_path / "queue.db") as queue:
+        assert queue.enqueue([{"id": "a", "scenario": "s1"}, {"id": "b", "scenario": "s2"}]) == 2
+        job = queue.claim("w1", lease_seconds=60)
+        assert job == {"id": "a", "payload": {"id": "a", "scenario": "s1"}, "attempt": 1}
+        assert queue.heartbeat("a", "w1", lease_seconds=60)
+        assert not queue.heartbeat("a", "w2", lease_seconds=60)
+        assert queue.complete("a", "w1", {"id": "a", "status": "ok"})
+        assert queue.counts() == {STATUS_QUEUED: 1, STATUS_RUNNING: 0, STATUS_DONE: 1, STATUS_FAILED: 0}
+
+
+def test_expired_lease_is_taken_over_by_another_worker(tmp_path):
+    with JobQueue(tmp_path / "queue.db", max_attempts=2) as queue:
+        queue.enqueue([{"id": "a"}])
+        queue.claim("w1", lease_seconds=60)
+        _expire(queue, "a")
+        assert not queue.heartbeat("a", "w1", lease_seconds=60)
+
+        job = queue.claim("w2", lease_seconds=60)
+        assert (job["id"], job["attempt"]) == ("a", 2)
+        # 元のワーカーは結果を書き戻せない
+        assert not queue.complete("a", "w1", {"status": "ok"})
+
+        # 試行回数を使い切ったジョブはリース切れで failed になる
+        _expire(queue, "a")
+        assert queue.claim("w3", lease_seconds=60) is None
+        assert queue.counts()[STATUS_FAILED] == 1
+        assert queue.results()[0]["error"] == "lease expired"
+
+
+def test_enqueue_requeues_failed_and_expired_jobs_only(tmp_path):
+    with JobQueue(tmp_path / "queue.db", max_attempts=1) as queue:
+        queue.enqueue([{"id": "done"}, {"id": "failed"}, {"id": "expired"}, {"id": "running"}, {"id": "queued"}])
+        for worker_id in ("w1", "w2", "w3", "w4"):
+            queue.claim(worker_id, lease_seconds=60)
+        queue.complete("done", "w1", {"status": "ok"})
+        assert queue.fail("failed", "w2", "boom") == STATUS_FAILED
+        _expire(queue, "expired")
+
+        assert queue.enqueue([
+            {"id": "done"}, {"id": "failed", "scenario": "updated"}, {"id": "expired"}, {"id": "running"},
+            {"id": "queued"}, {"id": "new"},
+        ]) == 3
+        statuses = {row["id"]: (row["status"], row["attempts"]) for row in
+                    queue.conn.execute("SELECT id, status, attempts FROM jobs")}
+        assert statuses == {
+            "done": (STATUS_DONE, 1),
+            "failed": (STATUS_QUEUED, 0),
+            "expired": (STATUS_QUEUED, 0),
+            "running": (STATUS_RUNNING, 1),
+            "queued": (STATUS_QUEUED, 0),
+            "new": (STATUS_QUEUED, 0),
+        }
+        job = queue.claim("w5", lease_seconds=60)
+        assert job["id"] == "failed" and job["payload"]["scenario"] == "updated"
@@ -0,0 +1,27 @@
+import logging
+
+import log_config
+from log_config import configure_logging, current_session_id, flush_logging, session_log_router, shutdown_logging
+
+
+def test_unregister_closes_session_log_after_queued_records(tmp_path, monkeypatch):
+    path = tmp_path / "session.log"
+    configure_logging()
+    try:
+        session_log_router.register("s1", path)
+        token = current_session_id.set("s1")
+        try:
+            logging.getLogger("ConversationTest.Test").warning("セッション終了前の記録")
+        finally:
+            current_session_id.reset(token)
+
+        # unregister はキューが空になるのを待たない（バッチのイベントループを止めない）
+        monkeypatch.setattr(log_config._queue, "join", lambda: (_ for _ in ()).throw(AssertionError("blocked")))
+        session_log_router.unregister("s1")
+        monkeypatch.undo()
+
+        flush_logging()
+        assert "s1" not in session_log_router._handlers
+        assert "セッション終了前の記録" in path.read_text(encoding="utf-8")
+    finally:
+        shutdown_logging()
@@ -0,0 +1,43 @@
+from metrics import MetricsRecorder, percentile
+
+
+def test_percentile_nearest_rank():
+    assert percentile([], 50) is None
+    assert percentile([3.0], 99) == 3.0
+    values = [5, 1, 4, 2, 3, 6, 7, 8, 9, 10]
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (5, 10, 10)
+    assert percentile(values, 0) == 1
+    assert percentile(values, 100) == 10
+
+
+def _record(role, latency, error=None, **extra):
+    return {"role": role, "latency_seconds": latency, "prompt_tokens": 10, "completion_tokens": 2,
+            "retries": 0, "cached": False, "error": error, **extra}
+
+
+def test_summary_and_prometheus_output():
+    recorder = MetricsRecorder()
+    for latency in (0.1, 0.2, 0.3, 0.4):
+        recorder.record(_record("staff", latency, route="anthropic:claude"))
+    recorder.record(_record("staff", 9.0, error="Timeout", retries=2))
+    recorder.record(_record("customer", 0.05, cached=True, cache_read_tokens=100))
+
+    summary = recorder.summary()
+    staff = summary["staff"]
+    assert (staff["calls"], staff["errors"], staff["retries"]) == (5, 1, 2)
+    # レイテンシの分布は成功した呼び出しのみ
+    assert (staff["latency_p50_seconds"], staff["latency_p99_seconds"]) == (0.2, 0.4)
+    assert staff["routes"] == {"anthropic:claude": 4}
+    assert summary["customer"]["cache_hit_calls"] == 1
+
+    lines = recorder.to_prometheus().splitlines()
+    assert 'llm_request_latency_seconds{role="staff",quantile="0.5"} 0.2' in lines
+    assert 'llm_request_latency_seconds_sum{role="staff"} 1.0' in lines
+    assert 'llm_request_latency_seconds_count{role="staff"} 4' in lines
+    assert 'llm_requests_total{role="staff"} 5' in lines
+    assert 'llm_request_errors_total{role="staff"} 1' in lines
+    assert 'llm_cached_responses_total{role="customer"} 1' in lines
+    assert 'llm_tokens_total{role="customer",kind="cache_read"} 100' in lines
+    assert 'llm_route_responses_total{role="staff",route="anthropic:claude"} 4' in lines
+    # 各メトリクスの HELP / TYPE は1回だけ
+    assert sum(1 for line in lines if line.startswith("# TYPE llm_requests_total ")) == 1
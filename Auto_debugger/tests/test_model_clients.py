@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+from autogen_core.models import CreateResult, RequestUsage, UserMessage
+
+from metrics import InstrumentedChatCompletionClient, MetricsRecorder
+from model_clients import CachingChatCompletionClient, ModelCacheMissError, ModelResponseCache
+
+MESSAGES = [UserMessage(content="返品したいです", source="Customer")]
+
+
+class FakeClient:
+    """呼び出し回数を数え、使用量つきの応答を返すクライアント"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        return CreateResult(
+            finish_reason="stop",
+            content=f"応答{self.calls}",
+            usage=RequestUsage(prompt_tokens=100, completion_tokens=20),
+            cached=False,
+        )
+
+
+def _caching(tmp_path, mode, namespace="anthropic:claude"):
+    inner = FakeClient()
+    recorder = MetricsRecorder()
+    client = CachingChatCompletionClient(inner, ModelResponseCache(tmp_path / "cache"), namespace, mode=mode)
+    return InstrumentedChatCompletionClient(client, "staff", recorder), inner, recorder
+
+
+def test_record_then_hit_reports_no_tokens(tmp_path):
+    client, inner, recorder = _caching(tmp_path, "record")
+    first = asyncio.run(client.create(MESSAGES))
+    second = asyncio.run(client.create(MESSAGES))
+
+    assert inner.calls == 1
+    assert second.content == first.content and second.cached
+    assert (second.usage.prompt_tokens, second.usage.completion_tokens) == (0, 0)
+    summary = recorder.summary()["staff"]
+    assert (summary["calls"], summary["cached"]) == (2, 1)
+    # 再生した応答のトークンは集計に含めない
+    assert (summary["prompt_tokens"], summary["completion_tokens"]) == (100, 20)
+
+
+def test_replay_miss_does_not_call_the_api(tmp_path):
+    client, inner, recorder = _caching(tmp_path, "replay")
+    with pytest.raises(ModelCacheMissError):
+        asyncio.run(client.create(MESSAGES))
+    assert inner.calls == 0
+    assert recorder.summary()["staff"]["errors"] == 1
+
+
+def test_namespaces_do_not_share_responses(tmp_path):
+    record, _, _ = _caching(tmp_path, "record", namespace="anthropic:claude")
+    asyncio.run(record.create(MESSAGES))
+    replay, _, _ = _caching(tmp_path, "replay", namespace="gemini:gemini-2.0-flash")
+    with pytest.raises(ModelCacheMissError):
+        asyncio.run(replay.create(MESSAGES))
+
+
+def test_passthrough_always_calls_the_api(tmp_path):
+    client, inner, _ = _caching(tmp_path, "passthrough")
+    asyncio.run(client.create(MESSAGES))
+    asyncio.run(client.create(MESSAGES))
+    assert inner.calls == 2
+    assert not list((tmp_path / "cache").glob("*/*.json"))
+
+
+def test_cache_namespace_follows_routes(workspace, monkeypatch):
+    pytest.importorskip("autogen_ext.models.anthropic")
+    from auto_debugging import ConversationTestingSystem
+    from client_pool import ClientPool
+
+    monkeypatch.setenv("MODEL_CACHE_MODE", "record")
+
+    def namespace(role):
+        async def build():
+            test_system = ConversationTestingSystem(log_dir="logs", verbose=False, client_pool=ClientPool())
+            return test_system._role_client(role).namespace
+        return asyncio.run(build())
+
+    default = namespace("staff")
+    assert default.startswith("anthropic:")
+    monkeypatch.setenv("ROUTE_STAFF", "anthropic:claude-a,anthropic:claude-b")
+    assert namespace("staff") == "anthropic:claude-a,anthropic:claude-b"
+    # 評価エージェントは ROUTE_EVALUATOR がなければスタッフと同じルート（同じ名前空間）
+    assert namespace("evaluator") == "anthropic:claude-a,anthropic:claude-b"
+    monkeypatch.setenv("ROUTE_EVALUATOR", "anthropic:claude-c")
+    assert namespace("evaluator") == "anthropic:claude-c"
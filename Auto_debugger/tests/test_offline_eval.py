@@ -0,0 +1,28 @@
+import asyncio
+
+from conftest import write_transcript
+from fake_llm_server import FakeLLMServer
+
+
+def test_skips_unchanged_transcripts_and_reruns_with_force(workspace, monkeypatch):
+    transcript = write_transcript(workspace / "logs" / "a" / "chat_a.jsonl")
+    write_transcript(workspace / "logs" / "b" / "chat_b.jsonl", scenario="配送の相談")
+
+    async def run():
+        from offline_eval import run_offline_evaluation
+        server = await FakeLLMServer(port=0, latency="fixed:0", seed=1).start()
+        monkeypatch.setenv("ANTHROPIC_BASE_URL", server.base_url)
+        try:
+            summaries = [await run_offline_evaluation("logs"), await run_offline_evaluation("logs")]
+            # 会話ログが変わった会話だけ再評価する
+            write_transcript(transcript, turns=("返品したいです", "承知しました", "レシートはあります"))
+            summaries.append(await run_offline_evaluation("logs"))
+            summaries.append(await run_offline_evaluation("logs", force=True))
+            return summaries
+        finally:
+            await server.close()
+
+    summaries = asyncio.run(run())
+    assert [(s["evaluated"], s["skipped"], s["failed"]) for s in summaries] == [(2, 0, 0), (0, 2, 0), (1, 1, 0), (2, 0, 0)]
+    # 評価だけなので、会話ログ・システムログ・メトリクスのファイルは作らない
+    assert not [p for p in (workspace / "logs" / "evaluations").iterdir() if p.is_file()]
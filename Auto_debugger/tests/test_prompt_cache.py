@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from metrics import call_cache_usage
+from prompt_cache import enable_prompt_cache
+
+
+class FakeMessages:
+    """anthropic SDK の AsyncMessages の代わり（受け取ったリクエストを記録する）"""
+
+    def __init__(self):
+        self.requests = []
+
+    async def create(self, **request_args):
+        self.requests.append(request_args)
+        return SimpleNamespace(usage=SimpleNamespace(cache_read_input_tokens=100, cache_creation_input_tokens=20))
+
+
+def _anthropic_client():
+    return SimpleNamespace(_client=SimpleNamespace(messages=FakeMessages()))
+
+
+def test_shared_client_is_patched_once_without_warning(caplog):
+    client = _anthropic_client()
+    with caplog.at_level(logging.WARNING, logger="ConversationTest.PromptCache"):
+        assert enable_prompt_cache(client, "anthropic")
+        # プールの共有クライアントは2セッション目以降も有効化済みとして扱う
+        assert enable_prompt_cache(client, "anthropic")
+    assert not caplog.records
+
+    async def call():
+        usage = {}
+        call_cache_usage.set(usage)
+        await client._client.messages.create(system="ペルソナ", messages=[{"role": "user", "content": "こんにちは"}])
+        return usage
+
+    # 二重にフックされていれば使用量も二重に加算される
+    assert asyncio.run(call()) == {"cache_read_tokens": 100, "cache_write_tokens": 20}
+    request = client._client.messages.requests[0]
+    assert request["system"][-1]["cache_control"] == {"type": "ephemeral"}
+
+
+def test_unsupported_client_warns(caplog):
+    # SDK の構造が想定と違う（create が非同期関数でない）場合はフックしない
+    client = SimpleNamespace(_client=SimpleNamespace(messages=SimpleNamespace(create=lambda **kwargs: None)))
+    with caplog.at_level(logging.WARNING, logger="ConversationTest.PromptCache"):
+        assert not enable_prompt_cache(client, "anthropic")
+    assert "could not be enabled" in caplog.text
+
+
+def test_hooks_installed_sdk_clients():
+    # 非公開の _client の構造が SDK・autogen-ext の更新で変わった場合にここで失敗させる
+    # （実行時は警告を出してキャッシュなしで続行するため、気付かないうちにキャッシュが無効になるのを防ぐ）
+    pytest.importorskip("anthropic")
+    from autogen_ext.models.anthropic import AnthropicChatCompletionClient
+    client = AnthropicChatCompletionClient(model="claude-3-5-sonnet-20240620", api_key="test")
+    assert enable_prompt_cache(client, "anthropic")
+    assert client._client.messages._prompt_cache_enabled
+
+
+def test_hooks_installed_openai_compatible_client():
+    pytest.importorskip("openai")
+    from autogen_core.models import ModelInfo
+    from autogen_ext.models.openai import OpenAIChatCompletionClient
+    # auto_debugging._gemini_client と同じ設定
+    client = OpenAIChatCompletionClient(
+        model="gemini-1.5-flash-latest", api_key="test", base_url="https://generativelanguage.googleapis.com/v1beta",
+        model_info=ModelInfo(family="gemini", vision=True, function_calling=True, json_output=True),
+        api_type="google", max_retries=0,
+    )
+    assert enable_prompt_cache(client, "gemini")
+    assert client._client.chat.completions._prompt_cache_enabled
@@ -0,0 +1,64 @@
+import json
+
+from results_store import ResultsStore, import_logs, parse_scores
+
+
+def test_parse_star_scores():
+    evaluation = """## 評価結果
+- 顧客ペルソナ一貫性：★★★★☆ (5段階)
+- **話し方**: ★★★☆☆
+1. 行動の自然さ：★★（3段階）
+"""
+    assert parse_scores(evaluation) == {
+        "顧客ペルソナ一貫性": (4.0, 5.0),
+        "話し方": (3.0, 5.0),
+        "行動の自然さ": (2.0, 3.0),
+    }
+
+
+def test_parse_numeric_scores_and_prefer_stars():
+    evaluation = """### 1. ペルソナ一貫性: 4/5点
+### 2. 状況表現: 3.5 / 5
+- ペルソナ一貫性：★★☆☆☆
+"""
+    assert parse_scores(evaluation) == {"ペルソナ一貫性": (2.0, 5.0), "状況表現": (3.5, 5.0)}
+    assert parse_scores("") == {}
+    assert parse_scores("特に問題はありませんでした。") == {}
+
+
+def _write_transcript(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    entries = [
+        {"speaker": "System", "content": "シナリオ: 返品の相談", "timestamp": "2024-01-01T00:00:00"},
+        {"speaker": "Customer", "content": "返品したいです", "latency_seconds": 1.0},
+        {"speaker": "Staff", "content": "承知しました", "latency_seconds": 2.0},
+        {"speaker": "Evaluator", "content": "- 話し方：★★★☆☆ (5段階)"},
+    ]
+    path.write_text("".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries), encoding="utf-8")
+
+
+def test_import_logs_keys_sessions_by_normalized_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_transcript(tmp_path / "logs" / "batch" / "a" / "chat_a.jsonl")
+    with ResultsStore(tmp_path / "logs" / "results.db") as store:
+        # 同じディレクトリを別の書き方で指定しても同じ会話として扱う
+        assert import_logs(store, "logs") == 1
+        assert import_logs(store, "./logs/") == 0
+        assert import_logs(store, tmp_path / "logs") == 0
+        store.record_evaluations([{"transcript": "logs/batch/a/chat_a.jsonl", "content": "- 話し方：★★★★★ (5段階)",
+                                   "evaluator_prompt_hash": "h1"}])
+        sessions = store.query("SELECT transcript, scenario, total_turns, mean_turn_latency_seconds FROM sessions")
+        assert sessions == [{"transcript": "batch/a/chat_a.jsonl", "scenario": "返品の相談", "total_turns": 2,
+                             "mean_turn_latency_seconds": 1.5}]
+        assert [row["mean_score"] for row in store.mean_scores(group_by="evaluator_prompt_hash")] == [3.0, 5.0]
+
+
+
+def test_import_logs_skips_evaluations_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_transcript(tmp_path / "logs" / "a" / "chat_a.jsonl")
+    # offline_eval の評価用のログ（会話ではない）
+    _write_transcript(tmp_path / "logs" / "evaluations" / "chat_20240101_000000.jsonl")
+    with ResultsStore(tmp_path / "logs" / "results.db") as store:
+        assert import_logs(store, "logs") == 1
+        assert [row["transcript"] for row in store.query("SELECT transcript FROM sessions")] == ["a/chat_a.jsonl"]
@@ -0,0 +1,64 @@
+import asyncio
+
+from metrics import InstrumentedChatCompletionClient, MetricsRecorder, call_retries, call_cache_usage
+from routing import RoutingChatCompletionClient, HedgeDeadline, route_latencies
+
+
+class FakeClient:
+    """プール側の書き込み（リトライ回数・キャッシュの利用量）を再現するクライアント"""
+
+    def __init__(self, delay: float = 0.0, retries: int = 0, cache_read: int = 0, error: Exception = None):
+        self.delay = delay
+        self.retries = retries
+        self.cache_read = cache_read
+        self.error = error
+
+    async def create(self, messages, **kwargs):
+        await asyncio.sleep(self.delay)
+        call_retries.set(call_retries.get() + self.retries)
+        usage = call_cache_usage.get()
+        if usage is not None and self.cache_read:
+            usage["cache_read_tokens"] = usage.get("cache_read_tokens", 0) + self.cache_read
+        if self.error is not None:
+            raise self.error
+        return f"result-{self.delay}"
+
+
+def _instrumented(routes, deadline="off"):
+    recorder = MetricsRecorder()
+    client = RoutingChatCompletionClient(routes, "staff", deadline=HedgeDeadline(deadline))
+    return InstrumentedChatCompletionClient(client, "staff", recorder), recorder
+
+
+def test_retries_and_cache_usage_reach_the_caller():
+    client, recorder = _instrumented([("a:m", FakeClient(retries=2, cache_read=100))])
+    assert asyncio.run(client.create([])) == "result-0.0"
+    record = recorder.records[-1]
+    assert record["retries"] == 2
+    assert record["cache_read_tokens"] == 100
+
+
+def test_failover_counts_retries_of_failed_route():
+    client, recorder = _instrumented([
+        ("fail:m", FakeClient(retries=3, error=ConnectionError("down"))),
+        ("ok:m", FakeClient(retries=1)),
+    ])
+    asyncio.run(client.create([]))
+    record = recorder.records[-1]
+    assert record["retries"] == 4
+    assert record["route"] == "ok:m" and record["failed_over"] is True
+
+
+def test_hedge_counts_only_winner_cache_usage_and_records_cancelled_latency():
+    route_latencies.pop("slow:m", None)
+    client, recorder = _instrumented([
+        ("slow:m", FakeClient(delay=0.5, cache_read=100)),
+        ("fast:m", FakeClient(delay=0.0, cache_read=7)),
+    ], deadline="0.05")
+    assert asyncio.run(client.create([])) == "result-0.0"
+    record = recorder.records[-1]
+    assert record["route"] == "fast:m" and record["hedged"] is True
+    assert record["cache_read_tokens"] == 7
+    # 取り消された優先ルートの経過時間（締め切り以上）も記録される
+    assert len(route_latencies["slow:m"]) == 1
+    assert route_latencies["slow:m"][0] >= 0.05
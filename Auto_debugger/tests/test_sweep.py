@@ -0,0 +1,62 @@
+from sweep import plan_cells, comparison_rows
+
+
+def _spec(tmp_path):
+    (tmp_path / "staff_persona.md").write_text("スタッフ", encoding="utf-8")
+    (tmp_path / "evaluator_prompt.md").write_text("評価", encoding="utf-8")
+    (tmp_path / "v1.md").write_text("顧客ペルソナ", encoding="utf-8")
+    (tmp_path / "v1_copy.md").write_text("顧客ペルソナ", encoding="utf-8")
+    (tmp_path / "v2.md").write_text("別の顧客ペルソナ", encoding="utf-8")
+    return {
+        "personas": {"v1": str(tmp_path / "v1.md"), "v1_copy": str(tmp_path / "v1_copy.md"), "v2": str(tmp_path / "v2.md")},
+        "scenarios": [{"id": "s1", "scenario": "返品の相談", "initial_message": "こんにちは", "max_turns": None}],
+        "providers": ["anthropic"],
+    }
+
+
+def test_cell_id_includes_routes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for role in ("CUSTOMER", "STAFF", "EVALUATOR"):
+        monkeypatch.delenv(f"ROUTE_{role}", raising=False)
+    spec = _spec(tmp_path)
+    default_ids = [cell["id"] for cell in plan_cells(spec)]
+
+    monkeypatch.setenv("ROUTE_STAFF", "gemini:gemini-1.5-pro")
+    routed_ids = [cell["id"] for cell in plan_cells(spec)]
+    monkeypatch.setenv("ROUTE_STAFF", "gemini:gemini-1.5-flash")
+    other_ids = [cell["id"] for cell in plan_cells(spec)]
+
+    assert len(set(default_ids + routed_ids + other_ids)) == 6
+
+
+def test_comparison_lists_every_alias_label(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cells = plan_cells(_spec(tmp_path))
+    assert [(cell["persona"], cell["aliases"]) for cell in cells] == [("v1", ["v1_copy"]), ("v2", [])]
+
+    sessions = [
+        {"id": cells[0]["id"], "status": "ok", "evaluation": "- 話し方：★★★★☆ (5段階)", "time_to_first_turn_seconds": 1.0},
+        {"id": cells[1]["id"], "status": "failed"},
+    ]
+    rows = {row["persona"]: row for row in comparison_rows(cells, sessions)}
+    assert set(rows) == {"v1", "v1_copy", "v2"}
+    assert rows["v1_copy"]["scores"] == rows["v1"]["scores"] == {"話し方": 4.0}
+    assert (rows["v1_copy"]["completed"], rows["v1_copy"]["cells"]) == (1, 1)
+    assert (rows["v2"]["completed"], rows["v2"]["cells"]) == (0, 1)
+
+
+def test_cell_id_uses_resolved_model_names(tmp_path, monkeypatch):
+    import config
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("ANTHROPIC_STAFF_MODEL", raising=False)
+    spec = _spec(tmp_path)
+    default_ids = [cell["id"] for cell in plan_cells(spec)]
+
+    # デフォルトと同じモデル名を環境変数で指定しても同じセル
+    monkeypatch.setenv("ANTHROPIC_STAFF_MODEL", config.PROVIDERS["anthropic"]["staff_model"][1])
+    assert [cell["id"] for cell in plan_cells(spec)] == default_ids
+
+    # デフォルトのモデルが変われば別のセル（完了済みのセルを再利用しない）
+    monkeypatch.delenv("ANTHROPIC_STAFF_MODEL")
+    monkeypatch.setitem(config.PROVIDERS["anthropic"], "staff_model", ("ANTHROPIC_STAFF_MODEL", "claude-new"))
+    assert not set(cell["id"] for cell in plan_cells(spec)) & set(default_ids)
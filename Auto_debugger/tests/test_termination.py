@@ -0,0 +1,76 @@
+import asyncio
+
+from autogen_agentchat.messages import TextMessage
+
+from termination import (
+    ConversationLoopTermination, classify_stop_reason, is_farewell, jaccard, char_ngrams,
+    REASON_DONE, REASON_FAREWELL, REASON_LOOP, REASON_MAX_TURNS, REASON_OTHER, REASON_STALL,
+)
+
+
+def _run(condition, turns):
+    """発言 [(話者, 内容), ...] を1件ずつ渡し、最初に返った StopMessage の内容（なければ None）"""
+    async def run():
+        for source, text in turns:
+            stop = await condition([TextMessage(content=text, source=source)])
+            if stop is not None:
+                return stop.content
+        return None
+    return asyncio.run(run())
+
+
+def test_classify_stop_reason():
+    assert classify_stop_reason("Text 'DONE' mentioned") == REASON_DONE
+    # 同時に成立した場合は DONE を優先する
+    assert classify_stop_reason("loop: 2 consecutive repetitive turns, Text 'DONE' mentioned") == REASON_DONE
+    assert classify_stop_reason("farewell: both Customer and Staff said goodbye") == REASON_FAREWELL
+    assert classify_stop_reason("stall: 4 consecutive turns without new content (novelty 0.10)") == REASON_STALL
+    assert classify_stop_reason("Maximum number of turns 10 reached.") == REASON_MAX_TURNS
+    assert classify_stop_reason("") == REASON_OTHER
+    assert classify_stop_reason("something else") == REASON_OTHER
+
+
+def test_jaccard_of_char_ngrams():
+    assert jaccard(char_ngrams("価格を教えてください"), char_ngrams("価格を、教えてください。")) == 1.0
+    assert jaccard(char_ngrams("価格を教えてください"), char_ngrams("納期はいつですか")) == 0.0
+    assert jaccard(set(), char_ngrams("abc")) == 0.0
+
+
+def test_repeated_turns_stop_as_loop():
+    condition = ConversationLoopTermination(repeat_patience=2, stall_patience=100)
+    stop = _run(condition, [
+        ("Customer", "この商品の価格を教えていただけますか"),
+        ("Staff", "担当者に確認してから折り返しご連絡いたします"),
+        ("Customer", "この商品の価格を教えていただけますか？"),
+        ("Staff", "担当者に確認してから、折り返しご連絡いたします。"),
+    ])
+    assert classify_stop_reason(stop) == REASON_LOOP
+    assert condition.terminated
+
+
+def test_varied_turns_do_not_stop():
+    condition = ConversationLoopTermination()
+    stop = _run(condition, [
+        ("Customer", "ノートパソコンを探しています"),
+        ("Staff", "用途やご予算はお決まりでしょうか"),
+        ("Customer", "動画編集に使うので十五万円くらいまでです"),
+        ("Staff", "それでしたらメモリ三十二ギガのモデルがおすすめです"),
+    ])
+    assert stop is None
+
+
+def test_farewell_needs_both_parties_closing_their_turns():
+    assert not is_farewell("maybe later")
+    assert not is_farewell("ご説明ありがとうございました。では、納期について教えてください。")
+    assert is_farewell("本日はありがとうございました。DONE")
+
+    condition = ConversationLoopTermination()
+    assert _run(condition, [
+        ("Customer", "ご説明ありがとうございました。では、保証について教えてください。"),
+        ("Staff", "保証は一年間です。ご来店をお待ちしております。"),
+    ]) is None
+    stop = _run(condition, [
+        ("Customer", "よくわかりました。今日はこれで失礼します。"),
+        ("Staff", "ありがとうございました。またのご来店をお待ちしております。"),
+    ])
+    assert classify_stop_reason(stop) == REASON_FAREWELL
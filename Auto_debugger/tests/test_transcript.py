@@ -0,0 +1,50 @@
+import pytest
+
+from transcript import EVENT_SPEAKER, ConversationLog, TranscriptEntry, normalize_message
+
+
+def test_normalize_dict_messages():
+    assert normalize_message({"source": "Staff", "content": "承知しました"}) == ("Staff", "承知しました")
+    assert normalize_message({"role": "user", "content": "こんにちは"}) == ("User", "こんにちは")
+    # CLI からの入力は顧客の発言
+    assert normalize_message({"name": "User_CLI_Input", "content": "返品したい"}) == ("Customer", "返品したい")
+    assert normalize_message({"source": "Staff", "content": None})[0] == "Unknown"
+
+
+def test_normalize_autogen_messages():
+    messages = pytest.importorskip("autogen_agentchat.messages")
+    from autogen_core import FunctionCall
+
+    assert normalize_message(messages.TextMessage(source="Customer", content="返品したい")) == ("Customer", "返品したい")
+    # content が文字列でないチャットメッセージはテキスト表現
+    multi = messages.MultiModalMessage(source="Staff", content=["画像の説明", "続き"])
+    assert normalize_message(multi) == ("Staff", "画像の説明\n続き")
+    # イベントはエージェントの発言にしない（エージェント名は内容に残す）
+    thought = messages.ThoughtEvent(source="Staff", content="在庫を確認する")
+    assert normalize_message(thought) == (EVENT_SPEAKER, "Staff: 在庫を確認する")
+    call = messages.ToolCallRequestEvent(source="Customer", content=[FunctionCall(id="1", arguments="{}", name="lookup")])
+    speaker, content = normalize_message(call)
+    assert speaker == EVENT_SPEAKER and content.startswith("Customer: ") and "lookup" in content
+
+
+def test_stats_are_updated_per_entry():
+    log = ConversationLog()
+    assert log.stats.as_dict() == {}
+    log.append({"timestamp": "2024-01-01T00:00:00", "speaker": "System", "content": "シナリオ: 返品"})
+    log.append({"timestamp": "2024-01-01T00:00:02", "speaker": "Customer", "content": "返品したい", "latency_seconds": 2.0})
+    log.append(TranscriptEntry("2024-01-01T00:00:03", EVENT_SPEAKER, "Staff: 在庫を確認する"))
+    assert log.stats.agent_turns == 1
+    log.append({"timestamp": "2024-01-01T00:00:05", "speaker": "Staff", "content": "承知しました"})
+    log.append({"timestamp": "2024-01-01T00:00:09", "speaker": "Evaluator", "content": "★★★"})
+
+    stats = log.stats.as_dict()
+    assert stats["total_logged_entries"] == 5
+    assert (stats["customer_messages"], stats["staff_messages"], stats["actual_conversation_turns"]) == (1, 1, 2)
+    # System のシナリオ記録から最後の発言まで（評価結果は含めない）
+    assert stats["duration_seconds"] == 5.0
+    assert log.stats.agent_turns == 2
+    assert log.stats.messages == 2
+    assert log.stats.last_message.content == "承知しました"
+    # 評価エージェントへ渡すメッセージにもイベントは含めない
+    assert log.messages() == [{"source": "Customer", "content": "返品したい"}, {"source": "Staff", "content": "承知しました"}]
+    assert ConversationLog(log.to_dicts()).stats.as_dict() == stats
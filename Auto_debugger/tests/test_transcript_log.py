@@ -0,0 +1,67 @@
+import json
+
+from transcript_log import TranscriptWriter, iter_transcript, read_transcript, export_json, find_transcripts
+
+ENTRIES = [
+    {"speaker": "System", "content": "シナリオ: 返品の相談"},
+    {"speaker": "Customer", "content": "返品したいです\n（レシートあり）", "latency_seconds": 1.2},
+    {"speaker": "Staff", "content": "承知しました", "latency_seconds": 0.8},
+]
+
+
+def _write(path, entries=ENTRIES):
+    with TranscriptWriter(path) as writer:
+        for entry in entries:
+            writer.write(entry)
+
+
+def test_write_and_read_round_trip(tmp_path):
+    path = tmp_path / "chat_a.jsonl"
+    with TranscriptWriter(path, flush_every=2, fsync="close") as writer:
+        for entry in ENTRIES:
+            writer.write(entry)
+    assert read_transcript(path) == ENTRIES
+    # 1エントリ1行（改行を含む内容もエスケープされる）
+    assert len(path.read_text(encoding="utf-8").splitlines()) == len(ENTRIES)
+
+
+def test_truncated_last_line_is_skipped(tmp_path):
+    path = tmp_path / "chat_a.jsonl"
+    _write(path, ENTRIES[:2])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"speaker": "Staff", "content": "途中')
+    assert list(iter_transcript(path)) == ENTRIES[:2]
+
+
+def test_export_json_round_trip(tmp_path):
+    path = tmp_path / "chat_a.jsonl"
+    _write(path)
+    exported = export_json(path)
+    assert exported == tmp_path / "chat_a.json"
+    assert json.loads(exported.read_text(encoding="utf-8")) == ENTRIES
+    assert read_transcript(exported) == ENTRIES
+
+
+def test_find_transcripts_prefers_jsonl(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+    _write(tmp_path / "a" / "chat_a.jsonl")
+    export_json(tmp_path / "a" / "chat_a.jsonl")
+    (tmp_path / "b" / "chat_b.json").write_text(json.dumps(ENTRIES), encoding="utf-8")
+    # 同名の .json と .jsonl がある場合は .jsonl を使う
+    assert find_transcripts(tmp_path) == [tmp_path / "a" / "chat_a.jsonl", tmp_path / "b" / "chat_b.json"]
+
+
+def test_rewrite_and_reopen_keep_appending(tmp_path):
+    path = tmp_path / "chat_a.jsonl"
+    writer = TranscriptWriter(path)
+    for entry in ENTRIES:
+        writer.write(entry)
+    # チェックポイント以降の発言を取り除いてから続きを追記する
+    writer.rewrite(ENTRIES[:1])
+    writer.write(ENTRIES[2])
+    writer.close()
+    writer.reopen()
+    writer.write(ENTRIES[1])
+    writer.close()
+    assert read_transcript(path) == [ENTRIES[0], ENTRIES[2], ENTRIES[1]]
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+会話ログのエントリ型・メッセージの正規化・会話統計の逐次集計
+
+1つのプロセスで数万件の会話ログを保持・分析する場合に備え、エントリは dict ではなく
+__slots__ のクラス（TranscriptEntry）で持ち、発言者名は intern して共有する。
+ファイル（transcript_log）・結果データベース・チェックポイントとの受け渡しは従来どおり dict で行う
+（TranscriptEntry は entry["speaker"] / entry.get("route") のように dict と同じ読み方もできる）。
+
+- normalize_message: autogen のメッセージクラスごとに (発言者, 内容) を取り出す（functools.singledispatch）
+  イベント（BaseAgentEvent）はエージェントの発言ではないため、発言者を EVENT_SPEAKER にしてターンに数えない
+  autogen のメッセージクラスは最初の正規化で登録するため、会話ログの読み込み・分析だけなら autogen を import しない
+- ConversationLog: エントリ列と、エントリの追加ごとに更新する会話統計（TranscriptStats）
+"""
+
+import sys
+import logging
+from datetime import datetime
+from functools import singledispatch
+
+from transcript_log import iter_transcript
+
+# autogen のイベント（思考・ツール呼び出しなど）の発言者。発言者のエージェント名は内容の先頭に残す
+EVENT_SPEAKER = "Event"
+# 会話（評価対象のメッセージ）に含めない発言者（シナリオの記録・評価結果・イベント）
+NON_CONVERSATION_SPEAKERS = frozenset({"System", "Evaluator", EVENT_SPEAKER})
+# 会話時間の計算に使う発言者（小文字。System のシナリオ記録を開始点として含める）
+TIMED_SPEAKERS = frozenset({"customer", "staff", "user_cli_input", "user", "system"})
+AGENT_SPEAKERS = ("customer", "staff")
+# 発言者名の読み替え（CLI からの入力は顧客の発言として扱う）
+SPEAKER_ALIASES = {"User_CLI_Input": "Customer"}
+
+logger = logging.getLogger("ConversationTest.Transcript")
+
+
+class TranscriptEntry:
+    """会話ログの1エントリ（latency_seconds / route は記録がなければ None）"""
+
+    __slots__ = ("timestamp", "speaker", "content", "latency_seconds", "route")
+    FIELDS = __slots__
+
+    def __init__(self, timestamp: str, speaker: str, content: str, latency_seconds: float = None, route: str = None):
+        self.timestamp = timestamp
+        self.speaker = sys.intern(speaker)
+        self.content = content
+        self.latency_seconds = latency_seconds
+        self.route = route
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> "TranscriptEntry":
+        return cls(
+            entry.get("timestamp"),
+            entry.get("speaker", "Unknown"),
+            entry.get("content", ""),
+            entry.get("latency_seconds"),
+            entry.get("route"),
+        )
+
+    def to_dict(self) -> dict:
+        """会話ログ（JSONL）の1行と同じ dict（記録のない項目は含めない）"""
+        entry = {"timestamp": self.timestamp, "speaker": self.speaker, "content": self.content}
+        if self.latency_seconds is not None:
+            entry["latency_seconds"] = self.latency_seconds
+        if self.route is not None:
+            entry["route"] = self.route
+        return entry
+
+    def get(self, key: str, default=None):
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        return default if value is None else value
+
+    def __getitem__(self, key: str):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __repr__(self):
+        return f"TranscriptEntry({self.to_dict()!r})"
+
+
+class TranscriptStats:
+    """エントリの追加ごとに更新する会話統計（get_conversation_stats の集計を再走査なしで返す）"""
+
+    __slots__ = ("entries", "messages", "by_speaker", "first_timestamp", "last_timestamp", "last_message")
+
+    def __init__(self):
+        self.entries = 0
+        self.messages = 0
+        self.by_speaker = {}
+        self.first_timestamp = None
+        self.last_timestamp = None
+        self.last_message = None
+
+    def add(self, entry: TranscriptEntry):
+        self.entries += 1
+        speaker = entry.speaker.lower()
+        self.by_speaker[speaker] = self.by_speaker.get(speaker, 0) + 1
+        if entry.speaker not in NON_CONVERSATION_SPEAKERS:
+            self.messages += 1
+            self.last_message = entry
+        if speaker in TIMED_SPEAKERS:
+            if self.first_timestamp is None:
+                self.first_timestamp = entry.timestamp
+            self.last_timestamp = entry.timestamp
+
+    @property
+    def agent_turns(self) -> int:
+        return sum(self.by_speaker.get(speaker, 0) for speaker in AGENT_SPEAKERS)
+
+    def as_dict(self) -> dict:
+        if not self.entries:
+            return {}
+        customer_msgs = self.by_speaker.get("customer", 0)
+        staff_msgs = self.by_speaker.get("staff", 0)
+        stats = {
+            "total_logged_entries": self.entries,
+            "customer_messages": customer_msgs,
+            "staff_messages": staff_msgs,
+            "actual_conversation_turns": customer_msgs + staff_msgs,
+            "duration_seconds": None,
+            "duration_formatted": "N/A",
+        }
+        if self.first_timestamp is not None:
+            try:
+                duration_delta = datetime.fromisoformat(self.last_timestamp) - datetime.fromisoformat(self.first_timestamp)
+                stats["duration_seconds"] = duration_delta.total_seconds()
+                stats["duration_formatted"] = str(duration_delta)
+            except (TypeError, ValueError) as e:
+                logger.warning(f"Could not parse timestamps for duration calculation: {e}")
+        return stats
+
+
+class ConversationLog:
+    """会話ログのエントリ列（TranscriptEntry）と逐次更新の統計"""
+
+    __slots__ = ("entries", "stats")
+
+    def __init__(self, entries=()):
+        self.entries = []
+        self.stats = TranscriptStats()
+        for entry in entries:
+            self.append(entry)
+
+    @classmethod
+    def load(cls, path) -> "ConversationLog":
+        """会話ログファイル（JSONL / 従来の JSON）から読み込む"""
+        return cls(iter_transcript(path))
+
+    def append(self, entry) -> TranscriptEntry:
+        if not isinstance(entry, TranscriptEntry):
+            entry = TranscriptEntry.from_dict(entry)
+        self.entries.append(entry)
+        self.stats.add(entry)
+        return entry
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def to_dicts(self) -> list:
+        return [entry.to_dict() for entry in self.entries]
+
+    def turns(self):
+        """会話のメッセージを (発言者, 内容) で順に返す（System / Evaluator / イベントを除く）"""
+        return ((e.speaker, e.content) for e in self.entries if e.speaker not in NON_CONVERSATION_SPEAKERS)
+
+    def messages(self) -> list:
+        """評価エージェントへ渡す形式のメッセージ [{"source": 発言者, "content": 内容}, ...]"""
+        return [{"source": speaker, "content": content} for speaker, content in self.turns()]
+
+
+_autogen_registered = False
+
+
+@singledispatch
+def _speaker_and_content(msg_obj) -> tuple:
+    """その他のオブジェクト（autogen_core の LLMMessage など）: name / source / role / sender.name の順に発言者を探す"""
+    if _register_autogen_messages():
+        # autogen のメッセージクラスを登録した直後は、登録した関数へ振り分け直す
+        return _speaker_and_content(msg_obj)
+    content = getattr(msg_obj, "content", None)
+    if not isinstance(content, str):
+        logger.warning(f"Message object has no 'content' or is not a string: {msg_obj}")
+        content = str(msg_obj)
+    speaker = getattr(msg_obj, "name", None) or getattr(msg_obj, "source", None)
+    if not speaker and getattr(msg_obj, "role", None):
+        speaker = msg_obj.role.capitalize()
+    if not speaker:
+        speaker = getattr(getattr(msg_obj, "sender", None), "name", None) or "Unknown"
+    return speaker, content
+
+
+@_speaker_and_content.register
+def _(msg_obj: dict) -> tuple:
+    content = msg_obj.get("content")
+    if not isinstance(content, str):
+        logger.warning(f"Message dict has no 'content' or is not a string: {msg_obj}")
+        return "Unknown", str(msg_obj)
+    role = msg_obj.get("role")
+    return msg_obj.get("name") or msg_obj.get("source") or (role.capitalize() if role else "Unknown"), content
+
+
+def _text_message(msg_obj) -> tuple:
+    return msg_obj.source, msg_obj.content
+
+
+def _to_text_message(msg_obj) -> tuple:
+    # 画像を含むメッセージなど、content が文字列でないメッセージはテキスト表現を使う
+    return msg_obj.source, msg_obj.to_text()
+
+
+def _event_message(msg_obj) -> tuple:
+    # 思考やツール呼び出しのイベントは会話のターンではないため、発言者を分けて記録する
+    return EVENT_SPEAKER, f"{msg_obj.source}: {msg_obj.to_text()}"
+
+
+def _register_autogen_messages() -> bool:
+    """autogen のメッセージクラスを登録する（登録済み、または autogen がなければ False）"""
+    global _autogen_registered
+    if _autogen_registered:
+        return False
+    _autogen_registered = True
+    try:
+        from autogen_agentchat.messages import BaseAgentEvent, BaseChatMessage, BaseTextChatMessage
+    except ImportError:
+        return False
+    _speaker_and_content.register(BaseTextChatMessage, _text_message)
+    _speaker_and_content.register(BaseChatMessage, _to_text_message)
+    _speaker_and_content.register(BaseAgentEvent, _event_message)
+    return True
+
+
+def normalize_message(msg_obj) -> tuple:
+    """autogen のメッセージ（または dict）から (発言者, 内容) を取り出す"""
+    speaker, content = _speaker_and_content(msg_obj)
+    return SPEAKER_ALIASES.get(speaker, speaker), content
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+会話ログ（トランスクリプト）の追記型 JSONL 書き込み・読み込み
+
+1メッセージ = 1行の JSON として追記するため、メッセージ数に関わらず
+1回の書き込みコストは一定。従来の chat_<ts>.json（エントリのリスト）形式は
+read_transcript / export_json で再構成できる。
+
+使い方（従来形式への変換）:
+    python transcript_log.py logs/chat_20250603_032210.jsonl [出力先.json]
+"""
+
+import os
+import sys
+import json
+import time
+from pathlib import Path
+
+FSYNC_POLICIES = ("none", "close", "always", "interval")
+
+
+class TranscriptWriter:
+    """追記専用のトランスクリプトライター
+
+    flush_every: 何エントリごとに OS へフラッシュするか（1 = 毎回）
+    fsync: ディスク同期のポリシー
+        - "none": fsync しない（OS に任せる）
+        - "close": クローズ時のみ fsync
+        - "always": フラッシュのたびに fsync
+        - "interval": fsync_interval 秒以上経過したフラッシュ時に fsync
+    """
+
+    def __init__(self, path, flush_every: int = 1, fsync: str = "none", fsync_interval: float = 5.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unsupported fsync policy: {fsync}. Choose one of {', '.join(FSYNC_POLICIES)}.")
+        self.path = Path(path)
+        self.flush_every = max(1, int(flush_every))
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._pending = 0
+        self._last_fsync = time.monotonic()
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    @classmethod
+    def from_env(cls, path):
+        """環境変数 TRANSCRIPT_FLUSH_EVERY / TRANSCRIPT_FSYNC / TRANSCRIPT_FSYNC_INTERVAL から生成"""
+        return cls(
+            path,
+            flush_every=int(os.getenv('TRANSCRIPT_FLUSH_EVERY', '1')),
+            fsync=os.getenv('TRANSCRIPT_FSYNC', 'none').lower(),
+            fsync_interval=float(os.getenv('TRANSCRIPT_FSYNC_INTERVAL', '5.0')),
+        )
+
+    @property
+    def closed(self) -> bool:
+        return self._file.closed
+
+    def reopen(self):
+        """クローズ済みであれば追記モードで開き直す"""
+        if self.closed:
+            self._pending = 0
+            self._file = open(self.path, 'a', encoding='utf-8')
+
+    def rewrite(self, entries: list):
+        """ファイルを entries の内容で書き直す（チェックポイントからの再開時に、保存時点以降の発言を取り除く）"""
+        self.close()
+        with open(self.path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.reopen()
+
+    def write(self, entry: dict):
+        """1エントリを1行として追記"""
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """バッファを書き出し、ポリシーに応じて fsync"""
+        if self.closed:
+            return
+        self._file.flush()
+        self._pending = 0
+        if self.fsync == "always":
+            os.fsync(self._file.fileno())
+        elif self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def close(self):
+        if self.closed:
+            return
+        self._file.flush()
+        if self.fsync != "none":
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_transcript(path):
+    """トランスクリプトのエントリを順に返す（JSONL / 従来の JSON 両対応）
+
+    JSONL の末尾がクラッシュ等で途中までしか書かれていない場合、その行は読み飛ばす。
+    """
+    path = Path(path)
+    if path.suffix == ".json":
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from json.load(f)
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def read_transcript(path) -> list:
+    """トランスクリプトを従来の chat_<ts>.json と同じエントリのリストとして読み込む"""
+    return list(iter_transcript(path))
+
+
+def find_transcripts(logs_dir, exclude_dirs=()) -> list:
+    """logs_dir 以下の会話ログを列挙（同名の .jsonl と .json がある場合は .jsonl を優先）"""
+    logs_dir = Path(logs_dir)
+    excluded = [logs_dir / name for name in exclude_dirs]
+    transcripts = {}
+    for path in sorted(logs_dir.rglob("chat_*.json*")):
+        if path.suffix not in (".json", ".jsonl") or any(d in path.parents for d in excluded):
+            continue
+        key = path.with_suffix("")
+        if key not in transcripts or path.suffix == ".jsonl":
+            transcripts[key] = path
+    return sorted(transcripts.values())
+
+
+def export_json(path, output_path=None) -> Path:
+    """JSONL トランスクリプトを従来の JSON 形式（indent=2 のリスト）で書き出す"""
+    path = Path(path)
+    output_path = Path(output_path) if output_path else path.with_suffix(".json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(read_transcript(path), f, ensure_ascii=False, indent=2)
+    return output_path
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("使い方: python transcript_log.py <chat_xxx.jsonl> [出力先.json]")
+        sys.exit(1)
+    print(f"💾 変換しました: {export_json(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)}")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+複数プロセスでのバッチ実行（ワーカーモード）
+
+1プロセスの asyncio ループでは JSON のシリアライズ・ログ出力・メッセージの正規化が1コアに収まるため、
+大きなバッチではジョブキュー（job_queue.JobQueue）を介して複数のワーカープロセスに会話を分散する。
+
+- run_workers: シナリオをキューに登録し、ワーカープロセスを起動して完了を待ち、summary.json を書き出す
+- run_worker: キューからジョブを取得して会話を実行し、結果をキューに書き戻す（別マシンからも参加できる）
+
+ワーカーはジョブのリースをハートビートで延長し、停止したワーカーのジョブはリース切れ後に
+他のワーカーが引き継ぐ（会話はチェックポイントから再開される）。キューの操作は SQLite のロック待ちで
+実行中の会話を止めないよう、asyncio.to_thread で別スレッドから行う。
+各セッションの結果は結果データベース（RESULTS_DB）にも記録される。
+
+環境変数:
+- WORKER_LEASE_SECONDS（デフォルト: 120）: ハートビートが途絶えてからジョブを再投入するまでの秒数
+- WORKER_HEARTBEAT_SECONDS（デフォルト: リースの1/4）
+- WORKER_MAX_ATTEMPTS（デフォルト: 3）: 1ジョブあたりの最大試行回数
+"""
+
+import os
+import time
+import socket
+import asyncio
+import logging
+import multiprocessing
+from pathlib import Path
+from datetime import datetime
+
+from batch_runner import _run_session, default_output_dir, add_batch_log_handler, write_batch_summary
+from log_config import remove_log_handler
+from job_queue import JobQueue
+from metrics import MetricsRecorder
+from transcript_log import iter_transcript
+from client_pool import shared_pool
+
+QUEUE_FILENAME = "queue.db"
+
+logger = logging.getLogger("ConversationTest.Worker")
+
+
+def _lease_seconds() -> float:
+    return float(os.getenv('WORKER_LEASE_SECONDS', '120'))
+
+
+def _heartbeat_seconds(lease_seconds: float) -> float:
+    return float(os.getenv('WORKER_HEARTBEAT_SECONDS', str(lease_seconds / 4)))
+
+
+def _open_queue(queue_path) -> JobQueue:
+    return JobQueue(queue_path, max_attempts=int(os.getenv('WORKER_MAX_ATTEMPTS', '3')))
+
+
+async def _heartbeat_loop(queue: JobQueue, worker_id: str, running: dict, lease_seconds: float):
+    """実行中のジョブのリースを定期的に延長し、リースを失ったジョブは中断する"""
+    interval = _heartbeat_seconds(lease_seconds)
+    while True:
+        await asyncio.sleep(interval)
+        for job_id, task in list(running.items()):
+            if not await asyncio.to_thread(queue.heartbeat, job_id, worker_id, lease_seconds):
+                logger.warning(f"Lease lost for job {job_id}, cancelling")
+                task.cancel()
+
+
+async def _run_job(queue: JobQueue, worker_id: str, job: dict, output_dir: Path, max_turns: int,
+                   semaphore: asyncio.Semaphore):
+    summary = await _run_session(job["payload"], output_dir, max_turns, semaphore)
+    summary["worker_id"] = worker_id
+    if summary["status"] in ("ok", "skipped"):
+        await asyncio.to_thread(queue.complete, job["id"], worker_id, summary)
+    else:
+        status = await asyncio.to_thread(queue.fail, job["id"], worker_id, summary.get("error") or "failed", summary)
+        logger.warning(f"Job {job['id']} failed (attempt {job['attempt']}), now {status}: {summary.get('error')}")
+
+
+async def run_worker(queue_path, concurrency: int = 4, worker_id: str = None, poll_interval: float = 2.0) -> int:
+    """キューが空になる（待ち・実行中のジョブがなくなる）までジョブを実行し、処理した件数を返す"""
+    queue_path = Path(queue_path)
+    output_dir = queue_path.parent
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    lease_seconds = _lease_seconds()
+    queue = _open_queue(queue_path)
+    max_turns = queue.meta().get("max_turns", 100)
+
+    log_handler = add_batch_log_handler(output_dir / f"worker_{worker_id}.log")
+    logger.info(f"Worker {worker_id} started (concurrency={concurrency}, lease={lease_seconds}s)")
+
+    semaphore = asyncio.Semaphore(concurrency)
+    running = {}
+    processed = 0
+    heartbeat = asyncio.create_task(_heartbeat_loop(queue, worker_id, running, lease_seconds))
+    try:
+        while True:
+            while len(running) < concurrency:
+                job = await asyncio.to_thread(queue.claim, worker_id, lease_seconds)
+                if job is None:
+                    break
+                logger.info(f"Claimed job {job['id']} (attempt {job['attempt']})")
+                running[job["id"]] = asyncio.create_task(
+                    _run_job(queue, worker_id, job, output_dir, max_turns, semaphore)
+                )
+
+            if not running:
+                if await asyncio.to_thread(queue.is_drained):
+                    break
+                # 他のワーカーが実行中: リース切れで再投入される可能性があるため待つ
+                await asyncio.sleep(poll_interval)
+                continue
+
+            done, _ = await asyncio.wait(running.values(), timeout=poll_interval, return_when=asyncio.FIRST_COMPLETED)
+            for job_id, task in list(running.items()):
+                if task in done:
+                    del running[job_id]
+                    processed += 1
+                    if not task.cancelled() and task.exception():
+                        logger.error(f"Job {job_id} raised: {task.exception()}")
+    finally:
+        heartbeat.cancel()
+        logger.info(f"Worker {worker_id} finished ({processed} jobs)")
+        remove_log_handler(log_handler)
+        queue.close()
+    return processed
+
+
+async def _worker_entry(queue_path: str, concurrency: int, worker_id: str):
+    try:
+        await run_worker(queue_path, concurrency=concurrency, worker_id=worker_id)
+    finally:
+        await shared_pool.close_all()
+
+
+def worker_process_main(queue_path: str, concurrency: int, worker_id: str = None):
+    """ワーカープロセスのエントリーポイント"""
+    asyncio.run(_worker_entry(queue_path, concurrency, worker_id))
+
+
+def _collect_metrics(output_dir: Path) -> MetricsRecorder:
+    """各セッションの metrics_*.jsonl を集計（ワーカープロセスの集計はこのプロセスにないため）"""
+    recorder = MetricsRecorder(session_id="batch")
+    for path in sorted(output_dir.rglob("metrics_*.jsonl")):
+        for entry in iter_transcript(path):
+            recorder.record(entry)
+    return recorder
+
+
+async def run_workers(scenarios: list, workers: int = 2, concurrency: int = 4, max_turns: int = 100,
+                      output_dir=None) -> dict:
+    """シナリオをキューに登録し、workers 個のプロセスで実行して結果サマリーを返す"""
+    if workers < 1 or concurrency < 1:
+        raise ValueError("workers と concurrency は1以上を指定してください。")
+
+    output_dir = Path(output_dir or default_output_dir())
+    output_dir.mkdir(parents=True, exist_ok=True)
+    queue_path = output_dir / QUEUE_FILENAME
+
+    with _open_queue(queue_path) as queue:
+        queue.set_meta(max_turns=max_turns)
+        added = queue.enqueue(scenarios)
+
+    print(f"🚀 ワーカー実行開始: {len(scenarios)}件 (新規登録: {added}件, ワーカー: {workers} × 同時実行数: {concurrency})")
+    print(f"💾 出力先: {output_dir}")
+    print(f"📮 キュー: {queue_path} (他のマシンからは --worker {queue_path} で参加できます)")
+
+    started_at = datetime.now().isoformat()
+    started = time.monotonic()
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=worker_process_main, args=(str(queue_path), concurrency))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    with _open_queue(queue_path) as queue:
+        last_counts = None
+        while any(process.is_alive() for process in processes):
+            await asyncio.sleep(2.0)
+            counts = queue.counts()
+            if counts != last_counts:
+                print(f"⏳ 待ち: {counts['queued']} / 実行中: {counts['running']} / 完了: {counts['done']} / 失敗: {counts['failed']}")
+                last_counts = counts
+        for process in processes:
+            process.join()
+            if process.exitcode:
+                print(f"⚠️  ワーカープロセス (pid={process.pid}) が終了コード {process.exitcode} で終了しました")
+        sessions = queue.results()
+
+    return write_batch_summary(
+        output_dir, sessions, concurrency, started_at, time.monotonic() - started,
+        metrics=_collect_metrics(output_dir), workers=workers,
+    )